@@ -1,156 +1,118 @@
 # Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
 import argparse
 import logging
-import sys
-import tkinter as tk
-from tkinter import filedialog
-
-import pygame
-import pygame_menu
 
 from src import __version__
-from src.hex_keyboard import HexKeyboard
-from src.instruction_interpreter import InstructionInterpreter
 from src.log import logger
-from src.screen import Screen
-from src.sound import Sound
+from src.startup import startup
+
+
+def seed(text: str) -> int:
+    """A seed of Cxkk, recordings store it as 32 bits."""
+    value = int(text)
+    if not 0 <= value < 2 ** 32:
+        raise argparse.ArgumentTypeError(f"seed must be from 0 to {2 ** 32 - 1}, got {value}")
+    return value
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--debug", action="store_true",
                         help="Set log severity to debug.")
+    parser.add_argument("rom_file", nargs="?", default="", metavar="ROM",
+                        help="ROM file to load at start, same as --rom.")
+    parser.add_argument("--rom", default="",
+                        help="ROM file to load at start.")
+    parser.add_argument("--rom-dir", action="append", default=[],
+                        help="Directory of ROMs to list in the menu besides roms/, "
+                             "can be given more than once.")
+    parser.add_argument("--cpu-rate", type=float, default=600.0,
+                        help="Instructions per second, any positive value.")
+    parser.add_argument("--turbo", action="store_true",
+                        help="Start in turbo mode, running as fast as possible. "
+                             "Toggle with TAB while running.")
+    parser.add_argument("--profile", nargs="?", const="profile.json", default="",
+                        help="Count executions and host time per opcode, printed "
+                             "on exit or F10 and written to this JSON file "
+                             "(profile.json by default).")
+    parser.add_argument("--guest-profile", nargs="?", const="guest_profile", default="",
+                        help="Count executions per ROM address and subroutine, reported "
+                             "on exit or F10 as PREFIX.asm, PREFIX.folded and "
+                             "PREFIX.calls (guest_profile by default).")
+    parser.add_argument("--state", default="",
+                        help="Save state file to resume at start.")
+    parser.add_argument("--rewind-seconds", type=float, default=10.0,
+                        help="Seconds of history kept for rewinding, 0 to disable.")
+    parser.add_argument("--scale", type=int, default=20,
+                        help="Size in window pixels of each CHIP-8 pixel, the "
+                             "window can also be resized while running.")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without a window, requires --rom. Prints the "
+                             "display, registers and timing when done.")
+    parser.add_argument("--debugger", action="store_true",
+                        help="Run --rom headless in an interactive debugger with "
+                             "breakpoints, watchpoints and stepping.")
+    parser.add_argument("--cycles", type=int,
+                        help="Number of instructions to run headless, 600 or "
+                             "the length of the replay by default.")
+    parser.add_argument("--seed", type=seed,
+                        help="Seed of the random numbers of Cxkk.")
+    parser.add_argument("--wrap-memory", action="store_true",
+                        help="Wrap memory accesses past FFF around to 000, as some "
+                             "interpreters do, instead of stopping with an error.")
+    parser.add_argument("--record", default="",
+                        help="Record the keypad input of the session to this file, "
+                             "requires --rom.")
+    parser.add_argument("--replay", default="",
+                        help="Replay a recorded session of --rom, headless or in a window.")
+
+    parser.add_argument("--mute", action="store_true",
+                        help="Start with the sound muted, the mixer is not initialised "
+                             "until the volume is turned up.")
+    parser.add_argument("--exit-after-frames", type=int, default=0,
+                        help="Quit after presenting this many frames, e.g. to "
+                             "measure the time to the first frame.")
 
     args = parser.parse_args()
+    if args.rom_file != "":
+        if args.rom != "" and args.rom != args.rom_file:
+            parser.error("give the ROM either as an argument or with --rom")
+        args.rom = args.rom_file
+    if args.cpu_rate <= 0:
+        parser.error("--cpu-rate must be positive")
+    if (args.record != "" or args.replay != "") and args.rom == "":
+        parser.error("--record and --replay require --rom")
+    if args.record != "" and (args.replay != "" or args.headless):
+        parser.error("--record can not be combined with --replay or --headless")
+    if args.state != "" and (args.record != "" or args.replay != ""):
+        parser.error("--state can not be combined with --record or --replay, they run from the start of the ROM")
     if args.debug:
         logger.setLevel(logging.DEBUG)
 
     logger.info(f"--- kanzchip-8, chip-8 emulator version {__version__} ---")
-
-    title = ""
-    ticks_per_frame = 10
-
-    def reset_rom() -> None:
-        screen.clear_all()
-        ii.reset()
-
-    def open_rom_file(filename: str = "") -> None:
-        if filename == "":
-            root = tk.Tk()
-            root.withdraw()
-            rom: str = filedialog.askopenfilename(
-                initialdir="roms",
-                filetypes=(("ROM", "*.ch8"), ("All files", "*"),)
-            )
-            root.destroy()
-        else:
-            rom = filename
-
-        if rom == "":
-            logger.info("No rom selected!")
-            return
-        ii.load_rom(rom)
-        nonlocal title
-        title = rom.split("/")[-1].removesuffix(".ch8")
-        logger.info(f"Loaded ROM-file {rom}")
-        reset_rom()
-
-    def set_cpu_rate(selected_value: str, cpu_rate: int) -> None:
-        nonlocal ticks_per_frame
-        ticks_per_frame = cpu_rate // 60
-        logger.debug(f"Selected option: {selected_value}, CPU rate: {cpu_rate} Hz, "
-                     f"ticks per frame: {ticks_per_frame}")
-
-    def set_volume(_: str, volume: float) -> None:
-        sound.volume = volume
-
-    def set_shift_quirks(selected_value: str, setting: bool) -> None:
-        ii.shift_quirks = setting
-        logger.debug(f"Selected shift_quirks: {selected_value}, {setting}")
-
-    screen = Screen()
-    keyboard = HexKeyboard()
-    sound = Sound()
-
-    ii = InstructionInterpreter(screen, keyboard)
-
-    theme = pygame_menu.themes.Theme(background_color=(70, 30, 20),
-                                     title_background_color=(50, 30, 20),
-                                     widget_font=pygame_menu.font.FONT_DIGITAL,
-                                     title_font_size=1,
-                                     widget_font_size=14)
-    menu = pygame_menu.Menu(height=screen.MENU_HEIGHT, width=screen.DISPLAY.get_width(),
-                            title='',
-                            theme=theme,
-                            joystick_enabled=False,
-                            keyboard_enabled=False,
-                            position=(0, 0),
-                            columns=6,
-                            column_min_width=(100, 100, 100, 100, 100, 100),
-                            rows=1,
-                            mouse_motion_selection=True
-                            )
-    menu.add.button('Reset ROM', reset_rom, align=pygame_menu.locals.ALIGN_CENTER)
-    menu.add.button('Load ROM', open_rom_file, align=pygame_menu.locals.ALIGN_CENTER)
-    menu.add.selector('CPU Rate :', [(' 600Hz', 600),
-                                     (' 900hz', 900),
-                                     ('1200Hz', 1200),
-                                     ('6000Hz', 6000)],
-                      onchange=set_cpu_rate, align=pygame_menu.locals.ALIGN_CENTER)
-    menu.add.selector('Sound Volume :', [('Mute', 0.0),
-                                         (' 25%', 0.25),
-                                         (' 50%', 0.5),
-                                         (' 75%', 0.75),
-                                         ('100%', 1.0)],
-                      onchange=set_volume, default=4,
-                      align=pygame_menu.locals.ALIGN_CENTER)
-    menu.add.selector('Shift Quirks :', [('Off', False),
-                                         (' On', True)],
-                      onchange=set_shift_quirks, default=0,
-                      align=pygame_menu.locals.ALIGN_CENTER)
-
-    logger.info("Running main loop")
-    clock = pygame.time.Clock()
-    while True:
-        clock.tick(60)  # run at 60 fps
-
-        events = pygame.event.get()
-        for event in events:
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                screen.paused = not screen.paused
-
-        if menu.is_enabled():
-            menu.draw(screen.DISPLAY)
-            menu.update(events)
-
-        if screen.paused or not ii.rom_loaded:
-            caption = "Load a rom" if not ii.rom_loaded else "PAUSED"
-            pygame.display.set_caption(f"{title}     {caption}")
-            screen.spin()
-            continue
-
-        # Timer and sound registers shall decrement if not 0 at a rate of 60 Hz
-        if ii.reg_delay > 0:
-            ii.reg_delay -= 1
-        if ii.reg_sound > 0:
-            sound.buzzer_on()
-            ii.reg_sound -= 1
-            if ii.reg_sound == 0:
-                sound.buzzer_off()
-
-        # Run 10 instructions per frame to simulate 600hz
-        # Most CHIP-8 interpreters ran at about 500-1000hz,
-        # Could make this configurable
-        for _ in range(ticks_per_frame):
-            instruction = ii.next_instruction()
-            ii.interpret_instruction(instruction)
-
-        fps = format(clock.get_fps(), ".1f")
-        pygame.display.set_caption(f"{title}     FPS: {fps}")
-        screen.spin()
+    startup.mark("arguments")
+
+    if args.debugger:
+        if args.rom == "":
+            parser.error("--debugger requires --rom")
+        from src.debugger import run_debugger
+        run_debugger(args.rom, args.cpu_rate, args.seed, args.wrap_memory)
+    elif args.headless:
+        if args.rom == "":
+            parser.error("--headless requires --rom")
+        # Imported here so that headless runs never import pygame
+        from src.headless import run_headless
+        run_headless(args.rom, args.cycles, args.cpu_rate, args.profile,
+                     args.guest_profile, args.seed, args.replay, args.wrap_memory)
+    else:
+        from src.window import run_window
+        startup.mark("import pygame")
+        run_window(rom_file=args.rom, pixel_size=args.scale, state_file=args.state,
+                   rewind_seconds=args.rewind_seconds, cpu_rate=args.cpu_rate, turbo=args.turbo,
+                   profile=args.profile, guest_profile=args.guest_profile, seed=args.seed,
+                   record=args.record, replay=args.replay, rom_dirs=args.rom_dir,
+                   exit_after_frames=args.exit_after_frames, mute=args.mute,
+                   wrap_memory=args.wrap_memory)
 
 
 if __name__ == "__main__":
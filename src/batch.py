@@ -0,0 +1,156 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Batch ROM runner
+
+Runs many ROMs headless in a process pool and reports the state each one
+ended up in. With --golden the results are compared against a stored file,
+which makes checking the test ROMs a regression test:
+
+    python -m src.batch roms/test_opcode.ch8 roms/BC_test.ch8 --golden roms/golden.json
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from src.headless import HeadlessRunner
+from src.log import logger
+from src.rom_library import ROM_SUFFIXES
+
+# Parts of a result that have to match the golden file
+COMPARED = ("framebuffer", "program_counter", "reg_v", "reg_i")
+
+RomResult = dict[str, object]
+
+
+def find_roms(paths: list[str]) -> list[Path]:
+    roms: list[Path] = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            roms.extend(sorted(rom for rom in path.iterdir()
+                               if rom.suffix.lower() in ROM_SUFFIXES and rom.is_file()))
+        else:
+            roms.append(path)
+    return roms
+
+
+def run_rom(rom: str, frames: int, cpu_rate: float) -> RomResult:
+    """Run one ROM headless, this is what each worker process does."""
+    logger.setLevel(logging.WARNING)
+    start = time.perf_counter()
+    try:
+        # Cxkk is seeded so that runs can be compared
+        runner = HeadlessRunner(cpu_rate, seed=0)
+        runner.load_rom(rom)
+        runner.run(round(frames * cpu_rate / 60))
+    except Exception as e:
+        return {"rom": rom, "error": f"{type(e).__name__}: {e}"}
+
+    ii = runner.ii
+    return {
+        "rom": rom,
+        "framebuffer": hashlib.sha1(runner.screen.to_bytes()).hexdigest(),
+        "program_counter": ii.program_counter,
+        "reg_v": list(ii.reg_v),
+        "reg_i": ii.reg_i,
+        "instructions": runner.cycles,
+        "wall_time": time.perf_counter() - start,
+    }
+
+
+def run_batch(roms: list[Path], frames: int, cpu_rate: float,
+              jobs: Optional[int] = None) -> list[RomResult]:
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_rom, str(rom), frames, cpu_rate) for rom in roms]
+        return [future.result() for future in futures]
+
+
+def golden_key(rom: str) -> str:
+    return Path(rom).name
+
+
+def check_golden(results: list[RomResult], golden: dict[str, dict[str, object]]) -> list[str]:
+    """Set the status of each result, returns the ROMs that do not match."""
+    failed = []
+    for result in results:
+        expected = golden.get(golden_key(str(result["rom"])))
+        if "error" in result:
+            result["status"] = "ERROR"
+        elif expected is None:
+            result["status"] = "new"
+            continue
+        elif all(result[key] == expected.get(key) for key in COMPARED):
+            result["status"] = "ok"
+            continue
+        else:
+            result["status"] = "MISMATCH"
+        failed.append(str(result["rom"]))
+    return failed
+
+
+def format_report(results: list[RomResult]) -> str:
+    lines = [f"{'rom':<36} {'status':<9} {'framebuffer':<14} {'PC':>4} "
+             f"{'instructions':>12} {'time':>8}"]
+    for result in results:
+        name = golden_key(str(result["rom"]))
+        status = str(result.get("status", ""))
+        if "error" in result:
+            lines.append(f"{name:<36} {status:<9} {result['error']}")
+            continue
+        lines.append(f"{name:<36} {status:<9} {str(result['framebuffer'])[:12]:<14} "
+                     f"{result['program_counter']:>4X} {result['instructions']:>12} "
+                     f"{result['wall_time']:>7.3f}s")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.batch",
+                                     description="Run ROMs headless in parallel.")
+    parser.add_argument("roms", nargs="+", help="ROM files or directories of ROMs (.ch8, .c8, .sc8 and .xo8 files).")
+    parser.add_argument("--frames", type=int, default=600,
+                        help="Frames to run each ROM for.")
+    parser.add_argument("--cpu-rate", type=float, default=600.0,
+                        help="Instructions per second of emulated time.")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes.")
+    parser.add_argument("--golden", help="JSON file with the expected results.")
+    parser.add_argument("--update-golden", action="store_true",
+                        help="Write the results to the golden file instead of comparing.")
+    parser.add_argument("-o", "--output", help="Write all results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    roms = find_roms(args.roms)
+    start = time.perf_counter()
+    results = run_batch(roms, args.frames, args.cpu_rate, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    failed: list[str] = []
+    if args.golden and args.update_golden:
+        golden_path = Path(args.golden)
+        golden = json.loads(golden_path.read_text()) if golden_path.exists() else {}
+        for result in results:
+            if "error" not in result:
+                golden[golden_key(str(result["rom"]))] = {key: result[key] for key in COMPARED}
+        golden_path.write_text(json.dumps(golden, indent=2, sort_keys=True) + "\n")
+        logger.info(f"Updated {args.golden}")
+    elif args.golden:
+        failed = check_golden(results, json.loads(Path(args.golden).read_text()))
+
+    print(format_report(results))
+    print(f"{len(results)} ROM(s) in {elapsed:.2f} s, {len(failed)} failed")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    errors = [result for result in results if "error" in result]
+    return 1 if failed or errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Benchmarks for the interpreter, draw and render throughput, and startup time
+
+Run with `python -m src.bench`. Results are printed as a table and can be
+saved as JSON with --output, --compare checks them against a saved baseline
+and exits with status 1 if any case got slower than the threshold.
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional, TypedDict
+
+from src import __version__
+from src.headless import HeadlessRunner
+from src.log import logger
+
+ROM_DIR = Path("roms")
+
+# Representative opcode of each family, run through interpret_instruction
+OPCODES = {
+    "00E0": 0x00E0,
+    "1nnn": 0x1200,
+    "3xkk": 0x3A12,
+    "5xy0": 0x5AB0,
+    "6xkk": 0x6A12,
+    "7xkk": 0x7A01,
+    "8xy0": 0x8AB0,
+    "8xy4": 0x8AB4,
+    "8xy5": 0x8AB5,
+    "8xy6": 0x8AB6,
+    "Annn": 0xA123,
+    "Cxkk": 0xCA0F,
+    "Ex9E": 0xEA9E,
+    "Fx07": 0xFA07,
+    "Fx1E": 0xFA1E,
+    "Fx29": 0xFA29,
+    "Fx33": 0xFA33,
+    "Fx55": 0xFF55,
+    "Fx65": 0xFF65,
+}
+
+# Unit of each kind of result, and whether a higher value is better
+UNITS = {
+    "instructions/s": True,
+    "ns/op": False,
+    "ms/frame": False,
+    "ms": False,
+}
+
+
+class Measurement(TypedDict):
+    value: float
+    unit: str
+
+
+class Result(Measurement, total=False):
+    change: float  # Relative to the baseline, set by compare
+
+
+Results = dict[str, Result]
+
+
+def result(value: float, unit: str) -> Result:
+    return {"value": value, "unit": unit}
+
+
+def best_time(function: Callable[[], None], repeat: int) -> float:
+    """Shortest wall time of running function, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_roms(cycles: int, repeat: int) -> Results:
+    results: Results = {}
+    for rom in sorted(ROM_DIR.glob("*.ch8")):
+        def run() -> None:
+            runner = HeadlessRunner()
+            runner.load_rom(str(rom))
+            runner.run(cycles)
+
+        elapsed = best_time(run, repeat)
+        results[f"rom/{rom.stem}"] = result(cycles / elapsed, "instructions/s")
+    return results
+
+
+def bench_opcodes(iterations: int, repeat: int) -> Results:
+    results: Results = {}
+    runner = HeadlessRunner()
+    ii = runner.ii
+    for name, opcode in OPCODES.items():
+        def run() -> None:
+            interpret = ii.interpret_instruction
+            ii.reg_i = 0x300
+            for _ in range(iterations):
+                interpret(opcode)
+
+        elapsed = best_time(run, repeat)
+        results[f"opcode/{name}"] = result(elapsed / iterations * 1e9, "ns/op")
+    return results
+
+
+def bench_draw(iterations: int, repeat: int) -> Results:
+    results: Results = {}
+    runner = HeadlessRunner()
+    ii = runner.ii
+    ii.reg_v[0x0] = 30
+    ii.reg_v[0x1] = 10
+    for height in (1, 5, 8, 15):
+        def run() -> None:
+            draw = ii.draw
+            ii.reg_i = 0
+            for _ in range(iterations):
+                draw(0x0, 0x1, height)
+
+        elapsed = best_time(run, repeat)
+        results[f"draw/D01{height:X}"] = result(elapsed / iterations * 1e9, "ns/op")
+    return results
+
+
+def bench_spin(frames: int, repeat: int) -> Results:
+    # Render without a visible window unless a video driver has been chosen
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        from src.screen import Screen
+    except ImportError:
+        logger.warning("pygame is not installed, skipping Screen.spin benchmarks")
+        return {}
+
+    screen = Screen()
+    results: Results = {}
+
+    def unchanged() -> None:
+        for _ in range(frames):
+            screen.spin()
+
+    def full_redraw() -> None:
+        for _ in range(frames):
+            screen.redraw_all()
+            screen.spin()
+
+    def sprite_per_frame() -> None:
+        for frame in range(frames):
+            screen.draw_sprite(frame, frame, bytes([0xF0, 0x90, 0x90, 0x90, 0xF0]))
+            screen.spin()
+
+    for name, function in (("unchanged", unchanged),
+                           ("full_redraw", full_redraw),
+                           ("sprite_per_frame", sprite_per_frame)):
+        screen.spin()
+        elapsed = best_time(function, repeat)
+        results[f"spin/{name}"] = result(elapsed / frames * 1e3, "ms/frame")
+    return results
+
+
+def bench_vector(instances: int, cycles: int, repeat: int) -> Results:
+    try:
+        from src.scheduler import Scheduler
+        from src.vector_vm import VectorVM
+    except ImportError:
+        logger.warning("NumPy is not installed, skipping VectorVM benchmarks")
+        return {}
+
+    results: Results = {}
+    for rom in sorted(ROM_DIR.glob("*.ch8")):
+        def run() -> None:
+            vm = VectorVM(instances, seed=0)
+            vm.load_rom(str(rom))
+            Scheduler(vm).run_cycles(cycles)
+
+        elapsed = best_time(run, repeat)
+        results[f"vector/{rom.stem}"] = result(instances * cycles / elapsed, "instructions/s")
+    return results
+
+
+def bench_startup(repeat: int) -> Results:
+    """
+    Wall time of starting the emulator in a new process with a ROM, until the
+    first frame is presented and until the menu is ready.
+    """
+    # Without a visible window or sound unless drivers have been chosen
+    env = {"SDL_VIDEODRIVER": "dummy", "SDL_AUDIODRIVER": "dummy", **os.environ}
+    rom = ROM_DIR / "IBM Logo.ch8"
+    results: Results = {}
+    for name, frames in (("first_frame", 1), ("menu_ready", 2)):
+        def run() -> None:
+            subprocess.run([sys.executable, "-m", "src", str(rom), "--exit-after-frames", str(frames)],
+                           env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        try:
+            elapsed = best_time(run, repeat)
+        except subprocess.CalledProcessError:
+            logger.warning("The emulator could not start, skipping startup benchmarks")
+            return {}
+        results[f"startup/{name}"] = result(elapsed * 1e3, "ms")
+    return results
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> list[str]:
+    """Names of the cases that are more than threshold worse than baseline."""
+    regressions = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["value"]
+        new = current["value"]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        if not UNITS[current["unit"]]:
+            change = -change
+        current["change"] = change
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def format_table(results: Results, regressions: list[str]) -> str:
+    lines = [f"{'case':<32} {'value':>14}  {'unit':<16} {'change':>8}"]
+    for name, current in results.items():
+        change = current.get("change")
+        change_text = f"{change:+.1%}" if change is not None else ""
+        flag = "  REGRESSION" if name in regressions else ""
+        lines.append(f"{name:<32} {current['value']:>14.2f}  "
+                     f"{current['unit']:<16} {change_text:>8}{flag}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.bench",
+                                     description="Benchmark kanzchip-8.")
+    parser.add_argument("-k", "--cases", default="*",
+                        help="Only run cases matching this pattern, e.g. 'rom/*'.")
+    parser.add_argument("--cycles", type=int, default=100_000,
+                        help="Instructions to run per ROM.")
+    parser.add_argument("--iterations", type=int, default=20_000,
+                        help="Iterations of each opcode and draw micro-benchmark.")
+    parser.add_argument("--frames", type=int, default=200,
+                        help="Frames per Screen.spin benchmark.")
+    parser.add_argument("--instances", type=int, default=1000,
+                        help="Instances of the VectorVM benchmarks, they run 600 cycles.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of each case, the best one is reported.")
+    parser.add_argument("-o", "--output", help="Write results to this JSON file.")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative slowdown that counts as a regression.")
+    args = parser.parse_args(argv)
+
+    # Every runner logs its setup at info level, keep the output readable
+    logger.setLevel(logging.WARNING)
+
+    suites: list[tuple[str, Callable[[], Results]]] = [
+        ("rom", lambda: bench_roms(args.cycles, args.repeat)),
+        ("opcode", lambda: bench_opcodes(args.iterations, args.repeat)),
+        ("draw", lambda: bench_draw(args.iterations, args.repeat)),
+        ("spin", lambda: bench_spin(args.frames, args.repeat)),
+        ("vector", lambda: bench_vector(args.instances, 600, args.repeat)),
+        ("startup", lambda: bench_startup(args.repeat)),
+    ]
+    group = args.cases.split("/")[0]
+    results: Results = {}
+    for suite_name, suite in suites:
+        if fnmatch.fnmatch(suite_name, group):
+            results.update({name: value for name, value in suite().items()
+                            if fnmatch.fnmatch(name, args.cases)})
+
+    regressions: list[str] = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+
+    print(format_table(results, regressions))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"version": __version__, "python": sys.version.split()[0],
+                       "results": results}, f, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Translation of ROM code into Python functions
+
+A block is a straight-line run of instructions starting at some address. It
+ends with the first instruction that can change the program counter or needs
+to be seen by the rest of the emulator as it happens: jumps, skips, calls,
+RET, draws, key waits and stores to memory. Each block is compiled into one
+Python function, so running it fetches and decodes nothing.
+
+Loops that only wait for something that changes between time slices, the
+delay timer or the keypad, are translated into idle blocks. Such a loop
+leaves the same state after every iteration, so an idle block skips to the
+end of the time slice and only works out where in the loop it would be.
+
+Block functions take the number of cycles left in the current time slice and
+return the number of instructions they executed, a block that is longer than
+the slice executes its first instructions only. That way a block never runs
+past the cycle budget and timers see the same instruction counts as when
+stepping one instruction at a time.
+
+Every block watches the memory it was translated from and is dropped when a
+store writes to it, so self-modifying code is translated again.
+"""
+from typing import TYPE_CHECKING, Callable, Optional
+
+from src.log import logger
+from src.memory import Watch
+
+if TYPE_CHECKING:
+    from src.instruction_interpreter import InstructionInterpreter
+
+MAX_BLOCK_LENGTH = 64
+
+# Instructions that are translated to inline Python, keyed by the opcode bits
+# that identify them. Everything else calls the handler from the decode cache.
+INLINE_XKK = {
+    0x6: "v[{x}] = {kk}",
+    0x7: "v[{x}] = (v[{x}] + {kk}) & 0xFF",
+}
+INLINE_GROUP_8 = {
+    0x0: "v[{x}] = v[{y}]",
+    0x1: "v[{x}] = v[{x}] | v[{y}]",
+    0x2: "v[{x}] = v[{x}] & v[{y}]",
+    0x3: "v[{x}] = v[{x}] ^ v[{y}]",
+}
+INLINE_GROUP_F = {
+    0x07: "v[{x}] = ii.reg_delay",
+    0x15: "ii.reg_delay = v[{x}]",
+    0x18: "ii.reg_sound = v[{x}]",
+    0x1E: "ii.reg_i = (ii.reg_i + v[{x}]) & 0xFFFF",
+    0x29: "ii.reg_i = v[{x}] * 5",
+}
+
+BlockFunction = Callable[[int], int]
+
+
+def ends_block(instruction: int) -> bool:
+    group = instruction >> 12
+    if group in (0x1, 0x2, 0x3, 0x4, 0x5, 0x9, 0xB, 0xD, 0xE):
+        return True
+    if group == 0x0:
+        # RET, and EXIT which stays on itself
+        return instruction in (0x00EE, 0x00FD)
+    if group == 0xF:
+        return instruction & 0xFF in (0x0A, 0x33, 0x55)
+    return False
+
+
+def inline_source(instruction: int) -> str:
+    """Python statement for an instruction, or "" if it has no inline form."""
+    group = instruction >> 12
+    operands = {
+        "x": (instruction & 0x0F00) >> 8,
+        "y": (instruction & 0x00F0) >> 4,
+        "kk": instruction & 0x00FF,
+    }
+    if group in INLINE_XKK:
+        template = INLINE_XKK[group]
+    elif group == 0x8:
+        template = INLINE_GROUP_8.get(instruction & 0x000F, "")
+    elif group == 0xA:
+        return f"ii.reg_i = {instruction & 0x0FFF}"
+    elif group == 0xF:
+        template = INLINE_GROUP_F.get(instruction & 0x00FF, "")
+    else:
+        template = ""
+    return template.format(**operands)
+
+
+class BlockCache:
+    def __init__(self, ii: "InstructionInterpreter") -> None:
+        self.ii = ii
+        self.blocks: dict[int, BlockFunction] = {}
+        # Watch on the memory each block was translated from
+        self.watches: dict[int, Watch] = {}
+
+    def clear(self) -> None:
+        for watch in self.watches.values():
+            self.ii.memory.unwatch(watch)
+        self.blocks.clear()
+        self.watches.clear()
+
+    def add(self, address: int, end: int, block: BlockFunction) -> None:
+        def written(start: int, _: int) -> None:
+            logger.debug(f"Memory write at {start:03X} invalidated the block at {address:03X}")
+            self.drop(address)
+
+        self.blocks[address] = block
+        self.watches[address] = self.ii.memory.watch(address, end, written)
+
+    def drop(self, address: int) -> None:
+        del self.blocks[address]
+        self.ii.memory.unwatch(self.watches.pop(address))
+
+    def translate(self, address: int) -> BlockFunction:
+        memory = self.ii.memory
+        idle = self.translate_idle_loop(address)
+        if idle is not None:
+            return idle
+
+        instructions: list[int] = []
+        pc = address
+        while pc + 1 < len(memory) and len(instructions) < MAX_BLOCK_LENGTH:
+            instruction = (memory[pc] << 8) | memory[pc + 1]
+            instructions.append(instruction)
+            pc += 2
+            if ends_block(instruction):
+                break
+
+        if not instructions:
+            # Nothing to translate, let the interpreter fail like it would
+            # when stepping past the end of memory.
+            return self.step
+
+        block = self.compile(address, instructions)
+        self.add(address, pc, block)
+        return block
+
+    def translate_idle_loop(self, address: int) -> Optional[BlockFunction]:
+        memory = self.ii.memory
+        if address + 5 >= len(memory):
+            return None
+        first, second, third = ((memory[pc] << 8) | memory[pc + 1]
+                                for pc in range(address, address + 6, 2))
+        x = (first & 0x0F00) >> 8
+        jump_back = 0x1000 | address
+
+        if first == jump_back:
+            block, end = self.jump_to_self(), address + 2
+        elif first & 0xF0FF == 0xF007 and second == 0x3000 | x << 8 and third == jump_back:
+            block, end = self.delay_loop(address, x), address + 6
+        elif first & 0xF0FF in (0xE09E, 0xE0A1) and second == jump_back:
+            block, end = self.key_loop(address, x, first & 0x00FF == 0x9E), address + 4
+        else:
+            return None
+
+        logger.debug(f"Idle loop at {address:03X}")
+        self.add(address, end, block)
+        return block
+
+    def jump_to_self(self) -> BlockFunction:
+        """JP to the same address, nothing happens for the rest of the slice."""
+        def block(cycles: int) -> int:
+            return cycles
+        return block
+
+    def delay_loop(self, address: int, x: int) -> BlockFunction:
+        """LD Vx, DT; SE Vx, 00; JP back, wait for the delay timer."""
+        ii = self.ii
+
+        def block(cycles: int) -> int:
+            delay = ii.reg_delay
+            ii.reg_v[x] = delay
+            if delay == 0:
+                if cycles == 1:
+                    ii.program_counter = address + 2
+                    return 1
+                ii.program_counter = address + 6
+                return 2
+            ii.program_counter = address + 2 * (cycles % 3)
+            return cycles
+        return block
+
+    def key_loop(self, address: int, x: int, until_pressed: bool) -> BlockFunction:
+        """SKP or SKNP Vx; JP back, wait for a key to be pressed or released."""
+        ii = self.ii
+
+        def block(cycles: int) -> int:
+            if ii.keyboard.is_pressed(ii.reg_v[x]) == until_pressed:
+                ii.program_counter = address + 4
+                return 1
+            ii.program_counter = address + 2 * (cycles % 2)
+            return cycles
+        return block
+
+    def step(self, _: int) -> int:
+        self.ii.step()
+        return 1
+
+    def compile(self, address: int, instructions: list[int]) -> BlockFunction:
+        namespace: dict[str, object] = {"ii": self.ii}
+        statements = []
+        for i, instruction in enumerate(instructions):
+            source = inline_source(instruction)
+            if source == "":
+                handler = f"h{i}"
+                namespace[handler] = self.ii.decoded[instruction]
+                source = f"{handler}()"
+            statements.append(source)
+
+        length = len(instructions)
+        end = address + 2 * length
+        lines = [f"def block_{address:03X}(cycles):",
+                 "    v = ii.reg_v"]
+
+        # The complete block, the program counter has to be correct before
+        # the last instruction since that is the one that may read or change it.
+        lines.append(f"    if cycles >= {length}:")
+        lines.extend(f"        {statement}" for statement in statements[:-1])
+        lines.append(f"        ii.program_counter = {end}")
+        lines.append(f"        {statements[-1]}")
+        if instructions[-1] & 0xF0FF == 0xF00A:
+            # The rest of the time slice passes while waiting for a key
+            lines.append(f"        return cycles if ii.key_wait is not None else {length}")
+        else:
+            lines.append(f"        return {length}")
+
+        # Only the first instructions fit in the time slice. The last
+        # instruction is never reached here, so nothing can branch.
+        for i, statement in enumerate(statements[:-1]):
+            lines.append(f"    {statement}")
+            lines.append(f"    if cycles == {i + 1}:")
+            lines.append(f"        ii.program_counter = {address + 2 * (i + 1)}")
+            lines.append(f"        return {i + 1}")
+        lines.append("    return 0")
+
+        code = compile("\n".join(lines), f"<block {address:03X}>", "exec")
+        exec(code, namespace)
+        block: BlockFunction = namespace[f"block_{address:03X}"]  # type: ignore
+        return block
@@ -0,0 +1,320 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Debugger
+
+Breakpoints on addresses, optionally only when a V register compares to a
+value, and watchpoints on memory writes. Like the profilers the debugger
+attaches as a step hook, so the interpreter steps one instruction at a time
+and the breakpoints are checked before each of them. It is only attached
+while there is something to check, without breakpoints and watchpoints the
+interpreter runs translated blocks as usual.
+
+When execution stops, the rest of the time slice passes without executing
+anything, the same as while Fx0A waits for a key. Watchpoints are memory
+watches, a store to a watched range stops execution after the instruction
+that wrote.
+
+DebuggerShell is a terminal REPL around a headless runner:
+
+    python -m src --debugger --rom path/to/rom.ch8
+
+Addresses, values and keys are hex, as in the disassembly, counts of
+instructions and frames are decimal.
+"""
+import cmd
+import operator
+from typing import Callable, Optional
+
+from src.disassembler import disassemble_range
+from src.headless import HeadlessRunner
+from src.instruction_interpreter import InstructionInterpreter, StepHook
+from src.log import logger
+from src.memory import Watch
+
+COMPARISONS: dict[str, Callable[[int, int], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+# Frames continue runs for at most, so a missed breakpoint returns to the prompt
+CONTINUE_FRAMES = 600
+
+
+class Condition:
+    """Vx compared to a value, e.g. V3 == 05."""
+    def __init__(self, register: int, comparison: str, value: int) -> None:
+        if comparison not in COMPARISONS:
+            raise ValueError(f"Unknown comparison {comparison}")
+        self.register = register
+        self.comparison = comparison
+        self.value = value
+
+    @classmethod
+    def parse(cls, text: str) -> "Condition":
+        parts = text.split()
+        if len(parts) != 3 or len(parts[0]) != 2 or parts[0][0].upper() != "V":
+            raise ValueError(f"Expected a condition like V3 == 05, got {text!r}")
+        return cls(int(parts[0][1], 16), parts[1], int(parts[2], 16))
+
+    def holds(self, ii: InstructionInterpreter) -> bool:
+        return COMPARISONS[self.comparison](ii.reg_v[self.register], self.value)
+
+    def __str__(self) -> str:
+        return f"V{self.register:X} {self.comparison} {self.value:02X}"
+
+
+class Debugger(StepHook):
+    def __init__(self, ii: InstructionInterpreter) -> None:
+        self.ii = ii
+        # Address to the condition of its breakpoint, None if unconditional
+        self.breakpoints: dict[int, Optional[Condition]] = {}
+        self.watchpoints: dict[int, Watch] = {}
+        # Address and stack pointer to stop at when stepping over a CALL
+        self.return_to: Optional[tuple[int, int]] = None
+        # Why execution stopped, None while running
+        self.stopped: Optional[str] = None
+        # A breakpoint here is passed once, to resume from it
+        self.resume_at: Optional[int] = None
+        self.attached = False
+
+    def attach(self) -> None:
+        if self.attached:
+            return
+        self.ii.add_step_hook(self)
+        self.attached = True
+        logger.info("Debugger attached")
+
+    def detach(self) -> None:
+        if not self.attached:
+            return
+        self.ii.remove_step_hook(self)
+        self.attached = False
+        logger.info("Debugger detached")
+
+    def update(self) -> None:
+        """
+        Attach while stopped or there is anything to check, detach
+        otherwise.
+        """
+        if self.stopped is not None or self.breakpoints or self.watchpoints or self.return_to is not None:
+            self.attach()
+        else:
+            self.detach()
+
+    def add_breakpoint(self, address: int, condition: Optional[Condition] = None) -> None:
+        self.breakpoints[address] = condition
+        self.update()
+
+    def remove_breakpoint(self, address: int) -> None:
+        if address not in self.breakpoints:
+            raise ValueError(f"No breakpoint at {address:03X}")
+        del self.breakpoints[address]
+        self.update()
+
+    def add_watchpoint(self, start: int, end: int) -> None:
+        def written(first: int, last: int) -> None:
+            self.stop(f"Watchpoint {start:03X}-{end - 1:03X}: write to {first:03X}-{last - 1:03X}")
+
+        self.remove_watchpoint(start)
+        self.watchpoints[start] = self.ii.memory.watch(start, end, written)
+        self.update()
+
+    def remove_watchpoint(self, start: int) -> None:
+        watch = self.watchpoints.pop(start, None)
+        if watch is not None:
+            self.ii.memory.unwatch(watch)
+        self.update()
+
+    def step_over(self) -> bool:
+        """Arm a stop after the CALL at the program counter, False if there is none."""
+        ii = self.ii
+        pc = ii.program_counter
+        if ii.memory[pc] >> 4 != 0x2:
+            return False
+        self.return_to = (pc + 2, ii.stack_pointer)
+        self.update()
+        return True
+
+    def stop(self, reason: str) -> None:
+        self.stopped = reason
+        logger.debug(reason)
+        self.update()
+
+    def resume(self) -> None:
+        self.stopped = None
+        self.resume_at = self.ii.program_counter
+        self.update()
+
+    def should_stop(self, pc: int) -> bool:
+        if self.return_to is not None and pc == self.return_to[0] and self.ii.stack_pointer <= self.return_to[1]:
+            self.return_to = None
+            self.stop(f"Returned to {pc:03X}")
+            return True
+        if pc not in self.breakpoints or pc == self.resume_at:
+            return False
+        condition = self.breakpoints[pc]
+        if condition is not None and not condition.holds(self.ii):
+            return False
+        self.stop(f"Breakpoint at {pc:03X}" + (f" if {condition}" if condition is not None else ""))
+        return True
+
+    def before_step(self, pc: int) -> bool:
+        if self.stopped is not None:
+            return True
+        return (pc in self.breakpoints or self.return_to is not None) and self.should_stop(pc)
+
+    def after_step(self, pc: int) -> bool:
+        self.resume_at = None
+        # A watchpoint stops during the instruction that wrote
+        return self.stopped is not None
+
+
+class DebuggerShell(cmd.Cmd):
+    intro = "kanzchip-8 debugger, type help or ? to list commands."
+    prompt = "(chip8) "
+
+    def __init__(self, runner: HeadlessRunner) -> None:
+        super().__init__()
+        self.runner = runner
+        self.ii = runner.ii
+        self.debugger = Debugger(runner.ii)
+
+    def say(self, text: str) -> None:
+        self.stdout.write(text + "\n")
+
+    def onecmd(self, line: str) -> bool:
+        try:
+            return super().onecmd(line)
+        except (ValueError, IndexError) as e:
+            self.say(f"Error: {e}")
+            return False
+
+    def emptyline(self) -> bool:
+        # Do not repeat the last command, it may be continue
+        return False
+
+    def report_stop(self) -> None:
+        if self.debugger.stopped is not None:
+            self.say(self.debugger.stopped)
+        self.show_disassembly(self.ii.program_counter, 1)
+
+    def show_disassembly(self, address: int, before: int = 4, after: int = 6) -> None:
+        pc = self.ii.program_counter
+        start = max(0, address - 2 * before)
+        for line_address, instruction, text in disassemble_range(self.ii.memory, start, address + 2 * after):
+            marker = "=>" if line_address == pc else "  "
+            flag = "*" if line_address in self.debugger.breakpoints else " "
+            self.say(f"{marker}{flag}{line_address:03X}  {instruction:04X}  {text}")
+
+    def do_break(self, arg: str) -> None:
+        """break ADDRESS [if Vx OP VALUE]: stop before the instruction at ADDRESS, OP is one of == != < <= > >="""
+        address_text, _, condition_text = arg.partition(" if ")
+        condition = Condition.parse(condition_text) if condition_text else None
+        address = int(address_text, 16)
+        self.debugger.add_breakpoint(address, condition)
+        self.say(f"Breakpoint at {address:03X}" + (f" if {condition}" if condition is not None else ""))
+
+    def do_delete(self, arg: str) -> None:
+        """delete ADDRESS: remove the breakpoint at ADDRESS"""
+        self.debugger.remove_breakpoint(int(arg, 16))
+
+    def do_watch(self, arg: str) -> None:
+        """watch START [END]: stop after a write to memory in START-END, or to START only"""
+        parts = arg.split()
+        start = int(parts[0], 16)
+        end = int(parts[1], 16) + 1 if len(parts) > 1 else start + 1
+        if not 0 <= start < end <= len(self.ii.memory):
+            raise ValueError(f"Invalid range {arg}")
+        self.debugger.add_watchpoint(start, end)
+        self.say(f"Watchpoint {start:03X}-{end - 1:03X}")
+
+    def do_unwatch(self, arg: str) -> None:
+        """unwatch START: remove the watchpoint that starts at START"""
+        self.debugger.remove_watchpoint(int(arg, 16))
+
+    def do_info(self, arg: str) -> None:
+        """info: list breakpoints and watchpoints"""
+        for address, condition in sorted(self.debugger.breakpoints.items()):
+            self.say(f"break {address:03X}" + (f" if {condition}" if condition is not None else ""))
+        for start, watch in sorted(self.debugger.watchpoints.items()):
+            self.say(f"watch {start:03X} {watch.end - 1:03X}")
+
+    def do_step(self, arg: str) -> None:
+        """step [COUNT]: execute COUNT instructions, 1 by default"""
+        for _ in range(int(arg or "1")):
+            self.debugger.resume()
+            self.runner.scheduler.run_cycles(1)
+            if self.debugger.stopped is not None:
+                break
+        self.report_stop()
+
+    def do_next(self, arg: str) -> None:
+        """next: execute one instruction, a CALL runs until its subroutine returns"""
+        if self.debugger.step_over():
+            self.do_continue("")
+        else:
+            self.do_step("")
+
+    def do_continue(self, arg: str) -> None:
+        """continue [FRAMES]: run until a breakpoint or watchpoint, for at most FRAMES 60 Hz frames"""
+        frames = int(arg) if arg else CONTINUE_FRAMES
+        self.debugger.resume()
+        for _ in range(frames):
+            self.runner.scheduler.run_frames(1)
+            if self.debugger.stopped is not None:
+                break
+        else:
+            self.say(f"Still running after {frames} frames")
+        self.report_stop()
+
+    def do_list(self, arg: str) -> None:
+        """list [ADDRESS]: disassemble around ADDRESS, the program counter by default"""
+        self.show_disassembly(int(arg, 16) if arg else self.ii.program_counter)
+
+    def do_regs(self, arg: str) -> None:
+        """regs: show the registers, timers and stack"""
+        self.say("\n".join(self.runner.report().splitlines()[-3:-1]))
+
+    def do_mem(self, arg: str) -> None:
+        """mem ADDRESS [LENGTH]: dump LENGTH bytes of memory, 16 by default"""
+        parts = arg.split()
+        address = int(parts[0], 16)
+        data = self.ii.memory.load(address, int(parts[1], 16) if len(parts) > 1 else 16)
+        for offset in range(0, len(data), 16):
+            self.say(f"{address + offset:03X}  {data[offset:offset + 16].hex(' ').upper()}")
+
+    def do_screen(self, arg: str) -> None:
+        """screen: print the display"""
+        self.say(self.runner.screen.to_text())
+
+    def do_keys(self, arg: str) -> None:
+        """keys [KEY ...]: hold down these keys, 0-F, and release the others"""
+        state = 0
+        for text in arg.split():
+            key = int(text, 16)
+            if not 0 <= key <= 0xF:
+                raise ValueError(f"No key {text}, keys are 0-F")
+            state |= 1 << key
+        self.runner.keyboard.state = state
+
+    def do_quit(self, arg: str) -> bool:
+        """quit: leave the debugger"""
+        return True
+
+    do_EOF = do_quit
+    do_b = do_break
+    do_s = do_step
+    do_n = do_next
+    do_c = do_continue
+    do_l = do_list
+    do_q = do_quit
+
+
+def run_debugger(rom: str, cpu_rate: float = 600.0, seed: Optional[int] = None, wrap_memory: bool = False) -> None:
+    runner = HeadlessRunner(cpu_rate, seed, wrap_memory)
+    runner.load_rom(rom)
+    DebuggerShell(runner).cmdloop()
@@ -0,0 +1,119 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+CHIP-8 disassembler, using the mnemonics of Cowgod's Chip-8 technical
+reference, and those of its SUPER-CHIP section and of Octo for the SUPER-CHIP
+and XO-CHIP instructions.
+"""
+from typing import Union
+
+GROUP_8_MNEMONICS = {
+    0x0: "LD",
+    0x1: "OR",
+    0x2: "AND",
+    0x3: "XOR",
+    0x4: "ADD",
+    0x5: "SUB",
+    0x6: "SHR",
+    0x7: "SUBN",
+    0xE: "SHL",
+}
+# Fx.. instructions, {x} is replaced with the register
+GROUP_F_OPERANDS = {
+    0x07: "V{x}, DT",
+    0x0A: "V{x}, K",
+    0x15: "DT, V{x}",
+    0x18: "ST, V{x}",
+    0x29: "F, V{x}",
+    0x30: "HF, V{x}",
+    0x33: "B, V{x}",
+    0x55: "[I], V{x}",
+    0x65: "V{x}, [I]",
+    0x75: "R, V{x}",
+    0x85: "V{x}, R",
+}
+# 00.. instructions of SUPER-CHIP, without an operand
+GROUP_0_MNEMONICS = {
+    0x00FB: "SCR",
+    0x00FC: "SCL",
+    0x00FD: "EXIT",
+    0x00FE: "LOW",
+    0x00FF: "HIGH",
+}
+
+
+def disassemble(instruction: int) -> str:
+    """Assembly text of one instruction, data that is no instruction is DW."""
+    group = instruction >> 12
+    x = f"{(instruction & 0x0F00) >> 8:X}"
+    y = f"{(instruction & 0x00F0) >> 4:X}"
+    n = instruction & 0x000F
+    kk = instruction & 0x00FF
+    nnn = instruction & 0x0FFF
+
+    if instruction == 0x00E0:
+        return "CLS"
+    if instruction == 0x00EE:
+        return "RET"
+    if instruction in GROUP_0_MNEMONICS:
+        return GROUP_0_MNEMONICS[instruction]
+    if instruction & 0xFFF0 == 0x00C0:
+        return f"SCD {n:X}"
+    if instruction & 0xFFF0 == 0x00D0:
+        return f"SCU {n:X}"
+    if group == 0x0:
+        return f"SYS {nnn:03X}"
+    if group == 0x1:
+        return f"JP {nnn:03X}"
+    if group == 0x2:
+        return f"CALL {nnn:03X}"
+    if group == 0x3:
+        return f"SE V{x}, {kk:02X}"
+    if group == 0x4:
+        return f"SNE V{x}, {kk:02X}"
+    if group == 0x5 and n == 0x0:
+        return f"SE V{x}, V{y}"
+    if group == 0x5 and n == 0x2:
+        return f"SAVE V{x} - V{y}"
+    if group == 0x5 and n == 0x3:
+        return f"LOAD V{x} - V{y}"
+    if group == 0x6:
+        return f"LD V{x}, {kk:02X}"
+    if group == 0x7:
+        return f"ADD V{x}, {kk:02X}"
+    if group == 0x8 and n in GROUP_8_MNEMONICS:
+        return f"{GROUP_8_MNEMONICS[n]} V{x}, V{y}"
+    if group == 0x9 and n == 0x0:
+        return f"SNE V{x}, V{y}"
+    if group == 0xA:
+        return f"LD I, {nnn:03X}"
+    if group == 0xB:
+        return f"JP V0, {nnn:03X}"
+    if group == 0xC:
+        return f"RND V{x}, {kk:02X}"
+    if group == 0xD:
+        return f"DRW V{x}, V{y}, {n:X}"
+    if group == 0xE and kk == 0x9E:
+        return f"SKP V{x}"
+    if group == 0xE and kk == 0xA1:
+        return f"SKNP V{x}"
+    if group == 0xF and kk == 0x01:
+        return f"PLANE {x}"
+    if instruction == 0xF002:
+        return "AUDIO"
+    if group == 0xF and kk == 0x3A:
+        return f"PITCH V{x}"
+    if group == 0xF and kk == 0x1E:
+        return f"ADD I, V{x}"
+    if group == 0xF and kk in GROUP_F_OPERANDS:
+        return "LD " + GROUP_F_OPERANDS[kk].format(x=x)
+    return f"DW {instruction:04X}"
+
+
+def disassemble_range(memory: Union[bytes, bytearray], start: int, end: int) -> list[tuple[int, int, str]]:
+    """Address, opcode and assembly text of each instruction in [start, end)."""
+    lines = []
+    for address in range(start, min(end, len(memory) - 1), 2):
+        instruction = (memory[address] << 8) | memory[address + 1]
+        lines.append((address, instruction, disassemble(instruction)))
+    return lines
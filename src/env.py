@@ -0,0 +1,227 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Reinforcement learning environment
+
+Chip8Env wraps a headless interpreter in the reset/step interface of Gym.
+An observation is the display as a 32x64 NumPy array of 0 and 1, 64x128 in
+SUPER-CHIP high resolution, of the pixels of the first plane. The reward
+and the end of an episode are decided by functions of memory, which is
+where games keep their score and lives. A reward or done function with a
+reset method gets it called with memory at the start of every episode.
+VecEnv runs many environments in worker processes and steps all of them
+with one call.
+
+Nothing here imports pygame. NumPy is imported when the first observation
+is made, so the module and its reward functions can be used without it.
+"""
+import copy
+import multiprocessing
+import numbers
+import random
+from multiprocessing.connection import Connection
+from typing import TYPE_CHECKING, Any, Callable, Optional, Sequence, Union
+
+from src.headless import HeadlessRunner
+
+if TYPE_CHECKING:
+    import numpy as np
+
+RewardFunction = Callable[[bytearray], float]
+DoneFunction = Callable[[bytearray], bool]
+Keys = Union[int, Sequence[int]]
+
+
+def keys_mask(keys: Keys) -> int:
+    """Keypad state from a mask, or from the keys that are held down."""
+    if isinstance(keys, (int, numbers.Integral)):
+        return int(keys) & 0xFFFF
+    mask = 0
+    for key in keys:
+        mask |= 1 << key
+    return mask
+
+
+class ScoreReward:
+    """
+    Reward the increase of a score that the ROM keeps in memory, big endian
+    over length bytes.
+    """
+    def __init__(self, address: int, length: int = 1) -> None:
+        self.address = address
+        self.length = length
+        self.last = 0
+
+    def score(self, memory: bytearray) -> int:
+        return int.from_bytes(memory[self.address:self.address + self.length], "big")
+
+    def reset(self, memory: bytearray) -> None:
+        self.last = self.score(memory)
+
+    def __call__(self, memory: bytearray) -> float:
+        score = self.score(memory)
+        reward = score - self.last
+        self.last = score
+        return float(reward)
+
+
+class Chip8Env:
+    def __init__(self, rom: str = "", cpu_rate: float = 600.0, reward: Optional[RewardFunction] = None,
+                 done: Optional[DoneFunction] = None, max_frames: Optional[int] = None,
+                 shift_quirks: bool = False) -> None:
+        self.rom = rom
+        self.cpu_rate = cpu_rate
+        self.reward = reward
+        self.done = done
+        self.max_frames = max_frames
+        self.shift_quirks = shift_quirks
+        # Picks the seed of each episode, so a sequence of episodes can be
+        # reproduced by seeding the first one
+        self.seeds = random.Random()
+        self.program = b""
+        self.runner = HeadlessRunner(cpu_rate)
+        self.frames = 0
+
+    def reset(self, rom: Optional[str] = None, seed: Optional[int] = None) -> "np.ndarray":
+        """Start a new episode, of another ROM if one is given. Returns the first observation."""
+        if rom is not None and rom != self.rom:
+            self.rom = rom
+            self.program = b""
+        if self.program == b"":
+            with open(self.rom, "rb") as f:
+                self.program = f.read()
+        if seed is not None:
+            self.seeds.seed(seed)
+
+        ii = self.runner.ii
+        ii.load_program(self.program)
+        ii.seed = self.seeds.randrange(2 ** 32)
+        ii.shift_quirks = self.shift_quirks
+        ii.reset()
+        self.runner.screen.clear_all()
+        self.runner.keyboard.state = 0
+        self.runner.scheduler.reset()
+        self.frames = 0
+        for function in (self.reward, self.done):
+            reset = getattr(function, "reset", None)
+            if reset is not None:
+                reset(ii.memory)
+        return self.observation()
+
+    def step(self, keys: Keys = 0, frames: int = 1) -> tuple["np.ndarray", float, bool, dict[str, Any]]:
+        """
+        Hold keys down for a number of 60 Hz frames. Returns the observation,
+        the reward, whether the episode is over and an info dict.
+        """
+        runner = self.runner
+        runner.keyboard.state = keys_mask(keys)
+        runner.scheduler.run_frames(frames)
+        self.frames += frames
+
+        memory = runner.ii.memory
+        reward = self.reward(memory) if self.reward is not None else 0.0
+        done = self.done(memory) if self.done is not None else False
+        if self.max_frames is not None and self.frames >= self.max_frames:
+            done = True
+        info = {"frames": self.frames, "cycles": runner.scheduler.cycles}
+        return self.observation(), reward, done, info
+
+    def observation(self) -> "np.ndarray":
+        import numpy as np
+
+        screen = self.runner.screen
+        packed = np.frombuffer(screen.to_bytes(), dtype=np.uint8)
+        return np.unpackbits(packed).reshape(screen.height, screen.width)
+
+
+def worker(connection: Connection, count: int, env_kwargs: dict[str, Any]) -> None:
+    """Serve reset and step commands for count environments."""
+    # Every environment gets its own copy of stateful reward functions
+    envs = [Chip8Env(**copy.deepcopy(env_kwargs)) for _ in range(count)]
+    while True:
+        command, *arguments = connection.recv()
+        if command == "reset":
+            seeds, = arguments
+            connection.send([env.reset(seed=seed) for env, seed in zip(envs, seeds)])
+        elif command == "step":
+            keys, frames = arguments
+            results = []
+            for env, env_keys in zip(envs, keys):
+                observation, reward, done, info = env.step(env_keys, frames)
+                if done:
+                    # Start over right away like Gym vector environments do
+                    info["terminal_observation"] = observation
+                    observation = env.reset()
+                results.append((observation, reward, done, info))
+            connection.send(results)
+        elif command == "close":
+            connection.close()
+            return
+
+
+class VecEnv:
+    """
+    Many Chip8Env in worker processes, all stepped together. An environment
+    whose episode ends is reset straight away, its last observation is in
+    the info dict as terminal_observation.
+    """
+    def __init__(self, envs: int, processes: Optional[int] = None, **env_kwargs: Any) -> None:
+        if envs < 1:
+            raise ValueError(f"A VecEnv needs at least one environment, got {envs}")
+        if processes is not None and processes < 0:
+            raise ValueError(f"Number of processes can not be negative, got {processes}")
+        self.envs = envs
+        # 0 or None uses a process per CPU, never more than there are environments
+        processes = min(envs, processes or multiprocessing.cpu_count())
+        # Split the environments as evenly as possible over the processes
+        self.counts = [envs // processes + (1 if i < envs % processes else 0) for i in range(processes)]
+        self.connections: list[Connection] = []
+        self.processes = []
+        for count in self.counts:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=worker, args=(child, count, env_kwargs), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def split(self, values: Sequence[Any]) -> list[Sequence[Any]]:
+        parts = []
+        start = 0
+        for count in self.counts:
+            parts.append(values[start:start + count])
+            start += count
+        return parts
+
+    def reset(self, seed: Optional[int] = None) -> "np.ndarray":
+        """Reset every environment, environment i gets seed + i."""
+        import numpy as np
+
+        seeds = [None if seed is None else seed + i for i in range(self.envs)]
+        for connection, part in zip(self.connections, self.split(seeds)):
+            connection.send(("reset", part))
+        return np.stack([observation for connection in self.connections
+                         for observation in connection.recv()])
+
+    def step(self, keys: Sequence[Keys], frames: int = 1) \
+            -> tuple["np.ndarray", "np.ndarray", "np.ndarray", list[dict[str, Any]]]:
+        import numpy as np
+
+        for connection, part in zip(self.connections, self.split(keys)):
+            connection.send(("step", part, frames))
+        results = [result for connection in self.connections for result in connection.recv()]
+        observations, rewards, dones, infos = zip(*results)
+        return np.stack(observations), np.array(rewards), np.array(dones), list(infos)
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.send(("close",))
+            connection.close()
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self) -> "VecEnv":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
@@ -0,0 +1,149 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+from typing import Sequence, Union
+
+from src.log import logger
+
+# Low resolution of CHIP-8, and the high resolution of SUPER-CHIP and XO-CHIP
+WIDTH = 64
+HEIGHT = 32
+HIRES_WIDTH = 128
+HIRES_HEIGHT = 64
+# Bitplanes of XO-CHIP, a pixel has one bit in each and so one of 4 colours
+PLANES = 2
+
+
+class Framebuffer:
+    """
+    The CHIP-8 display without any output, used as is when running headless
+    and as the base of Screen.
+
+    Each scanline of a plane is stored as one integer, with the leftmost
+    pixel in the most significant of its width bits. A sprite row is drawn
+    with a shift and an XOR, collisions are found with an AND, and scrolling
+    moves whole rows or shifts every row. rows is the first plane, the only
+    one that plain CHIP-8 and SUPER-CHIP programs draw to.
+
+    Drawing, clearing and scrolling only affect the planes selected with
+    select_planes, XO-CHIP Fn01.
+    """
+    def __init__(self) -> None:
+        self.width = WIDTH
+        self.height = HEIGHT
+        self.hires = False
+        self.planes: list[list[int]] = [[0] * HEIGHT for _ in range(PLANES)]
+        self.plane_mask = 1
+        # Indexes of the planes in plane_mask
+        self.selected: list[int] = [0]
+        self.paused = False
+        logger.info("Framebuffer initialized")
+
+    @property
+    def rows(self) -> list[int]:
+        return self.planes[0]
+
+    @rows.setter
+    def rows(self, rows: list[int]) -> None:
+        self.planes[0] = rows
+
+    def get_pixel_state(self, x: int, y: int) -> bool:
+        return (self.rows[y] >> (self.width - 1 - x)) & 1 == 1
+
+    def set_pixel(self, x: int, y: int) -> None:
+        self.rows[y] |= 1 << (self.width - 1 - x)
+
+    def clear_pixel(self, x: int, y: int) -> None:
+        self.rows[y] &= ~(1 << (self.width - 1 - x))
+
+    def clear_all(self) -> None:
+        """Clear every plane."""
+        self.planes = [[0] * self.height for _ in range(PLANES)]
+
+    def clear_selected(self) -> None:
+        for plane in self.selected:
+            self.planes[plane] = [0] * self.height
+
+    def set_resolution(self, hires: bool) -> None:
+        """Switch between 64x32 and 128x64, which clears the display."""
+        self.hires = hires
+        self.width = HIRES_WIDTH if hires else WIDTH
+        self.height = HIRES_HEIGHT if hires else HEIGHT
+        self.clear_all()
+
+    def redraw_all(self) -> None:
+        """Present every pixel again, nothing to do without any output."""
+
+    def select_planes(self, mask: int) -> None:
+        self.plane_mask = mask & ((1 << PLANES) - 1)
+        self.selected = [plane for plane in range(PLANES) if self.plane_mask >> plane & 1]
+
+    def draw_sprite(self, x: int, y: int, sprite: Union[bytes, bytearray], wide: bool = False) -> bool:
+        """
+        XOR a sprite onto the display at (x, y), 8 pixels wide with one byte
+        per row, or 16 pixels wide with two bytes per row if wide is set.
+        With more than one plane selected, sprite holds the rows of each
+        plane after one another.
+
+        The start position wraps around the display, the sprite itself is
+        clipped at the right and bottom edges. Returns True if any pixel
+        that was set got cleared.
+        """
+        width = self.width
+        height = self.height
+        x %= width
+        y %= height
+        if wide:
+            sprite_rows: Sequence[int] = [int.from_bytes(sprite[i:i + 2], "big")
+                                          for i in range(0, len(sprite) - 1, 2)]
+            shift = width - 16 - x
+        else:
+            sprite_rows = sprite
+            shift = width - 8 - x
+        selected = self.selected
+        if not selected:
+            return False
+        count = len(sprite_rows) // len(selected)
+        collision = 0
+        for index, plane in enumerate(selected):
+            rows = self.planes[plane]
+            row_y = y
+            for sprite_row in sprite_rows[index * count:index * count + min(count, height - y)]:
+                if shift >= 0:
+                    bits = sprite_row << shift
+                else:
+                    bits = sprite_row >> -shift
+                collision |= rows[row_y] & bits
+                rows[row_y] ^= bits
+                row_y += 1
+        return collision != 0
+
+    def scroll_down(self, n: int) -> None:
+        n = min(n, self.height)
+        for plane in self.selected:
+            self.planes[plane] = [0] * n + self.planes[plane][:self.height - n]
+
+    def scroll_up(self, n: int) -> None:
+        n = min(n, self.height)
+        for plane in self.selected:
+            self.planes[plane] = self.planes[plane][n:] + [0] * n
+
+    def scroll_right(self, n: int = 4) -> None:
+        for plane in self.selected:
+            self.planes[plane] = [row >> n for row in self.planes[plane]]
+
+    def scroll_left(self, n: int = 4) -> None:
+        mask = (1 << self.width) - 1
+        for plane in self.selected:
+            self.planes[plane] = [(row << n) & mask for row in self.planes[plane]]
+
+    def to_bytes(self) -> bytes:
+        """The first plane, width / 8 bytes per row."""
+        row_bytes = self.width // 8
+        return b"".join(row.to_bytes(row_bytes, "big") for row in self.rows)
+
+    def to_text(self, on: str = "#", off: str = ".") -> str:
+        """The display as text, a pixel is on if it is set in any plane."""
+        return "\n".join(
+            format(row, f"0{self.width}b").replace("0", off).replace("1", on)
+            for row in (first | second for first, second in zip(*self.planes))
+        )
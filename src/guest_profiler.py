@@ -0,0 +1,155 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Guest profiler
+
+Profiles the ROM rather than the emulator: how often each address in memory
+is executed and which subroutines the time is spent in. The call stack of
+the ROM is read from stack and stack_pointer, each entry is the return
+address of a CALL, so the subroutine is the nnn of the instruction before it.
+
+Like the opcode profiler it attaches as a step hook of the interpreter, which
+then runs one instruction at a time, the interpreter itself has no profiling
+code.
+
+Results are exported as a disassembly annotated with hit counts, and as
+folded stacks, one line per call stack with the number of instructions
+executed in it, the input format of flamegraph.pl and speedscope.
+"""
+from collections import Counter
+from pathlib import Path
+from typing import Union
+
+from src.disassembler import disassemble
+from src.instruction_interpreter import InstructionInterpreter, StepHook
+from src.log import logger
+
+# Unexecuted gaps up to this many bytes are included in the disassembly, to
+# show the instructions that were skipped over
+MAX_GAP = 8
+
+
+def subroutine_name(address: int) -> str:
+    return f"sub_{address:03X}"
+
+
+class GuestProfiler(StepHook):
+    def __init__(self, ii: InstructionInterpreter) -> None:
+        self.ii = ii
+        self.hits = [0] * len(ii.memory)
+        # Instructions executed per call stack, and calls per (caller, callee)
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.calls: Counter[tuple[str, str]] = Counter()
+        self.call_stack: tuple[str, ...] = ("main",)
+        # Stack pointer before the instruction that is being executed
+        self.stack_pointer = 0
+        self.attached = False
+
+    def attach(self) -> None:
+        if self.attached:
+            return
+        self.sync_call_stack()
+        self.ii.add_step_hook(self)
+        self.attached = True
+        logger.info("Guest profiler attached")
+
+    def detach(self) -> None:
+        if not self.attached:
+            return
+        self.ii.remove_step_hook(self)
+        self.attached = False
+
+    def reset(self) -> None:
+        self.hits = [0] * len(self.ii.memory)
+        self.stacks.clear()
+        self.calls.clear()
+        self.sync_call_stack()
+
+    def caller_of(self, return_address: int) -> str:
+        """Subroutine that the CALL before return_address went to."""
+        memory = self.ii.memory
+        address = return_address - 2
+        if 0 <= address < len(memory) - 1 and memory[address] >> 4 == 0x2:
+            return subroutine_name(((memory[address] & 0x0F) << 8) | memory[address + 1])
+        return subroutine_name(address) + "?"
+
+    def sync_call_stack(self) -> None:
+        ii = self.ii
+        depth = max(0, min(ii.stack_pointer, len(ii.stack) - 1))
+        self.call_stack = ("main",) + tuple(self.caller_of(ii.stack[i]) for i in range(1, depth + 1))
+
+    def before_step(self, pc: int) -> bool:
+        self.stack_pointer = self.ii.stack_pointer
+        return False
+
+    def after_step(self, pc: int) -> bool:
+        ii = self.ii
+        self.hits[pc] += 1
+        # A CALL or RET counts in the stack it was executed in
+        self.stacks[self.call_stack] += 1
+        if ii.stack_pointer != self.stack_pointer:
+            caller = self.call_stack[-1]
+            self.sync_call_stack()
+            if ii.stack_pointer > self.stack_pointer:
+                self.calls[(caller, self.call_stack[-1])] += 1
+        return False
+
+    def hotspots(self, count: int = 10) -> list[tuple[int, int]]:
+        """The most executed addresses and their hit counts."""
+        executed = [(address, hits) for address, hits in enumerate(self.hits) if hits > 0]
+        return sorted(executed, key=lambda item: item[1], reverse=True)[:count]
+
+    def annotated_disassembly(self) -> str:
+        """
+        Disassembly of the executed code with the hit count of every
+        instruction. Subroutines that were called get a label.
+        """
+        memory = self.ii.memory
+        labels = {callee for _, callee in self.calls}
+        executed = [address for address, hits in enumerate(self.hits) if hits > 0]
+        addresses: list[int] = []
+        for address in executed:
+            if addresses and address - addresses[-1] <= MAX_GAP:
+                addresses.extend(range(addresses[-1] + 2, address, 2))
+            addresses.append(address)
+
+        total = sum(self.hits) or 1
+        lines = [f"; {sum(self.hits)} instructions executed"]
+        previous = None
+        for address in addresses:
+            if previous is not None and address - previous > MAX_GAP:
+                lines.append("")
+            if subroutine_name(address) in labels:
+                lines.append(f"{subroutine_name(address)}:")
+            previous = address
+            instruction = (memory[address] << 8) | memory[(address + 1) % len(memory)]
+            hits = self.hits[address]
+            share = f"{hits / total:6.2%}" if hits else ""
+            lines.append(f"{hits:>10} {share:>7}  {address:03X}: {instruction:04X}  {disassemble(instruction)}")
+        return "\n".join(lines)
+
+    def folded_stacks(self) -> str:
+        return "\n".join(f"{';'.join(stack)} {count}"
+                         for stack, count in sorted(self.stacks.items()) if count > 0)
+
+    def call_graph(self) -> str:
+        return "\n".join(f"{caller} -> {callee} {count}"
+                         for (caller, callee), count in self.calls.most_common())
+
+    def report(self, prefix: Union[str, Path]) -> None:
+        """
+        Print the hotspots and write prefix.asm, prefix.folded and
+        prefix.calls.
+        """
+        memory = self.ii.memory
+        total = sum(self.hits) or 1
+        print("Hottest addresses:")
+        for address, hits in self.hotspots():
+            instruction = (memory[address] << 8) | memory[(address + 1) % len(memory)]
+            print(f"{address:03X}: {disassemble(instruction):<16} {hits:>10} {hits / total:7.2%}")
+        prefix = Path(prefix)
+        for suffix, text in ((".asm", self.annotated_disassembly()),
+                             (".folded", self.folded_stacks()),
+                             (".calls", self.call_graph())):
+            prefix.with_name(prefix.name + suffix).write_text(text + "\n")
+        logger.info(f"Wrote guest profile to {prefix}.asm, {prefix}.folded and {prefix}.calls")
@@ -0,0 +1,100 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Headless execution, runs a ROM without pygame for a fixed number of cycles
+and reports the final state of the machine.
+"""
+import time
+from typing import Optional
+
+from src.framebuffer import Framebuffer
+from src.instruction_interpreter import InstructionInterpreter
+from src.keypad import Keypad
+from src.guest_profiler import GuestProfiler
+from src.log import logger
+from src.profiler import OpcodeProfiler
+from src.replay import InputPlayer, Recording, rom_digest
+from src.scheduler import Scheduler
+
+DEFAULT_CYCLES = 600
+
+
+class HeadlessRunner:
+    def __init__(self, cpu_rate: float = 600.0, seed: Optional[int] = None, wrap_memory: bool = False) -> None:
+        self.screen = Framebuffer()
+        self.keyboard = Keypad()
+        self.ii = InstructionInterpreter(self.screen, self.keyboard, seed, wrap_memory)
+        self.scheduler = Scheduler(self.ii, cpu_rate)
+        self.elapsed = 0.0
+
+    @property
+    def cycles(self) -> int:
+        return self.scheduler.cycles
+
+    @property
+    def frames(self) -> int:
+        return self.scheduler.timer_ticks
+
+    def load_rom(self, filename: str) -> None:
+        self.ii.load_rom(filename)
+        self.screen.clear_all()
+        self.ii.reset()
+
+    def run(self, cycles: int) -> None:
+        """
+        Run the given number of cycles as fast as possible.
+
+        The timers tick at 60 Hz of emulated time, the same as when running
+        in a window.
+        """
+        logger.info(f"Running {cycles} cycles headless")
+        start = time.perf_counter()
+        self.scheduler.run_cycles(cycles)
+        self.elapsed += time.perf_counter() - start
+
+    def report(self) -> str:
+        ii = self.ii
+        registers = " ".join(f"V{i:X}={value:02X}" for i, value in enumerate(ii.reg_v))
+        stack = " ".join(f"{address:03X}" for address in ii.stack[1:ii.stack_pointer + 1])
+        ips = self.cycles / self.elapsed if self.elapsed > 0 else 0.0
+        return "\n".join([
+            self.screen.to_text(),
+            "",
+            registers,
+            f"I={ii.reg_i:03X} PC={ii.program_counter:03X} SP={ii.stack_pointer} "
+            f"DT={ii.reg_delay:02X} ST={ii.reg_sound:02X} stack=[{stack}]",
+            f"{self.cycles} instructions, {self.frames} frames in {self.elapsed:.3f} s, "
+            f"{ips:.0f} instructions per second",
+        ])
+
+
+def run_headless(rom: str, cycles: Optional[int] = None, cpu_rate: float = 600.0, profile: str = "",
+                 guest_profile: str = "", seed: Optional[int] = None, replay: str = "",
+                 wrap_memory: bool = False) -> None:
+    """
+    Run a ROM and print the final state. A replay runs with the settings
+    and input of the recording, to its end unless cycles is given.
+    """
+    runner = HeadlessRunner(cpu_rate, seed, wrap_memory)
+    if replay != "":
+        recording = Recording.read(replay)
+        player = InputPlayer(runner.scheduler, runner.keyboard, recording)
+        player.configure(rom_digest(rom))
+        player.attach()
+        if cycles is None:
+            cycles = recording.end_cycle
+    runner.load_rom(rom)
+    profiler = OpcodeProfiler(runner.ii)
+    if profile != "":
+        profiler.attach()
+    guest_profiler = GuestProfiler(runner.ii)
+    if guest_profile != "":
+        guest_profiler.attach()
+    runner.run(cycles if cycles is not None else DEFAULT_CYCLES)
+    print(runner.report())
+    if profile != "":
+        print()
+        profiler.report(profile)
+    if guest_profile != "":
+        print()
+        guest_profiler.report(guest_profile)
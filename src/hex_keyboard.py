@@ -13,11 +13,13 @@ A  0  B  F        | Z  X  C  V
 """
 import pygame
 
+from src.keypad import Keypad
 from src.log import logger
 
 
-class HexKeyboard:
+class HexKeyboard(Keypad):
     def __init__(self) -> None:
+        super().__init__()
         self.hex_pygame_key_map = {
             0x1: pygame.K_1,
             0x2: pygame.K_2,
@@ -36,15 +38,25 @@ class HexKeyboard:
             0xB: pygame.K_c,
             0xF: pygame.K_v,
         }
+        self.pygame_hex_key_map = {
+            pygame_key: hex_key for hex_key, pygame_key in self.hex_pygame_key_map.items()
+        }
         logger.info("Keyboard Initialized")
 
-    def is_pressed(self, hex_key: int) -> bool:
-        if hex_key > 0xF or hex_key < 0x0:
-            logger.error(f"Invalid key {hex_key:X}")
-            return False
-
-        pygame_key = self.hex_pygame_key_map[hex_key]
-        if pygame.key.get_pressed()[pygame_key]:
-            return True
-        else:
-            return False
+    def handle_events(self, events: list[pygame.event.Event]) -> None:
+        """
+        Update the key state from the frame's events, called once per frame
+        by the main loop instead of polling pygame on every key query.
+        """
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                hex_key = self.pygame_hex_key_map.get(event.key)
+                if hex_key is not None:
+                    self.press(hex_key)
+            elif event.type == pygame.KEYUP:
+                hex_key = self.pygame_hex_key_map.get(event.key)
+                if hex_key is not None:
+                    self.release(hex_key)
+            elif event.type == pygame.WINDOWFOCUSLOST:
+                # Key up events are not received while unfocused
+                self.state = 0
@@ -1,10 +1,14 @@
 # Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
 
 import random
+from functools import partial
+from typing import Callable, Optional
 
-from src.hex_keyboard import HexKeyboard
+from src.block_cache import BlockCache
+from src.framebuffer import Framebuffer
+from src.keypad import Keypad
 from src.log import logger
-from src.screen import Screen
+from src.memory import Memory
 
 FONTS = (
     0xF0, 0x90, 0x90, 0x90, 0xF0,  # 0
@@ -25,11 +29,49 @@ FONTS = (
     0xF0, 0x80, 0xF0, 0x80, 0x80  # F
 )
 
+# 8x10 digits of SUPER-CHIP, Fx30, stored after the small ones
+BIG_FONTS = (
+    0xFF, 0xFF, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xFF, 0xFF,  # 0
+    0x18, 0x78, 0x78, 0x18, 0x18, 0x18, 0x18, 0x18, 0xFF, 0xFF,  # 1
+    0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF,  # 2
+    0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF,  # 3
+    0xC3, 0xC3, 0xC3, 0xC3, 0xFF, 0xFF, 0x03, 0x03, 0x03, 0x03,  # 4
+    0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF,  # 5
+    0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0xC3, 0xC3, 0xFF, 0xFF,  # 6
+    0xFF, 0xFF, 0x03, 0x03, 0x06, 0x0C, 0x18, 0x18, 0x18, 0x18,  # 7
+    0xFF, 0xFF, 0xC3, 0xC3, 0xFF, 0xFF, 0xC3, 0xC3, 0xFF, 0xFF,  # 8
+    0xFF, 0xFF, 0xC3, 0xC3, 0xFF, 0xFF, 0x03, 0x03, 0xFF, 0xFF,  # 9
+    0x7E, 0xFF, 0xC3, 0xC3, 0xC3, 0xFF, 0xFF, 0xC3, 0xC3, 0xC3,  # A
+    0xFC, 0xFC, 0xC3, 0xC3, 0xFC, 0xFC, 0xC3, 0xC3, 0xFC, 0xFC,  # B
+    0x3C, 0xFF, 0xC3, 0xC0, 0xC0, 0xC0, 0xC0, 0xC3, 0xFF, 0x3C,  # C
+    0xFC, 0xFE, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xC3, 0xFE, 0xFC,  # D
+    0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF,  # E
+    0xFF, 0xFF, 0xC0, 0xC0, 0xFF, 0xFF, 0xC0, 0xC0, 0xC0, 0xC0  # F
+)
+BIG_FONT_START = len(FONTS)
+
 PROGRAM_START = 0x200
+DEFAULT_PITCH = 64
+
+
+class StepHook:
+    """
+    Watches execution one instruction at a time, for profilers and the
+    debugger. While any hook is added, run steps single instructions instead
+    of running translated blocks, and calls every hook around each of them.
+    """
+    def before_step(self, pc: int) -> bool:
+        """Called before the instruction at pc, True stops the time slice without executing it."""
+        return False
+
+    def after_step(self, pc: int) -> bool:
+        """Called after the instruction at pc was executed, True ends the time slice."""
+        return False
 
 
 class InstructionInterpreter:
-    def __init__(self, screen: Screen, keyboard: HexKeyboard) -> None:
+    def __init__(self, screen: Framebuffer, keyboard: Keypad, seed: Optional[int] = None,
+                 wrap_memory: bool = False) -> None:
         # Allocate memory for all registers
         self.reg_v: list[int] = [0] * 16  # Vx where x is 0-15, 8.bit registers
         self.reg_i = 0  # 16-bit register
@@ -38,20 +80,108 @@ class InstructionInterpreter:
         self.program_counter = 0  # 16-bit PC
         self.stack: list[int] = [0] * 16  # 16-bit array
         self.stack_pointer = 0  # 8-bit
+        # Register waiting for a key press while Fx0A blocks execution
+        self.key_wait: Optional[int] = None
 
         # Memory is 0x000 - 0xFFF (4095). 0x000-0x1FF is reserved.
-        # Most programs start at 0x200
-        self.memory = bytearray(4096)
+        # Most programs start at 0x200. With wrap_memory, accesses past 0xFFF
+        # wrap around to 0x000 instead of raising IndexError.
+        self.memory = Memory(wrap=wrap_memory)
 
-        for i, byte in enumerate(FONTS):
-            self.memory[i] = byte
+        self.memory.store(0, bytes(FONTS))
+        self.memory.store(BIG_FONT_START, bytes(BIG_FONTS))
         logger.info("Fonts loaded in memory")
 
+        # SUPER-CHIP flag registers, kept over resets like the HP48 kept them
+        self.flags: list[int] = [0] * 16
+        # XO-CHIP sound, the buzzer is played until a pattern is loaded
+        self.audio_pattern: Optional[bytes] = None
+        self.pitch = DEFAULT_PITCH
+
         self.shift_quirks = False
+        # Cxkk draws from a generator of its own, seeded again on reset so
+        # that a run of a ROM can be reproduced from its seed
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
 
         self.screen = screen
         self.keyboard = keyboard
         self.rom_loaded = False
+
+        # Handler tables used by decode, indexed by the parts of the opcode
+        # that select the instruction within its group.
+        self.group_0_handlers: dict[int, Callable[[], None]] = {
+            0x00E0: self.clear_screen,
+            0x00EE: self.ret,
+            0x00FB: self.scroll_right,
+            0x00FC: self.scroll_left,
+            0x00FD: self.exit,
+            0x00FE: self.low_resolution,
+            0x00FF: self.high_resolution,
+        }
+        self.scroll_handlers: dict[int, Callable[[int], None]] = {
+            0x00C0: self.scroll_down,
+            0x00D0: self.scroll_up,
+        }
+        self.nnn_handlers: dict[int, Callable[[int], None]] = {
+            0x1: self.jump,
+            0x2: self.call,
+            0xA: self.set_index_to_nnn,
+            0xB: self.jump_with_offset,
+        }
+        self.xkk_handlers: dict[int, Callable[[int, int], None]] = {
+            0x3: self.skip_if_equal,
+            0x4: self.skip_if_not_equal,
+            0x6: self.set_vx_to_kk,
+            0x7: self.add_kk_to_vx,
+            0xC: self.random,
+        }
+        self.xy_handlers: dict[int, Callable[[int, int], None]] = {
+            0x5: self.skip_if_vx_equal_vy,
+            0x9: self.skip_if_vx_not_equal_vy,
+        }
+        self.range_handlers: dict[int, Callable[[int, int], None]] = {
+            0x2: self.save_range,
+            0x3: self.load_range,
+        }
+        self.group_8_handlers: dict[int, Callable[[int, int], None]] = {
+            0x0: self.load_vx_vy,
+            0x1: self.or_vx_vy,
+            0x2: self.and_vx_vy,
+            0x3: self.xor_vx_vy,
+            0x4: self.add_vx_vy,
+            0x5: self.sub_vx_vy,
+            0x6: self.shr_vx_vy,
+            0x7: self.subn_vx_vy,
+            0xE: self.shl_vx_vy,
+        }
+        self.group_e_handlers: dict[int, Callable[[int], None]] = {
+            0x9E: self.skip_if_key_pressed,
+            0xA1: self.skip_if_key_not_pressed,
+        }
+        self.group_f_handlers: dict[int, Callable[[int], None]] = {
+            0x01: self.select_planes,
+            0x02: self.load_audio_pattern,
+            0x07: self.load_vx_delay,
+            0x0A: self.wait_for_key,
+            0x15: self.load_delay_vx,
+            0x18: self.load_sound_vx,
+            0x1E: self.add_vx_to_index,
+            0x29: self.load_font_vx,
+            0x30: self.load_big_font_vx,
+            0x33: self.store_bcd_vx,
+            0x3A: self.set_pitch,
+            0x55: self.store_registers,
+            0x65: self.load_registers,
+            0x75: self.store_flags,
+            0x85: self.load_flags,
+        }
+        # Opcodes are decoded once, executing an instruction is then a single
+        # lookup and call of a handler with its operands already bound.
+        self.decoded = DecodeCache(self.decode)
+        # ROM code translated into Python functions, used by run
+        self.block_cache = BlockCache(self)
+        self.step_hooks: list[StepHook] = []
         logger.info("InstructionInterpreter initialized")
 
     def reset(self) -> None:
@@ -63,21 +193,49 @@ class InstructionInterpreter:
         self.program_counter = PROGRAM_START
         self.stack = [0] * 16
         self.stack_pointer = 0
+        self.key_wait = None
+        self.rng.seed(self.seed)
+        self.audio_pattern = None
+        self.pitch = DEFAULT_PITCH
+        self.screen.set_resolution(False)
+        self.screen.select_planes(1)
         self.screen.paused = False
 
     def next_instruction(self) -> int:
-        instruction = self.memory[self.program_counter] << 8
-        instruction += self.memory[self.program_counter + 1]
+        memory = self.memory
+        pc = self.program_counter
+        if pc + 1 < len(memory):
+            instruction = (memory[pc] << 8) | memory[pc + 1]
+        else:
+            # Wraps around to 000 or raises IndexError, like any other access
+            instruction = int.from_bytes(memory.load(pc, 2), "big")
         self.incr_pc()
         return instruction
 
     def load_rom(self, filename: str) -> None:
-        rom = open(filename, 'rb').read()
-        for i, val in enumerate(rom):
-            self.memory[PROGRAM_START + i] = val
+        with open(filename, 'rb') as f:
+            self.load_program(f.read())
+        logger.info(f"Loaded {filename} into memory")
+
+    def load_program(self, program: bytes) -> None:
+        """
+        Copy a program into memory at PROGRAM_START in one go, the rest of
+        memory after it is cleared so nothing is left of an earlier ROM.
+        """
+        size = len(self.memory) - PROGRAM_START
+        if len(program) > size:
+            raise ValueError(f"ROM of {len(program)} bytes does not fit in {size} bytes of memory")
+        self.block_cache.clear()
+        self.memory.store(PROGRAM_START, program + bytes(size - len(program)))
         self.program_counter = PROGRAM_START
         self.rom_loaded = True
-        logger.info(f"Loaded {filename} into memory")
+
+    def tick_timers(self) -> None:
+        # Timer and sound registers shall decrement if not 0 at a rate of 60 Hz
+        if self.reg_delay > 0:
+            self.reg_delay -= 1
+        if self.reg_sound > 0:
+            self.reg_sound -= 1
 
     def incr_pc(self) -> None:
         self.program_counter += 2
@@ -86,26 +244,189 @@ class InstructionInterpreter:
             logger.warning("program counter rollover")
             self.program_counter = 0
 
-    def interpret_group_0(self, instruction: int) -> None:
-        # 00E0 and 00EE, rest can be ignored.
-        if instruction == 0x00E0:  # CLS
-            self.screen.clear_all()
-        elif instruction == 0x00EE:  # RET
-            self.program_counter = self.stack[self.stack_pointer]
-            self.stack_pointer -= 1
-        else:
-            logger.warning(f"OpCode {instruction:X} not supported!")
+    def step(self) -> None:
+        """
+        Fetch and execute the instruction at the program counter.
+
+        Decoding is done once per distinct opcode, stepping is a single
+        lookup in the decode cache followed by a call to the bound handler.
+        """
+        self.decoded[self.next_instruction()]()
+
+    def run(self, cycles: int) -> None:
+        """
+        Execute the given number of instructions.
+
+        Runs translated blocks from the block cache, which gives the same
+        result as calling step once per cycle. While Fx0A waits for a key the
+        cycles pass without executing anything.
+        """
+        if self.step_hooks:
+            self.run_hooked(cycles)
+            return
+        if self.key_wait is not None and not self.end_key_wait():
+            return
+
+        blocks = self.block_cache.blocks
+        translate = self.block_cache.translate
+        while cycles > 0:
+            block = blocks.get(self.program_counter)
+            if block is None:
+                block = translate(self.program_counter)
+            cycles -= block(cycles)
+
+    def run_hooked(self, cycles: int) -> None:
+        """run, one instruction at a time with the step hooks called around each."""
+        hooks = self.step_hooks
+        for _ in range(cycles):
+            pc = self.program_counter
+            if any(hook.before_step(pc) for hook in hooks):
+                return
+            if self.key_wait is not None and not self.end_key_wait():
+                return
+            self.step()
+            # Every hook sees the instruction, even if an earlier one ends the slice
+            ended = [hook.after_step(pc) for hook in hooks]
+            if any(ended) or self.key_wait is not None:
+                return
+
+    def add_step_hook(self, hook: StepHook) -> None:
+        if hook not in self.step_hooks:
+            self.step_hooks.append(hook)
+
+    def remove_step_hook(self, hook: StepHook) -> None:
+        if hook in self.step_hooks:
+            self.step_hooks.remove(hook)
+
+    def decode(self, instruction: int) -> Callable[[], None]:
+        """
+        Look up the handler for an instruction and bind its operands.
+
+        The returned callable executes the instruction without any further
+        decoding, it is cached per opcode by DecodeCache.
+        """
+        x = (instruction & 0x0F00) >> 8
+        y = (instruction & 0x00F0) >> 4
+        kk = instruction & 0x00FF
+        nnn = instruction & 0x0FFF
+        group = instruction >> 12
+
+        if group == 0x0:
+            simple = self.group_0_handlers.get(instruction)
+            if simple is not None:
+                return simple
+            scroll = self.scroll_handlers.get(instruction & 0xFFF0)
+            if scroll is not None:
+                return partial(scroll, instruction & 0x000F)
+        elif group in (0x1, 0x2, 0xA, 0xB):
+            return partial(self.nnn_handlers[group], nnn)
+        elif group in (0x3, 0x4, 0x6, 0x7, 0xC):
+            return partial(self.xkk_handlers[group], x, kk)
+        elif group in (0x5, 0x9):
+            if instruction & 0x000F == 0x0:
+                return partial(self.xy_handlers[group], x, y)
+            if group == 0x5 and instruction & 0x000F in self.range_handlers:
+                return partial(self.range_handlers[instruction & 0x000F], x, y)
+        elif group == 0x8:
+            arithmetic = self.group_8_handlers.get(instruction & 0x000F)
+            if arithmetic is not None:
+                return partial(arithmetic, x, y)
+        elif group == 0xD:
+            return partial(self.draw, x, y, instruction & 0x000F)
+        elif group == 0xE:
+            key = self.group_e_handlers.get(kk)
+            if key is not None:
+                return partial(key, x)
+        elif group == 0xF:
+            misc = self.group_f_handlers.get(kk)
+            if misc is not None:
+                return partial(misc, x)
+
+        return partial(self.unsupported, instruction)
+
+    def unsupported(self, instruction: int) -> None:
+        logger.warning(f"OpCode {instruction:X} not supported!")
+
+    def clear_screen(self) -> None:
+        """
+        00E0 - CLS
+        Clear the display, only the planes selected with Fn01 in XO-CHIP.
+        """
+        self.screen.clear_selected()
 
-    def jump(self, instruction: int) -> None:
+    def ret(self) -> None:
+        """
+        00EE - RET
+        Return from a subroutine.
+
+        The interpreter sets the program counter to the address at the top
+        of the stack, then subtracts 1 from the stack pointer.
+        """
+        self.program_counter = self.stack[self.stack_pointer]
+        self.stack_pointer -= 1
+
+    def scroll_down(self, n: int) -> None:
+        """
+        00Cn - SCD nibble
+        Scroll the display down by n pixels.
+        """
+        self.screen.scroll_down(n)
+
+    def scroll_up(self, n: int) -> None:
+        """
+        00Dn - SCU nibble
+        Scroll the display up by n pixels, XO-CHIP.
+        """
+        self.screen.scroll_up(n)
+
+    def scroll_right(self) -> None:
+        """
+        00FB - SCR
+        Scroll the display right by 4 pixels.
+        """
+        self.screen.scroll_right()
+
+    def scroll_left(self) -> None:
+        """
+        00FC - SCL
+        Scroll the display left by 4 pixels.
+        """
+        self.screen.scroll_left()
+
+    def exit(self) -> None:
+        """
+        00FD - EXIT
+        Exit the interpreter.
+
+        The program stops here, the program counter is set back to this
+        instruction so that it runs forever.
+        """
+        self.program_counter -= 2
+
+    def low_resolution(self) -> None:
+        """
+        00FE - LOW
+        Disable extended screen mode, the display is 64x32 and cleared.
+        """
+        self.screen.set_resolution(False)
+
+    def high_resolution(self) -> None:
+        """
+        00FF - HIGH
+        Enable extended screen mode, the display is 128x64 and cleared.
+        """
+        self.screen.set_resolution(True)
+
+    def jump(self, nnn: int) -> None:
         """
         1nnn - JP addr
         Jump to location nnn.
 
         The interpreter sets the program counter to nnn.
         """
-        self.program_counter = instruction & 0x0FFF
+        self.program_counter = nnn
 
-    def call(self, instruction: int) -> None:
+    def call(self, nnn: int) -> None:
         """
         2nnn - CALL addr
         Call subroutine at nnn.
@@ -116,9 +437,9 @@ class InstructionInterpreter:
         """
         self.stack_pointer += 1
         self.stack[self.stack_pointer] = self.program_counter
-        self.program_counter = instruction & 0x0FFF
+        self.program_counter = nnn
 
-    def skip_if_equal(self, instruction: int) -> None:
+    def skip_if_equal(self, x: int, kk: int) -> None:
         """
         3xkk - SE Vx, byte
         Skip next instruction if Vx = kk.
@@ -126,12 +447,10 @@ class InstructionInterpreter:
         The interpreter compares register Vx to kk, and if
         they are equal, increments the program counter by 2.
         """
-        x = (instruction & 0x0F00) >> 8
-        kk = instruction & 0x00FF
         if self.reg_v[x] == kk:
             self.incr_pc()
 
-    def skip_if_not_equal(self, instruction: int) -> None:
+    def skip_if_not_equal(self, x: int, kk: int) -> None:
         """
         4xkk - SNE Vx, byte
         Skip next instruction if Vx != kk.
@@ -139,12 +458,10 @@ class InstructionInterpreter:
         The interpreter compares register Vx to kk, and if
         they are not equal, increments the program counter by 2.
         """
-        x = (instruction & 0x0F00) >> 8
-        kk = instruction & 0x00FF
         if self.reg_v[x] != kk:
             self.incr_pc()
 
-    def skip_if_vx_equal_vy(self, instruction: int) -> None:
+    def skip_if_vx_equal_vy(self, x: int, y: int) -> None:
         """
         5xy0 - SE Vx, Vy
         Skip next instruction if Vx = Vy.
@@ -152,88 +469,107 @@ class InstructionInterpreter:
         The interpreter compares register Vx to register Vy, and
         if they are equal, increments the program counter by 2.
         """
-        x = (instruction & 0x0F00) >> 8
-        y = (instruction & 0x00F0) >> 4
         if self.reg_v[x] == self.reg_v[y]:
             self.incr_pc()
 
-    def set_vx_to_kk(self, instruction: int) -> None:
+    def registers_between(self, x: int, y: int) -> range:
+        return range(x, y + 1) if x <= y else range(x, y - 1, -1)
+
+    def save_range(self, x: int, y: int) -> None:
+        """
+        5xy2 - SAVE Vx - Vy
+        Store registers Vx through Vy in memory starting at location I,
+        XO-CHIP. The registers are stored in reverse order if x > y, I is
+        not changed.
+        """
+        self.memory.store(self.reg_i, bytes(self.reg_v[register] for register in self.registers_between(x, y)))
+
+    def load_range(self, x: int, y: int) -> None:
+        """
+        5xy3 - LOAD Vx - Vy
+        Read registers Vx through Vy from memory starting at location I,
+        XO-CHIP. I is not changed.
+        """
+        registers = self.registers_between(x, y)
+        for register, value in zip(registers, self.memory.load(self.reg_i, len(registers))):
+            self.reg_v[register] = value
+
+    def set_vx_to_kk(self, x: int, kk: int) -> None:
         """
         6xkk - LD Vx, byte
         Set Vx = kk.
 
         The interpreter puts the value kk into register Vx.
         """
-        x = (instruction & 0x0F00) >> 8
-        kk = instruction & 0x00FF
         self.reg_v[x] = kk
 
-    def add_kk_to_vx(self, instruction: int) -> None:
+    def add_kk_to_vx(self, x: int, kk: int) -> None:
         """
         7xkk - ADD Vx, byte
         Set Vx = Vx + kk.
 
         Adds the value kk to the value of register Vx, then stores the result in Vx.
         """
-        x = (instruction & 0x0F00) >> 8
-        kk = instruction & 0x00FF
         self.reg_v[x] = (self.reg_v[x] + kk) & 0x00FF  # discard extra bits
 
-    def interpret_group_8(self, instruction: int) -> None:
-        # Logic and arithmetic operations between Vx and Vy
-        x = (instruction & 0x0F00) >> 8
-        y = (instruction & 0x00F0) >> 4
-        last_nibble = instruction & 0x000F
-
-        logger.debug(f"instruction:{instruction:X} x:{x:X}(0x{self.reg_v[x]:X})"
-                     f" y:{y:X}(0x{self.reg_v[y]:X})")
-        if last_nibble == 0x0:  # LD Vx, Vy
-            self.reg_v[x] = self.reg_v[y]
-        elif last_nibble == 0x1:  # OR Vx, Vy
-            self.reg_v[x] = self.reg_v[x] | self.reg_v[y]
-        elif last_nibble == 0x2:  # AND Vx, Vy
-            self.reg_v[x] = self.reg_v[x] & self.reg_v[y]
-        elif last_nibble == 0x3:  # XOR Vx, Vy
-            self.reg_v[x] = self.reg_v[x] ^ self.reg_v[y]
-        elif last_nibble == 0x4:  # ADD Vx, Vy
-            # Vf is used as carry
-            if self.reg_v[x] + self.reg_v[y] > 0xFF:
-                self.reg_v[0xF] = 1
-            else:
-                self.reg_v[0xF] = 0
-            self.reg_v[x] = (self.reg_v[x] + self.reg_v[y]) % 0x100
-        elif last_nibble == 0x5:  # SUB Vx, Vy
-            if self.reg_v[x] <= self.reg_v[y]:
-                tmp = self.reg_v[x] - self.reg_v[y]
-                self.reg_v[x] = 0x100 + tmp  # + since tmp is negative
-                self.reg_v[0xF] = 0
-            else:
-                self.reg_v[x] = self.reg_v[x] - self.reg_v[y]
-                self.reg_v[0xF] = 1
-        elif last_nibble == 0x6:  # SHR Vx {, Vy}
-            # Vf shall be set to same value as the bit that is shifted out
-            if self.shift_quirks:
-                self.reg_v[x] = self.reg_v[y]
-            self.reg_v[0xF] = self.reg_v[x] & 0x0001
-            self.reg_v[x] = self.reg_v[x] >> 1
-        elif last_nibble == 0x7:  # SUBN Vx, Vy
-            if self.reg_v[y] <= self.reg_v[x]:
-                tmp = self.reg_v[y] - self.reg_v[x]
-                self.reg_v[x] = 0x100 + tmp
-                self.reg_v[0xF] = 0
-            else:
-                self.reg_v[x] = self.reg_v[y] - self.reg_v[x]
-                self.reg_v[0xF] = 1
-        elif last_nibble == 0xE:  # SHL Vx {, Vy}
-            # Vf shall be set to same value as the bit that is shifted out
-            if self.shift_quirks:
-                self.reg_v[x] = self.reg_v[y]
-            self.reg_v[0xF] = (self.reg_v[x] & 0x80) >> 7
-            self.reg_v[x] = (self.reg_v[x] << 1) % 0x100
-        else:
-            logger.warning(f"OpCode {instruction:X} supported ")
-
-    def skip_if_vx_not_equal_vy(self, instruction: int) -> None:
+    # Logic and arithmetic operations between Vx and Vy, group 8
+    def load_vx_vy(self, x: int, y: int) -> None:
+        # 8xy0 - LD Vx, Vy
+        self.reg_v[x] = self.reg_v[y]
+
+    def or_vx_vy(self, x: int, y: int) -> None:
+        # 8xy1 - OR Vx, Vy
+        self.reg_v[x] = self.reg_v[x] | self.reg_v[y]
+
+    def and_vx_vy(self, x: int, y: int) -> None:
+        # 8xy2 - AND Vx, Vy
+        self.reg_v[x] = self.reg_v[x] & self.reg_v[y]
+
+    def xor_vx_vy(self, x: int, y: int) -> None:
+        # 8xy3 - XOR Vx, Vy
+        self.reg_v[x] = self.reg_v[x] ^ self.reg_v[y]
+
+    def add_vx_vy(self, x: int, y: int) -> None:
+        # 8xy4 - ADD Vx, Vy
+        # Vf is used as carry
+        reg_v = self.reg_v
+        reg_v[0xF] = 1 if reg_v[x] + reg_v[y] > 0xFF else 0
+        reg_v[x] = (reg_v[x] + reg_v[y]) & 0xFF
+
+    def sub_vx_vy(self, x: int, y: int) -> None:
+        # 8xy5 - SUB Vx, Vy
+        # Vf is set when there is no borrow
+        reg_v = self.reg_v
+        vx, vy = reg_v[x], reg_v[y]
+        reg_v[x] = (vx - vy) & 0xFF
+        reg_v[0xF] = 1 if vx > vy else 0
+
+    def shr_vx_vy(self, x: int, y: int) -> None:
+        # 8xy6 - SHR Vx {, Vy}
+        # Vf shall be set to same value as the bit that is shifted out
+        reg_v = self.reg_v
+        if self.shift_quirks:
+            reg_v[x] = reg_v[y]
+        reg_v[0xF] = reg_v[x] & 0x0001
+        reg_v[x] = reg_v[x] >> 1
+
+    def subn_vx_vy(self, x: int, y: int) -> None:
+        # 8xy7 - SUBN Vx, Vy
+        reg_v = self.reg_v
+        vx, vy = reg_v[x], reg_v[y]
+        reg_v[x] = (vy - vx) & 0xFF
+        reg_v[0xF] = 1 if vy > vx else 0
+
+    def shl_vx_vy(self, x: int, y: int) -> None:
+        # 8xyE - SHL Vx {, Vy}
+        # Vf shall be set to same value as the bit that is shifted out
+        reg_v = self.reg_v
+        if self.shift_quirks:
+            reg_v[x] = reg_v[y]
+        reg_v[0xF] = (reg_v[x] & 0x80) >> 7
+        reg_v[x] = (reg_v[x] << 1) & 0xFF
+
+    def skip_if_vx_not_equal_vy(self, x: int, y: int) -> None:
         """
         9xy0 - SNE Vx, Vy
         Skip next instruction if Vx != Vy.
@@ -241,32 +577,28 @@ class InstructionInterpreter:
         The values of Vx and Vy are compared, and if they are
         not equal, the program counter is increased by 2.
         """
-        x = (instruction & 0x0F00) >> 8
-        y = (instruction & 0x00F0) >> 4
         if self.reg_v[x] != self.reg_v[y]:
             self.incr_pc()
 
-    def set_index_to_nnn(self, instruction: int) -> None:
+    def set_index_to_nnn(self, nnn: int) -> None:
         """
         Annn - LD I, addr
         Set I = nnn.
 
         The value of register I is set to nnn.
         """
-        nnn = instruction & 0x0FFF
         self.reg_i = nnn
 
-    def jump_with_offset(self, instruction: int) -> None:
+    def jump_with_offset(self, nnn: int) -> None:
         """
         Bnnn - JP V0, addr
         Jump to location nnn + V0.
 
         The program counter is set to nnn plus the value of V0.
         """
-        nnn = instruction & 0x0FFF
         self.program_counter = nnn + self.reg_v[0x0]
 
-    def random(self, instruction: int) -> None:
+    def random(self, x: int, kk: int) -> None:
         """
         Cxkk - RND Vx, byte
         Set Vx = random byte AND kk.
@@ -274,132 +606,158 @@ class InstructionInterpreter:
         The interpreter generates a random number from 0 to 255, which is then
         ANDed with the value kk. The results are stored in Vx.
         """
-        x = (instruction & 0x0F00) >> 8
-        kk = instruction & 0x00FF
-        self.reg_v[x] = random.randint(0, 255) & kk
+        self.reg_v[x] = self.rng.randint(0, 255) & kk
 
-    def draw(self, instruction: int) -> None:
+    def draw(self, x: int, y: int, n: int) -> None:
         """
         Dxyn - DRW Vx, Vy, nibble
         Display n-byte sprite starting at memory location I
         at (Vx, Vy), set VF = collision.
+
+        Dxy0 displays a 16x16 sprite of 32 bytes, SUPER-CHIP. With more than
+        one XO-CHIP plane selected, the sprite of each plane follows the one
+        before it in memory.
         """
-        x = (instruction & 0x0F00) >> 8
-        y = (instruction & 0x00F0) >> 4
-        n = instruction & 0x000F
+        screen = self.screen
+        wide = n == 0
+        size = (32 if wide else n) * len(screen.selected)
+        sprite = self.memory.load(self.reg_i, size)
+        collision = screen.draw_sprite(self.reg_v[x], self.reg_v[y], sprite, wide)
+        self.reg_v[0xF] = 1 if collision else 0
+
+    def skip_if_key_pressed(self, x: int) -> None:
+        # Ex9E - SKP Vx
+        if self.keyboard.is_pressed(self.reg_v[x]):
+            self.incr_pc()
 
-        x_coord = self.reg_v[x] % 64
-        y_coord = self.reg_v[y] % 32
+    def skip_if_key_not_pressed(self, x: int) -> None:
+        # ExA1 - SKNP Vx
+        if not self.keyboard.is_pressed(self.reg_v[x]):
+            self.incr_pc()
 
-        self.reg_v[0xF] = 0
+    def select_planes(self, x: int) -> None:
+        """
+        Fn01 - PLANE n
+        Select the bitplanes that are drawn, cleared and scrolled, XO-CHIP.
+        """
+        self.screen.select_planes(x)
 
-        for row in range(n):
-            if y_coord > 31:
-                break
+    def load_audio_pattern(self, _: int) -> None:
+        """
+        F002 - AUDIO
+        Load the 16 byte audio pattern from memory at location I, XO-CHIP.
+        """
+        self.audio_pattern = bytes(self.memory.load(self.reg_i, 16))
 
-            sprite = self.memory[self.reg_i + row]
-            bits = format(sprite, "08b")
-            # bits = bin(sprite)[2:].zfill(8)
-            for i, bit in enumerate(bits):
-                if x_coord + i > 63:
-                    break
+    def load_vx_delay(self, x: int) -> None:
+        # Fx07 - LD Vx, DT
+        self.reg_v[x] = self.reg_delay
 
-                pixel = self.screen.get_pixel_state(x_coord + i, y_coord)
-                if bit == '1' and pixel:
-                    self.screen.clear_pixel(x_coord + i, y_coord)
-                    self.reg_v[0xF] = 1
-                elif bit == '1' and pixel is False:
-                    self.screen.set_pixel(x_coord + i, y_coord)
+    def wait_for_key(self, x: int) -> None:
+        """
+        Fx0A - LD Vx, K
+        Wait for a key press, store the value of the key in Vx.
 
-            y_coord += 1
+        All execution stops until a key is pressed, then the value
+        of that key is stored in Vx.
+        """
+        self.key_wait = x
+        self.end_key_wait()
 
-    def interpret_group_e(self, instruction: int) -> None:
-        x = (instruction & 0x0F00) >> 8
-        if instruction & 0x00FF == 0x9E:
-            # Ex9E - SKP Vx
-            if self.keyboard.is_pressed(self.reg_v[x]):
-                self.incr_pc()
-        elif instruction & 0x00FF == 0xA1:
-            # ExA1 - SKNP Vx
-            if not self.keyboard.is_pressed(self.reg_v[x]):
-                self.incr_pc()
-        else:
-            logger.warning(f"OpCode {instruction:X} is not supported ")
+    def end_key_wait(self) -> bool:
+        """
+        Complete a pending Fx0A if a key is held down, returns False if
+        execution is still blocked.
+        """
+        key = self.keyboard.lowest_pressed()
+        if key < 0:
+            return False
+        self.reg_v[self.key_wait] = key  # type: ignore
+        self.key_wait = None
+        return True
+
+    def load_delay_vx(self, x: int) -> None:
+        # Fx15 - LD DT, Vx
+        self.reg_delay = self.reg_v[x]
+
+    def load_sound_vx(self, x: int) -> None:
+        # Fx18 - LD ST, Vx
+        self.reg_sound = self.reg_v[x]
+
+    def add_vx_to_index(self, x: int) -> None:
+        # Fx1E - ADD I, Vx
+        self.reg_i = (self.reg_i + self.reg_v[x]) & 0xFFFF
+
+    def load_font_vx(self, x: int) -> None:
+        """
+        Fx29 - LD F, Vx
+        Set I = location of sprite for digit Vx.
 
-    def interpret_group_f(self, instruction: int) -> None:
-        x = (instruction & 0x0F00) >> 8
-        if instruction & 0xFF == 0x07:
-            # Fx07 - LD Vx, DT
-            self.reg_v[x] = self.reg_delay
-        elif instruction & 0xFF == 0x0A:
-            """
-            Fx0A - LD Vx, K
-            Wait for a key press, store the value of the key in Vx.
-
-            All execution stops until a key is pressed, then the value
-            of that key is stored in Vx.
-            """
-            for i in range(0x10):
-                if self.keyboard.is_pressed(i):
-                    self.reg_v[x] = i
-                    return
-            # Avoid continuing to next instruction until a key is pressed
-            self.program_counter -= 2
-        elif instruction & 0xFF == 0x15:
-            # Fx15 - LD DT, Vx
-            self.reg_delay = self.reg_v[x]
-        elif instruction & 0xFF == 0x18:
-            # Fx18 - LD ST, V
-            self.reg_sound = self.reg_v[x]
-        elif instruction & 0xFF == 0x1E:
-            # Fx1E ADD I, Vx
-            self.reg_i = (self.reg_i + self.reg_v[x]) & 0xFFFF
-        elif instruction & 0xFF == 0x29:
-            """
-            Fx29 - LD F, Vx
-            Set I = location of sprite for digit Vx.
-
-            The value of I is set to the location for the hexadecimal sprite
-            corresponding to the value of Vx.
-            """
-            # Digits are stored in memory 0, 5, 10 ...
-            self.reg_i = self.reg_v[x] * 5
-        elif instruction & 0xFF == 0x33:
-            """
-            Fx33 - LD B, Vx
-            Store BCD representation of Vx in memory locations I, I+1, and I+2.
-
-            The interpreter takes the decimal value of Vx, and places the
-            hundreds digit in memory at location in I, the tens digit at
-            location I+1, and the ones digit at location I+2.
-            """
-            digits = format(self.reg_v[x], "03d")
-            self.memory[self.reg_i] = int(digits[0])  # Hundreds digit
-            self.memory[self.reg_i + 1] = int(digits[1])  # Tens digit
-            self.memory[self.reg_i + 2] = int(digits[2])  # Ones digit
-
-        elif instruction & 0xFF == 0x55:
-            """
-            Fx55 - LD [I], Vx
-            Store registers V0 through Vx in memory starting at location I.
-
-            The interpreter copies the values of registers V0 through Vx into
-            memory, starting at the address in I.
-            """
-            for i in range(0, x + 1):
-                self.memory[self.reg_i + i] = self.reg_v[i]
-        elif instruction & 0xFF == 0x65:
-            """
-            Fx65 - LD Vx, [I]
-            Read registers V0 through Vx from memory starting at location I.
-
-            The interpreter reads values from memory starting at location I
-            into registers V0 through Vx.
-            """
-            for i in range(0, x + 1):
-                self.reg_v[i] = self.memory[self.reg_i + i]
-        else:
-            logger.warning(f"OpCode {instruction:X} not yet supported ")
+        The value of I is set to the location for the hexadecimal sprite
+        corresponding to the value of Vx.
+        """
+        # Digits are stored in memory 0, 5, 10 ...
+        self.reg_i = self.reg_v[x] * 5
+
+    def load_big_font_vx(self, x: int) -> None:
+        """
+        Fx30 - LD HF, Vx
+        Set I = location of the 8x10 sprite for digit Vx, SUPER-CHIP.
+        """
+        self.reg_i = BIG_FONT_START + (self.reg_v[x] & 0xF) * 10
+
+    def set_pitch(self, x: int) -> None:
+        """
+        Fx3A - PITCH Vx
+        Set the pitch of the audio pattern to Vx, XO-CHIP.
+        """
+        self.pitch = self.reg_v[x]
+
+    def store_bcd_vx(self, x: int) -> None:
+        """
+        Fx33 - LD B, Vx
+        Store BCD representation of Vx in memory locations I, I+1, and I+2.
+
+        The interpreter takes the decimal value of Vx, and places the
+        hundreds digit in memory at location in I, the tens digit at
+        location I+1, and the ones digit at location I+2.
+        """
+        value = self.reg_v[x]
+        self.memory.store(self.reg_i, bytes((value // 100, value // 10 % 10, value % 10)))
+
+    def store_registers(self, x: int) -> None:
+        """
+        Fx55 - LD [I], Vx
+        Store registers V0 through Vx in memory starting at location I.
+
+        The interpreter copies the values of registers V0 through Vx into
+        memory, starting at the address in I.
+        """
+        self.memory.store(self.reg_i, bytes(self.reg_v[:x + 1]))
+
+    def load_registers(self, x: int) -> None:
+        """
+        Fx65 - LD Vx, [I]
+        Read registers V0 through Vx from memory starting at location I.
+
+        The interpreter reads values from memory starting at location I
+        into registers V0 through Vx.
+        """
+        self.reg_v[:x + 1] = self.memory.load(self.reg_i, x + 1)
+
+    def store_flags(self, x: int) -> None:
+        """
+        Fx75 - LD R, Vx
+        Store V0 through Vx in the flag registers, SUPER-CHIP.
+        """
+        self.flags[:x + 1] = self.reg_v[:x + 1]
+
+    def load_flags(self, x: int) -> None:
+        """
+        Fx85 - LD Vx, R
+        Read V0 through Vx from the flag registers, SUPER-CHIP.
+        """
+        self.reg_v[:x + 1] = self.flags[:x + 1]
 
     def interpret_instruction(self, instruction: int) -> None:
         if instruction < 0x00:
@@ -411,51 +769,21 @@ class InstructionInterpreter:
                            f" using {instruction % 0x10000:X}")
             instruction %= 0x10000
 
-        if instruction & 0xF000 == 0x0000:
-            # Group 0 CLS, RET, SYS
-            self.interpret_group_0(instruction)
-        elif instruction & 0xF000 == 0x1000:
-            # JP
-            self.jump(instruction)
-        elif instruction & 0xF000 == 0x2000:
-            # CALL
-            self.call(instruction)
-        elif instruction & 0xF000 == 0x3000:
-            # SE
-            self.skip_if_equal(instruction)
-        elif instruction & 0xF000 == 0x4000:
-            # SNE
-            self.skip_if_not_equal(instruction)
-        elif instruction & 0xF000 == 0x5000:
-            # SE
-            self.skip_if_vx_equal_vy(instruction)
-        elif instruction & 0xF000 == 0x6000:
-            # LD (Vx, Byte)
-            self.set_vx_to_kk(instruction)
-        elif instruction & 0xF000 == 0x7000:
-            # ADD (Vx, Byte)
-            self.add_kk_to_vx(instruction)
-        elif instruction & 0xF000 == 0x8000:
-            # Arithmetic (Vx + Vy, Vx xor Vy etc.)
-            self.interpret_group_8(instruction)
-        elif instruction & 0xF000 == 0x9000:
-            # SNE
-            self.skip_if_vx_not_equal_vy(instruction)
-        elif instruction & 0xF000 == 0xA000:
-            # LD (Vx, Vy)
-            self.set_index_to_nnn(instruction)
-        elif instruction & 0xF000 == 0xB000:
-            # JP V0
-            self.jump_with_offset(instruction)
-        elif instruction & 0xF000 == 0xC000:
-            # RND
-            self.random(instruction)
-        elif instruction & 0xF000 == 0xD000:
-            # DRW
-            self.draw(instruction)
-        elif instruction & 0xF000 == 0xE000:
-            # SKP, SKNP
-            self.interpret_group_e(instruction)
-        elif instruction & 0xF000 == 0xF000:
-            # A lot of different LD variants + ADD (I, Vx)
-            self.interpret_group_f(instruction)
+        self.decoded[instruction]()
+
+
+class DecodeCache(dict):
+    """
+    Opcode to handler lookup, filled in the first time each opcode is seen.
+
+    A lookup of an opcode that has not been decoded yet calls decode and
+    stores the result, so every later lookup is a plain dict access.
+    """
+    def __init__(self, decode: Callable[[int], Callable[[], None]]) -> None:
+        super().__init__()
+        self.decode = decode
+
+    def __missing__(self, instruction: int) -> Callable[[], None]:
+        handler = self.decode(instruction)
+        self[instruction] = handler
+        return handler
@@ -0,0 +1,33 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+from src.log import logger
+
+
+class Keypad:
+    """
+    The 16 key CHIP-8 keypad, keys are pressed and released by whatever is
+    driving the emulator. Used as is when running headless and as the base
+    of HexKeyboard.
+
+    The state is a 16-bit mask where bit n is set while key n is held down.
+    """
+    def __init__(self) -> None:
+        self.state = 0
+        logger.info("Keypad initialized")
+
+    def press(self, hex_key: int) -> None:
+        self.state |= 1 << hex_key
+
+    def release(self, hex_key: int) -> None:
+        self.state &= ~(1 << hex_key)
+
+    def lowest_pressed(self) -> int:
+        """The lowest key that is held down, -1 if there is none."""
+        return (self.state & -self.state).bit_length() - 1
+
+    def is_pressed(self, hex_key: int) -> bool:
+        if hex_key > 0xF or hex_key < 0x0:
+            logger.error(f"Invalid key {hex_key:X}")
+            return False
+
+        return self.state & (1 << hex_key) != 0
@@ -0,0 +1,96 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Memory bus
+
+Memory is the 4K bytearray of the interpreter with bulk load and store on
+top. Reading single bytes, as instruction fetches do, is plain bytearray
+indexing and costs nothing extra. Instructions that move several bytes go
+through load and store, which copy one slice.
+
+An access that runs past the end of memory raises IndexError, or wraps
+around to address 0 if wrap is set.
+
+Write watches call back when a store touches a watched range. A map with one
+byte per address is kept of everything that is watched, so a store outside
+of all watches costs a single check of its slice of the map. Removed watches
+are only cleared from the map the next time a store hits it.
+"""
+from typing import Callable
+
+MEMORY_SIZE = 4096
+
+# Called with the range [start, end) that was written to
+WatchCallback = Callable[[int, int], None]
+
+
+class Watch:
+    def __init__(self, start: int, end: int, callback: WatchCallback) -> None:
+        self.start = start
+        self.end = end
+        self.callback = callback
+
+
+class Memory(bytearray):
+    def __init__(self, size: int = MEMORY_SIZE, wrap: bool = False) -> None:
+        super().__init__(size)
+        self.wrap = wrap
+        self.watches: set[Watch] = set()
+        self.watched = bytearray(size)
+        # Watches have been removed since the map was built
+        self.watched_stale = False
+
+    def spans(self, address: int, size: int) -> list[tuple[int, int]]:
+        """The ranges [start, end) of memory an access covers."""
+        length = len(self)
+        if 0 <= address and address + size <= length:
+            return [(address, address + size)]
+        if not self.wrap or size > length:
+            raise IndexError(f"Memory access of {size} bytes at {address:03X} is out of range")
+        address %= length
+        if address + size <= length:
+            return [(address, address + size)]
+        return [(address, length), (0, address + size - length)]
+
+    def load(self, address: int, size: int) -> bytearray:
+        if 0 <= address and address + size <= len(self):
+            return self[address:address + size]
+        data = bytearray()
+        for start, end in self.spans(address, size):
+            data += self[start:end]
+        return data
+
+    def store(self, address: int, data: bytes) -> None:
+        end = address + len(data)
+        if 0 <= address and end <= len(self):
+            self[address:end] = data
+            self.notify(address, end)
+            return
+        offset = 0
+        for start, end in self.spans(address, len(data)):
+            self[start:end] = data[offset:offset + end - start]
+            offset += end - start
+            self.notify(start, end)
+
+    def notify(self, start: int, end: int) -> None:
+        """Call the watches of [start, end), for writes that bypass store."""
+        if not any(self.watched[start:end]):
+            return
+        hits = [watch for watch in self.watches if watch.start < end and start < watch.end]
+        for watch in hits:
+            watch.callback(start, end)
+        if self.watched_stale:
+            self.watched = bytearray(len(self))
+            for watch in self.watches:
+                self.watched[watch.start:watch.end] = b"\x01" * (watch.end - watch.start)
+            self.watched_stale = False
+
+    def watch(self, start: int, end: int, callback: WatchCallback) -> Watch:
+        watch = Watch(start, end, callback)
+        self.watches.add(watch)
+        self.watched[start:end] = b"\x01" * (end - start)
+        return watch
+
+    def unwatch(self, watch: Watch) -> None:
+        self.watches.discard(watch)
+        self.watched_stale = True
@@ -0,0 +1,120 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Opcode profiler
+
+Counts executions and host time per opcode family, 8xy4, Fx33, Dxyn and so
+on. Nothing in the interpreter checks for the profiler: attach replaces the
+decode cache with one whose handlers are wrapped with timing, and adds the
+profiler as a step hook so that instructions run one at a time, since
+translated blocks inline most instructions. detach puts the original decode
+cache back.
+"""
+import json
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Union
+
+from src.instruction_interpreter import DecodeCache, InstructionInterpreter, StepHook
+from src.log import logger
+
+
+def opcode_family(instruction: int) -> str:
+    """Opcode pattern of an instruction in the notation of Cowgod's reference."""
+    group = instruction >> 12
+    if group == 0x0:
+        if instruction in (0x00E0, 0x00EE, 0x00FB, 0x00FC, 0x00FD, 0x00FE, 0x00FF):
+            return f"{instruction:04X}"
+        if instruction & 0xFFE0 == 0x00C0:
+            return f"00{instruction >> 4 & 0xF:X}n"
+        return "0nnn"
+    if group in (0x1, 0x2, 0xA, 0xB):
+        return f"{group:X}nnn"
+    if group in (0x3, 0x4, 0x6, 0x7, 0xC):
+        return f"{group:X}xkk"
+    if group in (0x5, 0x9):
+        return f"{group:X}xy{instruction & 0x000F:X}"
+    if group == 0x8:
+        return f"8xy{instruction & 0x000F:X}"
+    if group == 0xD:
+        return "Dxyn"
+    return f"{group:X}x{instruction & 0x00FF:02X}"
+
+
+@dataclass
+class OpcodeStats:
+    handler: str
+    count: int = 0
+    seconds: float = 0.0
+
+
+class OpcodeProfiler(StepHook):
+    def __init__(self, ii: InstructionInterpreter) -> None:
+        self.ii = ii
+        self.stats: dict[str, OpcodeStats] = {}
+        self.original_decoded = ii.decoded
+        self.attached = False
+
+    def attach(self) -> None:
+        if self.attached:
+            return
+        self.ii.decoded = DecodeCache(self.decode)
+        self.ii.add_step_hook(self)
+        self.attached = True
+        logger.info("Opcode profiler attached")
+
+    def detach(self) -> None:
+        if not self.attached:
+            return
+        self.ii.decoded = self.original_decoded
+        self.ii.remove_step_hook(self)
+        self.attached = False
+
+    def decode(self, instruction: int) -> Callable[[], None]:
+        handler = self.original_decoded[instruction]
+        family = opcode_family(instruction)
+        if family not in self.stats:
+            self.stats[family] = OpcodeStats(getattr(handler, "func", handler).__name__)
+        stats = self.stats[family]
+        perf_counter = time.perf_counter
+
+        def profiled() -> None:
+            start = perf_counter()
+            handler()
+            stats.seconds += perf_counter() - start
+            stats.count += 1
+        return profiled
+
+    def reset(self) -> None:
+        for stats in self.stats.values():
+            stats.count = 0
+            stats.seconds = 0.0
+
+    def results(self) -> dict[str, OpcodeStats]:
+        """Stats per opcode family, the most time consuming first."""
+        ordered = sorted(self.stats.items(), key=lambda item: item[1].seconds, reverse=True)
+        return {family: stats for family, stats in ordered if stats.count > 0}
+
+    def format_table(self) -> str:
+        results = self.results()
+        total_count = sum(r.count for r in results.values()) or 1
+        total_time = sum(r.seconds for r in results.values()) or 1.0
+        lines = [f"{'opcode':<8} {'handler':<26} {'count':>12} {'count %':>8} "
+                 f"{'time ms':>10} {'time %':>7} {'ns/op':>8}"]
+        for family, r in results.items():
+            lines.append(f"{family:<8} {r.handler:<26} {r.count:>12} "
+                         f"{r.count / total_count:>8.1%} {r.seconds * 1e3:>10.2f} "
+                         f"{r.seconds / total_time:>7.1%} {r.seconds / r.count * 1e9:>8.0f}")
+        return "\n".join(lines)
+
+    def write_json(self, filename: Union[str, Path]) -> None:
+        opcodes = {family: asdict(stats) for family, stats in self.results().items()}
+        with open(filename, "w") as f:
+            json.dump({"opcodes": opcodes}, f, indent=2)
+        logger.info(f"Wrote opcode profile to {filename}")
+
+    def report(self, filename: Union[str, Path]) -> None:
+        """Print the table and write the results to filename."""
+        print(self.format_table())
+        self.write_json(filename)
@@ -0,0 +1,147 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Recording and replay of sessions
+
+The only inputs of a session are the keypad and the seed of Cxkk, so a
+session is reproduced exactly by starting the ROM with the same seed, CPU
+rate and quirks and changing the keypad state at the same emulated cycles.
+
+The recorder and the player are slice hooks of the scheduler. The recorder
+notes the keypad state at the start of every time slice if it changed, the
+player ends the time slices at the recorded cycles and sets the keypad state
+there. With both attached, the player has to be attached first for the
+recorder to see the replayed input.
+
+File layout, little endian:
+    magic            4 bytes  b"KC8R"
+    version          uint16
+    CPU rate         float64
+    seed             uint32
+    shift quirks     uint8
+    ROM              20 bytes, SHA-1 of the ROM file
+    events           cycle uint64 and keypad state uint16 each, the last
+                     event marks the end of the session
+"""
+import hashlib
+import struct
+from pathlib import Path
+from typing import Union
+
+from src.instruction_interpreter import InstructionInterpreter
+from src.keypad import Keypad
+from src.log import logger
+from src.scheduler import Scheduler, SliceHook
+
+MAGIC = b"KC8R"
+VERSION = 1
+HEADER = struct.Struct("<4sHdIB20s")
+EVENT = struct.Struct("<QH")
+
+
+def rom_digest(filename: Union[str, Path]) -> bytes:
+    return hashlib.sha1(Path(filename).read_bytes()).digest()
+
+
+class Recording:
+    def __init__(self, cpu_rate: float, seed: int, shift_quirks: bool, rom_sha1: bytes) -> None:
+        # Checked here rather than when the file is written at the end of the session
+        if not 0 <= seed < 2 ** 32:
+            raise ValueError(f"Seed {seed} does not fit in a recording, it must be from 0 to {2 ** 32 - 1}")
+        self.cpu_rate = cpu_rate
+        self.seed = seed
+        self.shift_quirks = shift_quirks
+        self.rom_sha1 = rom_sha1
+        # Emulated cycle and the keypad state from that cycle on
+        self.events: list[tuple[int, int]] = []
+
+    @property
+    def end_cycle(self) -> int:
+        return self.events[-1][0] if self.events else 0
+
+    def write(self, filename: Union[str, Path]) -> None:
+        data = bytearray(HEADER.pack(MAGIC, VERSION, self.cpu_rate, self.seed,
+                                     self.shift_quirks, self.rom_sha1))
+        for event in self.events:
+            data += EVENT.pack(*event)
+        Path(filename).write_bytes(data)
+        logger.info(f"Wrote {len(self.events)} input events to {filename}")
+
+    @classmethod
+    def read(cls, filename: Union[str, Path]) -> "Recording":
+        data = Path(filename).read_bytes()
+        if len(data) < HEADER.size or data[:4] != MAGIC:
+            raise ValueError("Not a kanzchip-8 recording")
+        _, version, cpu_rate, seed, shift_quirks, rom_sha1 = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError(f"Unsupported recording version {version}")
+        recording = cls(cpu_rate, seed, bool(shift_quirks), rom_sha1)
+        recording.events = list(EVENT.iter_unpack(data[HEADER.size:]))
+        return recording
+
+
+class ReplayHook(SliceHook):
+    def __init__(self, scheduler: Scheduler[InstructionInterpreter]) -> None:
+        self.scheduler = scheduler
+
+    def attach(self) -> None:
+        self.scheduler.add_slice_hook(self)
+
+    def detach(self) -> None:
+        self.scheduler.remove_slice_hook(self)
+
+
+class InputRecorder(ReplayHook):
+    def __init__(self, scheduler: Scheduler[InstructionInterpreter], keypad: Keypad, rom_sha1: bytes) -> None:
+        super().__init__(scheduler)
+        ii = scheduler.ii
+        self.keypad = keypad
+        self.recording = Recording(scheduler.cpu_rate, ii.seed, ii.shift_quirks, rom_sha1)
+        self.last_state = -1
+
+    def before_slice(self, cycle: int, end: int) -> int:
+        state = self.keypad.state
+        if state != self.last_state:
+            self.recording.events.append((cycle, state))
+            self.last_state = state
+        return end
+
+    def save(self, filename: Union[str, Path]) -> None:
+        """Write the recording, ending it at the current cycle."""
+        self.recording.events.append((self.scheduler.cycles, self.keypad.state))
+        self.recording.write(filename)
+        self.recording.events.pop()
+
+
+class InputPlayer(ReplayHook):
+    def __init__(self, scheduler: Scheduler[InstructionInterpreter], keypad: Keypad, recording: Recording) -> None:
+        super().__init__(scheduler)
+        self.keypad = keypad
+        self.recording = recording
+        self.index = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.scheduler.cycles >= self.recording.end_cycle
+
+    def configure(self, rom_sha1: bytes) -> None:
+        """
+        Set up the interpreter and scheduler like they were when recording,
+        call before the ROM is reset.
+        """
+        ii = self.scheduler.ii
+        recording = self.recording
+        if rom_sha1 != recording.rom_sha1:
+            logger.warning("The ROM is not the one that was recorded, the replay will differ")
+        ii.seed = recording.seed
+        ii.shift_quirks = recording.shift_quirks
+        self.scheduler.set_cpu_rate(recording.cpu_rate)
+
+    def before_slice(self, cycle: int, end: int) -> int:
+        events = self.recording.events
+        while self.index < len(events) and events[self.index][0] <= cycle:
+            self.keypad.state = events[self.index][1]
+            self.index += 1
+        if self.index < len(events):
+            return min(end, events[self.index][0])
+        return end
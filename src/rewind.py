@@ -0,0 +1,76 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Rewind history
+
+The state is captured with save_state once per frame. Only the newest state
+is kept in full, every older frame is stored as the XOR of a state and the
+one before it, compressed with zlib. Consecutive frames differ in a few
+bytes, so the XOR is mostly zeros and compresses to tens of bytes.
+Rewinding one frame applies the newest delta to the newest state.
+"""
+import time
+import zlib
+from collections import deque
+from typing import Optional
+
+from src.instruction_interpreter import InstructionInterpreter
+from src.scheduler import Scheduler
+from src.save_state import STATE_SIZE, load_state, save_state
+
+
+def xor(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(STATE_SIZE, "little")
+
+
+class RewindBuffer:
+    def __init__(self, max_frames: int = 600, max_bytes: int = 16 * 1024 * 1024) -> None:
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.deltas: deque[bytes] = deque()
+        self.delta_bytes = 0
+        self.current: Optional[bytes] = None
+        self.scratch = bytearray(STATE_SIZE)
+
+        self.captures = 0
+        self.capture_time = 0.0
+
+    def __len__(self) -> int:
+        """Number of frames that can be rewound."""
+        return len(self.deltas)
+
+    def clear(self) -> None:
+        self.deltas.clear()
+        self.delta_bytes = 0
+        self.current = None
+
+    def capture(self, ii: InstructionInterpreter,
+                scheduler: Optional[Scheduler[InstructionInterpreter]] = None) -> None:
+        start = time.perf_counter()
+        state = bytes(save_state(ii, self.scratch, scheduler))
+        if self.current is not None and self.max_frames > 0:
+            delta = zlib.compress(xor(state, self.current), 1)
+            self.deltas.append(delta)
+            self.delta_bytes += len(delta)
+            while len(self.deltas) > self.max_frames or self.delta_bytes > self.max_bytes:
+                self.delta_bytes -= len(self.deltas.popleft())
+        self.current = state
+
+        self.capture_time += time.perf_counter() - start
+        self.captures += 1
+
+    def rewind(self, ii: InstructionInterpreter,
+               scheduler: Optional[Scheduler[InstructionInterpreter]] = None) -> bool:
+        """Go back one frame, returns False if there is no history left."""
+        if not self.deltas or self.current is None:
+            return False
+        delta = self.deltas.pop()
+        self.delta_bytes -= len(delta)
+        self.current = xor(self.current, zlib.decompress(delta))
+        load_state(ii, self.current, scheduler)
+        return True
+
+    def stats(self) -> str:
+        average = self.capture_time / self.captures * 1e6 if self.captures else 0.0
+        return (f"{len(self.deltas)} frames, {self.delta_bytes / 1024:.1f} KiB, "
+                f"capture {average:.0f} us")
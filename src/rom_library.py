@@ -0,0 +1,182 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+ROM library
+
+The ROMs in a set of directories, indexed by the SHA-1 of their content. The
+index is kept in a JSON file with the title, size and notes of every ROM and
+the settings it should run with, so the settings follow a ROM that is
+renamed or moved. A file is only read and hashed again when its size or
+modification time changed since the index was written.
+
+Notes are read from a .txt file next to the ROM with the same name. The
+content of a ROM is cached after it is first loaded, switching to it again
+is a copy of a few kilobytes into memory.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Optional, Sequence, Union
+
+from src.log import logger
+
+INDEX_FILE = Path("roms") / "library.json"
+INDEX_VERSION = 1
+ROM_SUFFIXES = (".ch8", ".c8", ".sc8", ".xo8")
+
+
+class RomEntry:
+    def __init__(self, sha1: str, path: Path, size: int, mtime: float, title: str,
+                 notes: str = "", cpu_rate: Optional[float] = None,
+                 shift_quirks: Optional[bool] = None) -> None:
+        self.sha1 = sha1
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.title = title
+        self.notes = notes
+        # Settings of the ROM, None runs it with the defaults
+        self.cpu_rate = cpu_rate
+        self.shift_quirks = shift_quirks
+
+    @property
+    def has_settings(self) -> bool:
+        return self.cpu_rate is not None or self.shift_quirks is not None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"path": str(self.path), "size": self.size, "mtime": self.mtime,
+                "title": self.title, "notes": self.notes,
+                "cpu_rate": self.cpu_rate, "shift_quirks": self.shift_quirks}
+
+    @classmethod
+    def from_dict(cls, sha1: str, data: dict[str, Any]) -> "RomEntry":
+        return cls(sha1, Path(data["path"]), data["size"], data["mtime"], data["title"],
+                   data.get("notes", ""), data.get("cpu_rate"), data.get("shift_quirks"))
+
+
+def read_entry(path: Path, sha1: Optional[str] = None) -> RomEntry:
+    """Entry of a ROM file, the file is hashed unless sha1 is given."""
+    stat = path.stat()
+    if sha1 is None:
+        sha1 = hashlib.sha1(path.read_bytes()).hexdigest()
+    notes_file = path.with_suffix(".txt")
+    notes = notes_file.read_text(errors="replace") if notes_file.is_file() else ""
+    return RomEntry(sha1, path, stat.st_size, stat.st_mtime, path.stem, notes)
+
+
+class RomLibrary:
+    def __init__(self, directories: Sequence[Union[str, Path]] = ("roms",),
+                 index_file: Union[str, Path] = INDEX_FILE) -> None:
+        self.directories = [Path(directory) for directory in directories]
+        self.index_file = Path(index_file)
+        self.entries: dict[str, RomEntry] = {}
+        # Hashes of the ROMs found by the last scan
+        self.found: set[str] = set()
+        self.programs: dict[str, bytes] = {}
+        self.changed = False
+
+    def load(self) -> None:
+        """Read the index file, a missing or broken index is rebuilt by scan."""
+        try:
+            data = json.loads(self.index_file.read_text())
+            if data.get("version") != INDEX_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            self.entries = {sha1: RomEntry.from_dict(sha1, entry) for sha1, entry in data["roms"].items()}
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not read ROM index {self.index_file}: {e}")
+
+    def scan(self) -> None:
+        """Find the ROMs in the directories and update the index."""
+        known = {(entry.path, entry.size, entry.mtime): entry for entry in self.entries.values()}
+        found: dict[str, RomEntry] = {}
+        for directory in self.directories:
+            if not directory.is_dir():
+                logger.warning(f"ROM directory {directory} does not exist")
+                continue
+            for path in sorted(directory.rglob("*")):
+                if path.suffix.lower() not in ROM_SUFFIXES or not path.is_file():
+                    continue
+                stat = path.stat()
+                old = known.get((path, stat.st_size, stat.st_mtime))
+                try:
+                    entry = read_entry(path, old.sha1 if old is not None else None)
+                except OSError as e:
+                    logger.warning(f"Could not read ROM {path}: {e}")
+                    continue
+                if entry.sha1 in found:
+                    # Copies of the same ROM share an entry
+                    continue
+                previous = self.entries.get(entry.sha1)
+                if previous is not None:
+                    entry.cpu_rate = previous.cpu_rate
+                    entry.shift_quirks = previous.shift_quirks
+                    if previous.to_dict() != entry.to_dict():
+                        self.changed = True
+                else:
+                    self.changed = True
+                found[entry.sha1] = entry
+
+        # Settings are kept for ROMs that are gone, in case they come back
+        for sha1, entry in self.entries.items():
+            if sha1 not in found:
+                if entry.has_settings:
+                    found[sha1] = entry
+                else:
+                    self.changed = True
+        self.found = {sha1 for sha1, entry in found.items() if entry.path.is_file()}
+        self.entries = found
+        logger.info(f"Found {len(self.found)} ROM(s) in {', '.join(map(str, self.directories))}")
+
+    def save(self) -> None:
+        """Write the index file if anything changed."""
+        if not self.changed:
+            return
+        data = {"version": INDEX_VERSION,
+                "roms": {sha1: entry.to_dict() for sha1, entry in sorted(self.entries.items())}}
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            self.index_file.write_text(json.dumps(data, indent=1) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write ROM index {self.index_file}: {e}")
+            return
+        self.changed = False
+
+    def roms(self) -> list[RomEntry]:
+        """The ROMs found by the last scan, sorted by title."""
+        return sorted((self.entries[sha1] for sha1 in self.found), key=lambda entry: entry.title.lower())
+
+    def add(self, path: Union[str, Path]) -> RomEntry:
+        """Entry of a ROM file that may be outside the directories."""
+        entry = read_entry(Path(path))
+        previous = self.entries.get(entry.sha1)
+        if previous is not None and previous.sha1 in self.found:
+            return previous
+        if previous is not None:
+            entry.cpu_rate = previous.cpu_rate
+            entry.shift_quirks = previous.shift_quirks
+        self.entries[entry.sha1] = entry
+        self.found.add(entry.sha1)
+        self.changed = True
+        return entry
+
+    def program(self, entry: RomEntry) -> bytes:
+        """The content of a ROM, read from disk the first time."""
+        program = self.programs.get(entry.sha1)
+        if program is None:
+            program = entry.path.read_bytes()
+            if hashlib.sha1(program).hexdigest() != entry.sha1:
+                logger.warning(f"{entry.path} changed since it was indexed")
+            self.programs[entry.sha1] = program
+        return program
+
+    def set_settings(self, entry: RomEntry, **settings: Any) -> None:
+        """Store settings of a ROM, cpu_rate or shift_quirks, and save the index."""
+        for name, value in settings.items():
+            if name not in ("cpu_rate", "shift_quirks"):
+                raise ValueError(f"Unknown ROM setting {name}")
+            if getattr(entry, name) != value:
+                setattr(entry, name, value)
+                self.changed = True
+        self.save()
@@ -0,0 +1,138 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Save states
+
+A save state is the complete machine state in a fixed binary layout, packed
+into or unpacked from a buffer with a single struct call. Files are read
+through mmap, so loading a state at startup only touches the pages it needs.
+
+Layout, little endian:
+    magic            4 bytes  b"KC8S"
+    version          uint16
+    V0-VF            16 bytes
+    I                uint16
+    delay timer      uint8
+    sound timer      uint8
+    program counter  uint16
+    stack pointer    int8
+    shift quirks     uint8
+    key wait         int8, register Fx0A is waiting with or -1
+    hires            uint8
+    plane mask       uint8
+    pitch            uint8
+    audio pattern    uint8, 1 if the next 16 bytes are loaded
+                     16 bytes
+    flags            16 bytes, the SUPER-CHIP flag registers
+    stack            16 x uint16
+    memory           4096 bytes
+    display          2 planes x 64 rows x 16 bytes, rows of 64 pixels in the
+                     low 8 bytes and only the first 32 rows used in low
+                     resolution
+    random state     625 x uint32, the Mersenne Twister state behind Cxkk
+    timer phase      uint8, 1 if saved with a scheduler
+                     CPU rate float64, budget float64, cycles since the tick
+                     origin int64, ticks since the origin uint32, cycles to
+                     the next tick int32
+
+The timer phase is counted from the current cycle, so a state continues the
+same in a scheduler that has run for any number of cycles. It is only saved
+and restored when a scheduler is given.
+"""
+import mmap
+import struct
+from pathlib import Path
+from typing import Optional, Union
+
+from src.framebuffer import HIRES_HEIGHT, HIRES_WIDTH, PLANES
+from src.instruction_interpreter import InstructionInterpreter
+from src.log import logger
+from src.scheduler import Scheduler
+
+MAGIC = b"KC8S"
+VERSION = 4
+ROW_BYTES = HIRES_WIDTH // 8
+PLANE_BYTES = HIRES_HEIGHT * ROW_BYTES
+STATE = struct.Struct(f"<4sH16sHBBHbBbBBBB16s16s16H4096s{PLANES * PLANE_BYTES}s625IBddqIi")
+STATE_SIZE = STATE.size
+NO_PHASE = (0.0, 0.0, 0, 0, 0)
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+def save_state(ii: InstructionInterpreter, buffer: Union[bytearray, memoryview, None] = None,
+               scheduler: Optional[Scheduler[InstructionInterpreter]] = None) -> bytearray:
+    """
+    Pack the state of the interpreter and its display into buffer, a new
+    buffer is allocated if none is given. Returns the buffer.
+    """
+    if buffer is None:
+        buffer = bytearray(STATE_SIZE)
+    screen = ii.screen
+    padding = bytes(PLANE_BYTES - screen.height * ROW_BYTES)
+    display = b"".join(b"".join(row.to_bytes(ROW_BYTES, "big") for row in plane) + padding
+                       for plane in screen.planes)
+    STATE.pack_into(buffer, 0, MAGIC, VERSION, bytes(ii.reg_v), ii.reg_i,
+                    ii.reg_delay, ii.reg_sound, ii.program_counter, ii.stack_pointer,
+                    ii.shift_quirks, -1 if ii.key_wait is None else ii.key_wait,
+                    screen.hires, screen.plane_mask, ii.pitch, ii.audio_pattern is not None,
+                    ii.audio_pattern or bytes(16), bytes(ii.flags),
+                    *ii.stack, ii.memory, display, *ii.rng.getstate()[1],
+                    scheduler is not None, *(scheduler.phase() if scheduler else NO_PHASE))
+    return buffer  # type: ignore
+
+
+def load_state(ii: InstructionInterpreter, buffer: Buffer,
+               scheduler: Optional[Scheduler[InstructionInterpreter]] = None) -> None:
+    if len(buffer) < STATE_SIZE or buffer[:4] != MAGIC:
+        raise ValueError("Not a kanzchip-8 save state")
+    values = STATE.unpack_from(buffer)
+    if values[1] != VERSION:
+        raise ValueError(f"Unsupported save state version {values[1]}")
+
+    (_, _, reg_v, ii.reg_i, ii.reg_delay, ii.reg_sound, ii.program_counter,
+     ii.stack_pointer, shift_quirks, key_wait, hires, plane_mask, ii.pitch,
+     has_audio_pattern, audio_pattern, flags) = values[:16]
+    ii.reg_v = list(reg_v)
+    ii.shift_quirks = bool(shift_quirks)
+    ii.key_wait = None if key_wait < 0 else key_wait
+    ii.audio_pattern = audio_pattern if has_audio_pattern else None
+    ii.flags = list(flags)
+    ii.stack = list(values[16:32])
+    # Through store, so that memory watches see the new contents
+    ii.memory.store(0, values[32])
+
+    screen = ii.screen
+    screen.set_resolution(bool(hires))
+    screen.select_planes(plane_mask)
+    display = values[33]
+    screen.planes = [[int.from_bytes(display[start:start + ROW_BYTES], "big")
+                      for start in range(offset, offset + screen.height * ROW_BYTES, ROW_BYTES)]
+                     for offset in range(0, PLANES * PLANE_BYTES, PLANE_BYTES)]
+    # set_resolution redrew the cleared display, the loaded one has to be presented
+    screen.redraw_all()
+
+    # Cxkk does not use the Gaussian value random keeps between calls
+    ii.rng.setstate((3, values[34:659], None))
+    has_phase = values[659]
+    if has_phase and scheduler is not None:
+        scheduler.set_phase(*values[660:665])
+    # Translated code may not match the memory that was loaded
+    ii.block_cache.clear()
+    ii.rom_loaded = True
+
+
+def write_state_file(ii: InstructionInterpreter, filename: Union[str, Path],
+                     scheduler: Optional[Scheduler[InstructionInterpreter]] = None) -> None:
+    path = Path(filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(save_state(ii, scheduler=scheduler))
+    logger.info(f"Saved state to {path}")
+
+
+def read_state_file(ii: InstructionInterpreter, filename: Union[str, Path],
+                    scheduler: Optional[Scheduler[InstructionInterpreter]] = None) -> None:
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as state:
+            load_state(ii, state, scheduler)
+    logger.info(f"Loaded state from {filename}")
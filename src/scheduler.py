@@ -0,0 +1,162 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Cycle scheduler
+
+Keeps the emulated clock: how many instructions have run and when the 60 Hz
+delay and sound timers tick. The timers tick every cpu_rate / 60 instructions
+of emulated time, so any CPU rate works and the timers stay exact no matter
+how the instructions are split into time slices.
+
+advance is called with the host time that has passed, the fraction of an
+instruction that does not fit is carried over to the next call. A late frame
+is caught up on, but by no more than max_catch_up seconds.
+
+The scheduler drives anything with run and tick_timers, the interpreter or
+VectorVM. Slice hooks are called before every run of instructions between
+timer ticks and can end it early at a cycle of their choosing, the input
+recorder and player use them.
+"""
+import math
+from typing import Generic, Protocol, TypeVar
+
+from src.log import logger
+
+TIMER_RATE = 60  # Hz
+
+
+class Machine(Protocol):
+    def run(self, cycles: int) -> None:
+        ...
+
+    def tick_timers(self) -> None:
+        ...
+
+
+MachineType = TypeVar("MachineType", bound=Machine)
+
+
+class SliceHook:
+    """
+    Called by run_cycles before each slice of instructions, in the order the
+    hooks were added.
+    """
+    def before_slice(self, cycle: int, end: int) -> int:
+        """
+        Called before running the instructions from cycle up to end, returns
+        the cycle to end the slice at instead, after cycle and no later than
+        end.
+        """
+        return end
+
+
+class Scheduler(Generic[MachineType]):
+    def __init__(self, ii: MachineType, cpu_rate: float = 600.0,
+                 max_catch_up: float = 5 / TIMER_RATE) -> None:
+        self.ii = ii
+        self.max_catch_up = max_catch_up
+        self.cycles = 0  # Instructions run, the emulated clock
+        self.timer_ticks = 0
+        self.budget = 0.0  # Fraction of an instruction carried to the next advance
+        self.cpu_rate = cpu_rate
+        self.cycles_per_tick = cpu_rate / TIMER_RATE
+        # Timer ticks are due at tick_origin + ceil(n * cycles_per_tick)
+        self.tick_origin = 0
+        self.ticks_since_origin = 0
+        self.next_tick = 0
+        self.slice_hooks: list[SliceHook] = []
+
+    def add_slice_hook(self, hook: SliceHook) -> None:
+        if hook not in self.slice_hooks:
+            self.slice_hooks.append(hook)
+
+    def remove_slice_hook(self, hook: SliceHook) -> None:
+        if hook in self.slice_hooks:
+            self.slice_hooks.remove(hook)
+
+    def set_cpu_rate(self, cpu_rate: float) -> None:
+        if cpu_rate <= 0:
+            logger.error(f"Invalid CPU rate {cpu_rate} Hz")
+            return
+        # Keep the part of the current timer period that is left, counted
+        # in instructions at the new rate
+        remaining = (self.next_tick - self.cycles) / self.cycles_per_tick
+        self.cpu_rate = cpu_rate
+        self.cycles_per_tick = cpu_rate / TIMER_RATE
+        self.next_tick = self.cycles + math.ceil(remaining * self.cycles_per_tick)
+        self.tick_origin = self.next_tick
+        self.ticks_since_origin = 0
+        logger.debug(f"CPU rate: {cpu_rate} Hz, {self.cycles_per_tick:.2f} cycles per timer tick")
+
+    def phase(self) -> tuple[float, float, int, int, int]:
+        """
+        The timer phase counted from the current cycle: CPU rate, budget,
+        cycles since the tick origin, ticks since the origin and cycles to
+        the next tick.
+        """
+        return (self.cpu_rate, self.budget, self.cycles - self.tick_origin,
+                self.ticks_since_origin, self.next_tick - self.cycles)
+
+    def set_phase(self, cpu_rate: float, budget: float, since_origin: int,
+                  ticks_since_origin: int, to_next_tick: int) -> None:
+        """
+        Continue from a timer phase returned by phase. It is restored at the
+        CPU rate it was taken at and then converted to the current rate.
+        """
+        current_rate = self.cpu_rate
+        self.cpu_rate = cpu_rate
+        self.cycles_per_tick = cpu_rate / TIMER_RATE
+        self.budget = budget
+        self.tick_origin = self.cycles - since_origin
+        self.ticks_since_origin = ticks_since_origin
+        self.next_tick = self.cycles + to_next_tick
+        if cpu_rate != current_rate:
+            self.set_cpu_rate(current_rate)
+
+    def reset(self) -> None:
+        self.cycles = 0
+        self.timer_ticks = 0
+        self.budget = 0.0
+        self.tick_origin = 0
+        self.ticks_since_origin = 0
+        self.next_tick = 0
+
+    def advance(self, seconds: float) -> int:
+        """
+        Run the instructions for seconds of host time, returns how many
+        were run.
+        """
+        self.budget += min(seconds, self.max_catch_up) * self.cpu_rate
+        cycles = int(self.budget)
+        self.budget -= cycles
+        self.run_cycles(cycles)
+        return cycles
+
+    def run_frames(self, frames: int) -> None:
+        """Run the instructions for a number of 60 Hz frames of emulated time."""
+        self.budget += frames * self.cycles_per_tick
+        cycles = int(self.budget)
+        self.budget -= cycles
+        self.run_cycles(cycles)
+
+    def run_cycles(self, cycles: int) -> None:
+        """
+        Run a number of instructions, ticking the timers before the first
+        instruction that runs after they are due.
+        """
+        ii = self.ii
+        end = self.cycles + cycles
+        while self.cycles < end:
+            if self.cycles >= self.next_tick:
+                ii.tick_timers()
+                self.timer_ticks += 1
+                self.ticks_since_origin += 1
+                self.next_tick = self.tick_origin + math.ceil(
+                    self.ticks_since_origin * self.cycles_per_tick)
+            stop = min(end, self.next_tick)
+            for hook in self.slice_hooks:
+                stop = hook.before_slice(self.cycles, stop)
+            chunk = stop - self.cycles
+            if chunk > 0:
+                ii.run(chunk)
+                self.cycles += chunk
@@ -2,54 +2,132 @@
 
 import pygame
 
+from src.framebuffer import HEIGHT, WIDTH, Framebuffer
 from src.log import logger
 
+# The 8 pixels of every possible byte of a row, one byte per pixel, for the
+# first plane and with the value 2 for the second one. The palette index of a
+# pixel is the OR of both.
+BYTE_PIXELS = [bytes((byte >> (7 - i)) & 1 for i in range(8)) for byte in range(256)]
+BYTE_PIXELS_2 = [bytes(pixel * 2 for pixel in pixels) for pixels in BYTE_PIXELS]
 
-class Screen:
-    def __init__(self) -> None:
-        pygame.init()
-        self.PIXEL_SIZE = 20
+
+class Screen(Framebuffer):
+    def __init__(self, pixel_size: int = 20, resizable: bool = True) -> None:
+        super().__init__()
+        # The mixer is left to Sound, which only starts it when a tone is heard
+        pygame.display.init()
+        pygame.font.init()
+        self.PIXEL_SIZE = pixel_size
         self.MENU_HEIGHT = 40
-        self.WIDTH = 64 * self.PIXEL_SIZE
-        self.HEIGHT = 32 * self.PIXEL_SIZE
+        self.WIDTH = WIDTH * self.PIXEL_SIZE
+        self.HEIGHT = HEIGHT * self.PIXEL_SIZE
         self.TOTAL_HEIGHT = self.HEIGHT + self.MENU_HEIGHT
-        self.DISPLAY = pygame.display.set_mode((self.WIDTH, self.TOTAL_HEIGHT), 0, 1)
+        flags = pygame.RESIZABLE if resizable else 0
+        self.DISPLAY = pygame.display.set_mode((self.WIDTH, self.TOTAL_HEIGHT), flags)
 
         self.WHITE: tuple[int, int, int] = (230, 230, 230)
         self.BLACK: tuple[int, int, int] = (20, 20, 20)
+        # XO-CHIP pixels set in the second plane only, and in both planes
+        self.PLANE_2: tuple[int, int, int] = (230, 120, 40)
+        self.BOTH_PLANES: tuple[int, int, int] = (130, 70, 30)
 
-        self.pixel_matrix: list[list[int]] = [[0] * 32 for _ in range(64)]
+        # The display is rendered into a surface with one byte per pixel and
+        # scaled up to the window in one blit.
+        self.surface = self.new_surface()
+        self.offset_x = 0
 
-        self.paused = False
+        # Planes as they were last presented on the display, and other areas
+        # of the window that have been drawn to since then.
+        self.presented_planes: list[list[int]] = [list(plane) for plane in self.planes]
+        self.dirty_rects: list[pygame.Rect] = []
+        self.redraw_all()
         logger.info("Screen initialized")
 
-    # Run spin in main loop to check for pygame events and update screen
+    def resize(self, width: int, height: int) -> None:
+        """
+        Fit the display to a new window size, the pixel size is the largest
+        integer scale that fits below the menu bar.
+        """
+        if self.DISPLAY.get_size() != (width, height):
+            self.DISPLAY = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+        self.PIXEL_SIZE = max(1, min(width // WIDTH, (height - self.MENU_HEIGHT) // HEIGHT))
+        self.WIDTH = WIDTH * self.PIXEL_SIZE
+        self.HEIGHT = HEIGHT * self.PIXEL_SIZE
+        self.TOTAL_HEIGHT = self.HEIGHT + self.MENU_HEIGHT
+        self.offset_x = (width - self.WIDTH) // 2
+
+        self.DISPLAY.fill(self.BLACK, (0, self.MENU_HEIGHT, width, height - self.MENU_HEIGHT))
+        self.mark_dirty(pygame.Rect(0, self.MENU_HEIGHT, width, height - self.MENU_HEIGHT))
+        self.redraw_all()
+        logger.debug(f"Window resized to {width}x{height}, pixel size {self.PIXEL_SIZE}")
+
+    def new_surface(self) -> pygame.Surface:
+        surface = pygame.Surface((self.width, self.height), depth=8)
+        surface.set_palette([self.BLACK, self.WHITE, self.PLANE_2, self.BOTH_PLANES])
+        return surface
+
+    def set_resolution(self, hires: bool) -> None:
+        super().set_resolution(hires)
+        if self.surface.get_size() != (self.width, self.height):
+            self.surface = self.new_surface()
+            logger.debug(f"Display resolution {self.width}x{self.height}")
+        self.redraw_all()
+
+    def redraw_all(self) -> None:
+        # Make every pixel differ from what is presented
+        mask = (1 << self.width) - 1
+        self.presented_planes = [[~row & mask for row in plane] for plane in self.planes]
+
+    def mark_dirty(self, rect: pygame.Rect) -> None:
+        self.dirty_rects.append(rect)
+
+    # Run spin in main loop to update screen
     def spin(self) -> None:
-        # Redraw screen
-        for y in range(32):
-            for x in range(64):
-                if self.pixel_matrix[x][y] == 1:
-                    self.draw_pixel(x, y, self.WHITE)
-                else:
-                    self.draw_pixel(x, y, self.BLACK)
-        pygame.display.update()
-
-    def get_pixel_state(self, x: int, y: int) -> bool:
-        return self.pixel_matrix[x][y] == 1
-
-    def draw_pixel(self, x: int, y: int, color: tuple[int, int, int]) -> None:
-        x = x * self.PIXEL_SIZE
-        y = y * self.PIXEL_SIZE + self.MENU_HEIGHT  # Offset to fit menu bar
-        pygame.draw.rect(self.DISPLAY, color,
-                         (x, y, self.PIXEL_SIZE, self.PIXEL_SIZE))
-
-    def set_pixel(self, x: int, y: int) -> None:
-        self.pixel_matrix[x][y] = 1
-
-    def clear_pixel(self, x: int, y: int) -> None:
-        self.pixel_matrix[x][y] = 0
-
-    def clear_all(self) -> None:
-        for x in range(64):
-            for y in range(32):
-                self.clear_pixel(x, y)
+        """
+        Present the rows that changed since the last call, nothing is done
+        if nothing changed.
+
+        Changed rows are written to the small surface, then the band of rows
+        between the first and last change is scaled up and blitted to the
+        window, so the cost does not depend on how many pixels are lit. In
+        high resolution the same window area holds twice as many pixels.
+        """
+        first_plane, second_plane = self.planes
+        presented_first, presented_second = self.presented_planes
+        if first_plane == presented_first and second_plane == presented_second:
+            changed = []
+        elif second_plane == presented_second:
+            changed = [y for y, (row, presented) in enumerate(zip(first_plane, presented_first))
+                       if row != presented]
+        else:
+            changed = [y for y in range(self.height)
+                       if first_plane[y] != presented_first[y] or second_plane[y] != presented_second[y]]
+        if changed:
+            width = self.width
+            row_bytes = width // 8
+            pitch = self.surface.get_pitch()
+            buffer = self.surface.get_buffer()
+            for y in changed:
+                pixels = b"".join(map(BYTE_PIXELS.__getitem__, first_plane[y].to_bytes(row_bytes, "big")))
+                if second_plane[y]:
+                    pixels = (int.from_bytes(pixels, "big") | int.from_bytes(
+                        b"".join(map(BYTE_PIXELS_2.__getitem__, second_plane[y].to_bytes(row_bytes, "big"))),
+                        "big")).to_bytes(width, "big")
+                buffer.write(pixels, y * pitch)
+            del buffer  # Unlocks the surface
+
+            first, last = changed[0], changed[-1] + 1
+            # Window rows of display rows, exact even when a high resolution
+            # pixel is not a whole number of window pixels
+            top = first * self.HEIGHT // self.height
+            bottom = last * self.HEIGHT // self.height
+            band = self.surface.subsurface((0, first, width, last - first))
+            scaled = pygame.transform.scale(band, (self.WIDTH, bottom - top))
+            rect = self.DISPLAY.blit(scaled, (self.offset_x, top + self.MENU_HEIGHT))
+            self.dirty_rects.append(rect)
+            self.presented_planes = [list(first_plane), list(second_plane)]
+
+        if self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
+            self.dirty_rects.clear()
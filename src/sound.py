@@ -1,22 +1,172 @@
 # Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
 
+"""
+Sound
+
+The tone plays while the sound timer is above zero. update is called once
+per frame with that state, and the mixer is only told when it changes, the
+tone is started from the beginning of its waveform and stopped again. The
+mixer runs with a small buffer so a tone starts within a few milliseconds.
+
+The waveform is an XO-CHIP pattern, 128 1-bit samples played at
+4000 * 2 ** ((pitch - 64) / 48) samples per second, most significant bit
+first. The plain CHIP-8 buzzer is the pattern of alternating 0xFF and 0x00
+bytes, a 250 Hz square wave at the default pitch. Every pattern and pitch is
+rendered once, run by run of equal bits, into a buffer of whole pattern
+periods that loops seamlessly, and kept in a cache.
+
+Sound does not initialise the mixer before the first tone that is heard, or
+prepare is called, and never while muted. Headless runs do not use Sound.
+In a window pygame_menu needs pygame.init, which starts the mixer as well,
+so the window calls it after the first frame and stops the mixer again if
+the session is muted.
+"""
+import math
+import struct
+from typing import Optional
+
 import pygame
 
 from src.log import logger
 
+SAMPLE_RATE = 44100
+# Samples per mixer buffer, about 6 ms at 44100 Hz
+MIXER_BUFFER = 256
+# Loudness of the waveform before the volume is applied
+AMPLITUDE = 0.25
+PATTERN_BITS = 128
+DEFAULT_PITCH = 64
+BUZZER_PATTERN = bytes([0xFF, 0x00] * 8)
+# Rendered waveforms are at least this long, so short patterns loop less often
+MIN_WAVEFORM_SECONDS = 0.05
+WAVEFORM_CACHE_SIZE = 64
+
+# struct formats of the mixer sample sizes
+SAMPLE_FORMATS = {8: "B", -8: "b", 16: "H", -16: "h", 32: "f"}
+
+
+def pattern_rate(pitch: int) -> float:
+    """Samples per second of a pattern played at an XO-CHIP pitch."""
+    return 4000 * 2 ** ((pitch - 64) / 48)
+
+
+def sample_bytes(level: float, size: int, channels: int) -> bytes:
+    """One frame of a sample at level, between -1 and 1, in a mixer format."""
+    if size == 32:
+        value: float = level
+    elif size > 0:
+        # Unsigned samples are centred on half their range
+        half = 1 << (size - 1)
+        value = half + round(level * (half - 1))
+    else:
+        value = round(level * ((1 << (-size - 1)) - 1))
+    return struct.pack(f"<{SAMPLE_FORMATS[size]}", value) * channels
+
+
+def pattern_runs(pattern: bytes) -> list[tuple[int, int, int]]:
+    """Runs of equal bits in a pattern, as bit value, first bit and end bit."""
+    bits = f"{int.from_bytes(pattern, 'big'):0{PATTERN_BITS}b}"
+    runs = []
+    start = 0
+    for end in range(1, PATTERN_BITS + 1):
+        if end == PATTERN_BITS or bits[end] != bits[start]:
+            runs.append((int(bits[start]), start, end))
+            start = end
+    return runs
+
+
+def render_pattern(pattern: bytes, pitch: int, sample_rate: int, low: bytes, high: bytes) -> bytes:
+    """
+    Waveform of a pattern at a pitch, low and high are the bytes of one
+    frame of each level. The waveform is a whole number of pattern periods
+    and can be looped.
+    """
+    samples_per_bit = sample_rate / pattern_rate(pitch)
+    period = PATTERN_BITS * samples_per_bit
+    periods = max(1, math.ceil(MIN_WAVEFORM_SECONDS * sample_rate / period))
+    runs = pattern_runs(pattern)
+    levels = (low, high)
+    chunks = []
+    for index in range(periods):
+        offset = index * PATTERN_BITS
+        for value, start, end in runs:
+            # Run boundaries are rounded from the exact position so the
+            # error never adds up over the periods
+            samples = round((offset + end) * samples_per_bit) - round((offset + start) * samples_per_bit)
+            chunks.append(levels[value] * samples)
+    return b"".join(chunks)
+
 
 class Sound:
-    def __init__(self) -> None:
-        self.volume = 0.75
-        pygame.mixer.init()
-        square_wave = bytearray([128] * 400 + [0] * 400)
-        self.sound = pygame.mixer.Sound(buffer=square_wave)
-        self.sound.play(loops=-1)
-        self.sound.set_volume(0.0)
-        logger.info("Sound initialized")
-
-    def buzzer_on(self) -> None:
-        self.sound.set_volume(self.volume)
-
-    def buzzer_off(self) -> None:
-        self.sound.set_volume(0.0)
+    def __init__(self, volume: float = 0.75) -> None:
+        self.volume = volume
+        self.mixer_ready = False
+        # The mixer could not be initialised, stay silent
+        self.unavailable = False
+        self.playing = False
+        self.pattern = BUZZER_PATTERN
+        self.pitch = DEFAULT_PITCH
+        self.waveforms: dict[tuple[bytes, int], pygame.mixer.Sound] = {}
+        self.current: Optional[pygame.mixer.Sound] = None
+        # Only sets the format, pygame.init also initialises the mixer with it
+        pygame.mixer.pre_init(SAMPLE_RATE, -16, 1, MIXER_BUFFER)
+
+    def prepare(self) -> bool:
+        """Initialise the mixer unless muted, returns whether it is ready."""
+        if self.mixer_ready or self.unavailable or self.volume <= 0:
+            return self.mixer_ready
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            logger.warning(f"No sound: {e}")
+            self.unavailable = True
+            return False
+        self.mixer_ready = True
+        logger.info(f"Sound initialized, {pygame.mixer.get_init()}")
+        return True
+
+    def waveform(self, pattern: bytes, pitch: int) -> pygame.mixer.Sound:
+        key = (pattern, pitch)
+        sound = self.waveforms.get(key)
+        if sound is None:
+            sample_rate, size, channels = pygame.mixer.get_init()
+            buffer = render_pattern(pattern, pitch, sample_rate,
+                                    sample_bytes(-AMPLITUDE, size, channels),
+                                    sample_bytes(AMPLITUDE, size, channels))
+            sound = pygame.mixer.Sound(buffer=buffer)
+            if len(self.waveforms) >= WAVEFORM_CACHE_SIZE:
+                # Drop the oldest waveform, dicts keep insertion order
+                del self.waveforms[next(iter(self.waveforms))]
+            self.waveforms[key] = sound
+        return sound
+
+    def update(self, playing: bool, pattern: Optional[bytes] = None, pitch: int = DEFAULT_PITCH) -> None:
+        """
+        Play the tone while playing is true, with the buzzer pattern unless
+        another one is given. Nothing is done unless something changed.
+        """
+        pattern = pattern if pattern is not None else BUZZER_PATTERN
+        if playing == self.playing and pattern == self.pattern and pitch == self.pitch:
+            return
+        self.pattern = pattern
+        self.pitch = pitch
+        self.stop()
+        if playing and self.prepare():
+            self.current = self.waveform(pattern, pitch)
+            self.current.set_volume(self.volume)
+            self.current.play(loops=-1)
+        self.playing = playing
+
+    def set_volume(self, volume: float) -> None:
+        self.volume = volume
+        if self.current is not None:
+            self.current.set_volume(volume)
+        elif self.playing:
+            # Unmuted while the tone should be heard
+            self.playing = False
+            self.update(True, self.pattern, self.pitch)
+
+    def stop(self) -> None:
+        if self.current is not None:
+            self.current.stop()
+            self.current = None
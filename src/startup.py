@@ -0,0 +1,38 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Startup timing
+
+Phases of starting the emulator are marked on the module level timer as they
+finish, the breakdown is logged at debug level once the first frame is
+presented. The clock starts when this module is first imported by
+src/__main__.py.
+"""
+import time
+
+from src.log import logger
+
+
+class StartupTimer:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases: list[tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """End a phase, it took the time since the previous mark."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    @property
+    def total(self) -> float:
+        return self.last - self.start
+
+    def report(self) -> None:
+        for phase, seconds in self.phases:
+            logger.debug(f"Startup {phase:<16} {seconds * 1e3:8.1f} ms")
+        logger.debug(f"Startup total            {self.total * 1e3:8.1f} ms")
+
+
+startup = StartupTimer()
@@ -0,0 +1,414 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+"""
+Batched CHIP-8 engine on NumPy arrays
+
+VectorVM holds the state of many machines as arrays with one row per
+instance and steps all of them in lockstep. Every step fetches one opcode per
+instance, then each opcode group that occurs is executed once for all the
+instances that are on it, so the cost of a step is a few array operations
+per group instead of one Python call per instance.
+
+The semantics are those of InstructionInterpreter, including shift_quirks,
+Fx0A blocking for the rest of a time slice, memory wrapping around with
+wrap and the display being 64 bit rows with the leftmost pixel in the most
+significant bit. The one difference: Cxkk draws from one NumPy generator
+for all instances, so it gives other numbers than the scalar interpreter
+with the same seed.
+
+Plain CHIP-8 is covered, and of SUPER-CHIP the big font, the flag registers
+and 00FD. The display is always 64x32 with one plane, so the other SUPER-CHIP
+and XO-CHIP instructions (Dxy0, 00Cn, 00Dn, 00FB, 00FC, 00FE, 00FF, 5xy2,
+5xy3, Fn01, F002, Fx3A) are not executed. An instance that reaches one of
+them halts, as does one that accesses memory past the end without wrap,
+where the scalar interpreter raises IndexError. Halted instances are
+flagged in halted and a warning is logged, the others run on.
+
+VectorVM has tick_timers and run like InstructionInterpreter, so Scheduler
+can drive it to get the 60 Hz timers right. Requires NumPy.
+"""
+from typing import Optional, Union
+
+import numpy as np
+
+from src.framebuffer import HEIGHT, WIDTH, Framebuffer
+from src.instruction_interpreter import BIG_FONT_START, BIG_FONTS, FONTS, PROGRAM_START, InstructionInterpreter
+from src.log import logger
+
+MEMORY_SIZE = 4096
+
+Index = np.ndarray
+
+
+class VectorVM:
+    def __init__(self, instances: int, seed: Optional[int] = None, shift_quirks: bool = False,
+                 wrap: bool = False) -> None:
+        self.instances = instances
+        self.shift_quirks = shift_quirks
+        self.wrap = wrap
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+        self.memory = np.zeros((instances, MEMORY_SIZE), dtype=np.uint8)
+        self.memory[:, :len(FONTS)] = FONTS
+        self.memory[:, BIG_FONT_START:BIG_FONT_START + len(BIG_FONTS)] = BIG_FONTS
+        self.reg_v = np.zeros((instances, 16), dtype=np.int32)
+        self.reg_i = np.zeros(instances, dtype=np.int32)
+        self.reg_delay = np.zeros(instances, dtype=np.int32)
+        self.reg_sound = np.zeros(instances, dtype=np.int32)
+        self.program_counter = np.full(instances, PROGRAM_START, dtype=np.int32)
+        self.stack = np.zeros((instances, 16), dtype=np.int32)
+        self.stack_pointer = np.zeros(instances, dtype=np.int32)
+        # Register each instance waits in for Fx0A, -1 when not waiting
+        self.key_wait = np.full(instances, -1, dtype=np.int32)
+        # Keypad state of each instance, bit n is set while key n is held
+        self.keys = np.zeros(instances, dtype=np.int32)
+        self.rows = np.zeros((instances, HEIGHT), dtype=np.uint64)
+        # SUPER-CHIP flag registers, kept over resets
+        self.flags = np.zeros((instances, 16), dtype=np.int32)
+        # Instances stopped at an instruction or access they can not run
+        self.halted = np.zeros(instances, dtype=bool)
+        self.all = np.arange(instances)
+
+        self.group_handlers = {
+            0x0: self.group_0,
+            0x1: self.jump,
+            0x2: self.call,
+            0x3: self.skip_if_equal,
+            0x4: self.skip_if_not_equal,
+            0x5: self.skip_if_vx_equal_vy,
+            0x6: self.set_vx_to_kk,
+            0x7: self.add_kk_to_vx,
+            0x8: self.group_8,
+            0x9: self.skip_if_vx_not_equal_vy,
+            0xA: self.set_index_to_nnn,
+            0xB: self.jump_with_offset,
+            0xC: self.random,
+            0xD: self.draw,
+            0xE: self.group_e,
+            0xF: self.group_f,
+        }
+        logger.info(f"VectorVM initialized with {instances} instances")
+
+    def reset(self) -> None:
+        self.reg_v[:] = 0
+        self.reg_i[:] = 0
+        self.reg_delay[:] = 0
+        self.reg_sound[:] = 0
+        self.program_counter[:] = PROGRAM_START
+        self.stack[:] = 0
+        self.stack_pointer[:] = 0
+        self.key_wait[:] = -1
+        self.rows[:] = 0
+        self.halted[:] = False
+        self.rng = np.random.default_rng(self.seed)
+
+    def load_program(self, program: bytes, instances: Union[Index, slice] = slice(None)) -> None:
+        """
+        Copy a program into the memory of the given instances, all by default.
+        The rest of memory after it is cleared, like InstructionInterpreter
+        does.
+        """
+        if len(program) > MEMORY_SIZE - PROGRAM_START:
+            raise ValueError(f"ROM of {len(program)} bytes does not fit in {MEMORY_SIZE - PROGRAM_START} bytes of memory")
+        self.memory[instances, PROGRAM_START:] = 0
+        self.memory[instances, PROGRAM_START:PROGRAM_START + len(program)] = np.frombuffer(program, np.uint8)
+
+    def load_rom(self, filename: str) -> None:
+        with open(filename, "rb") as f:
+            self.load_program(f.read())
+        logger.info(f"Loaded {filename} into {self.instances} instances")
+
+    def tick_timers(self) -> None:
+        np.subtract(self.reg_delay, 1, out=self.reg_delay, where=self.reg_delay > 0)
+        np.subtract(self.reg_sound, 1, out=self.reg_sound, where=self.reg_sound > 0)
+
+    def run(self, cycles: int) -> None:
+        """
+        Execute the given number of instructions on every instance. Instances
+        waiting for a key at the start of the slice and not getting one, or
+        starting to wait during it, sit out the rest of the slice.
+        """
+        self.end_key_wait()
+        for _ in range(cycles):
+            self.step()
+
+    def step(self) -> None:
+        """Execute one instruction on every instance that is not waiting for a key or halted."""
+        blocked = (self.key_wait >= 0) | self.halted
+        active = self.all[~blocked] if blocked.any() else self.all
+        if len(active) == 0:
+            return
+        pc = self.program_counter[active]
+        if not self.wrap and pc.max() + 1 >= MEMORY_SIZE:
+            outside = pc + 1 >= MEMORY_SIZE
+            self.halt(active[outside], "instruction fetch past the end of memory")
+            active, pc = active[~outside], pc[~outside]
+        fetch = pc & (MEMORY_SIZE - 1)
+        memory = self.memory
+        opcodes = (memory[active, fetch].astype(np.int32) << 8) | memory[active, (fetch + 1) & (MEMORY_SIZE - 1)]
+        pc += 2
+        pc[pc > 0xFFFF] = 0
+        self.program_counter[active] = pc
+
+        groups = opcodes >> 12
+        present = np.flatnonzero(np.bincount(groups, minlength=16))
+        if len(present) == 1:
+            self.group_handlers[int(present[0])](active, opcodes)
+            return
+        for group in present:
+            on_group = groups == group
+            self.group_handlers[int(group)](active[on_group], opcodes[on_group])
+
+    def halt(self, s: Index, reason: str) -> None:
+        """Stop instances at something they would not run like InstructionInterpreter."""
+        new = s[~self.halted[s]]
+        if len(new) == 0:
+            return
+        self.halted[new] = True
+        logger.warning(f"{len(new)} instance(s) halted, {reason}, the first is instance {int(new[0])}")
+
+    def accessible(self, s: Index, address: np.ndarray, size: Union[int, np.ndarray]) -> np.ndarray:
+        """
+        Whether the accesses of size bytes at address fit in memory or wrap,
+        the instances where they do not are halted.
+        """
+        if self.wrap:
+            return np.ones(len(s), dtype=bool)
+        inside = address + size <= MEMORY_SIZE
+        if not inside.all():
+            self.halt(s[~inside], "memory access past the end of memory")
+        return inside
+
+    def incr_pc(self, s: Index) -> None:
+        pc = self.program_counter[s] + 2
+        pc[pc > 0xFFFF] = 0
+        self.program_counter[s] = pc
+
+    def end_key_wait(self) -> None:
+        waiting = np.flatnonzero((self.key_wait >= 0) & (self.keys != 0))
+        if len(waiting) == 0:
+            return
+        keys = self.keys[waiting]
+        lowest = np.log2(keys & -keys).astype(np.int32)
+        self.reg_v[waiting, self.key_wait[waiting]] = lowest
+        self.key_wait[waiting] = -1
+
+    def is_pressed(self, s: Index, keys: np.ndarray) -> np.ndarray:
+        return (keys <= 0xF) & ((self.keys[s] >> (keys & 0xF)) & 1 == 1)
+
+    # Handlers, s holds the instances to execute on and op their opcodes
+
+    def group_0(self, s: Index, op: np.ndarray) -> None:
+        cls = s[op == 0x00E0]
+        self.rows[cls] = 0
+        ret = s[op == 0x00EE]
+        if len(ret):
+            sp = self.stack_pointer[ret]
+            self.program_counter[ret] = self.stack[ret, sp & 0xF]
+            self.stack_pointer[ret] = sp - 1
+        if len(cls) + len(ret) == len(s):
+            return
+        # 00FD stops the program by executing itself forever
+        self.program_counter[s[op == 0x00FD]] -= 2
+        display = (op >= 0x00FB) & (op != 0x00FD) & (op <= 0x00FF) | (op & 0xFFE0 == 0x00C0)
+        if display.any():
+            self.halt(s[display], "SUPER-CHIP or XO-CHIP display instruction")
+
+    def jump(self, s: Index, op: np.ndarray) -> None:
+        self.program_counter[s] = op & 0x0FFF
+
+    def call(self, s: Index, op: np.ndarray) -> None:
+        sp = self.stack_pointer[s] + 1
+        self.stack_pointer[s] = sp
+        self.stack[s, sp & 0xF] = self.program_counter[s]
+        self.program_counter[s] = op & 0x0FFF
+
+    def skip_if_equal(self, s: Index, op: np.ndarray) -> None:
+        self.incr_pc(s[self.reg_v[s, (op >> 8) & 0xF] == op & 0xFF])
+
+    def skip_if_not_equal(self, s: Index, op: np.ndarray) -> None:
+        self.incr_pc(s[self.reg_v[s, (op >> 8) & 0xF] != op & 0xFF])
+
+    def skip_if_vx_equal_vy(self, s: Index, op: np.ndarray) -> None:
+        ranges = (op & 0xF == 0x2) | (op & 0xF == 0x3)
+        if ranges.any():
+            self.halt(s[ranges], "XO-CHIP 5xy2 or 5xy3")
+        v = self.reg_v
+        equal = (v[s, (op >> 8) & 0xF] == v[s, (op >> 4) & 0xF]) & (op & 0xF == 0)
+        self.incr_pc(s[equal])
+
+    def skip_if_vx_not_equal_vy(self, s: Index, op: np.ndarray) -> None:
+        v = self.reg_v
+        not_equal = (v[s, (op >> 8) & 0xF] != v[s, (op >> 4) & 0xF]) & (op & 0xF == 0)
+        self.incr_pc(s[not_equal])
+
+    def set_vx_to_kk(self, s: Index, op: np.ndarray) -> None:
+        self.reg_v[s, (op >> 8) & 0xF] = op & 0xFF
+
+    def add_kk_to_vx(self, s: Index, op: np.ndarray) -> None:
+        x = (op >> 8) & 0xF
+        self.reg_v[s, x] = (self.reg_v[s, x] + (op & 0xFF)) & 0xFF
+
+    def group_8(self, s: Index, op: np.ndarray) -> None:
+        v = self.reg_v
+        for n in np.flatnonzero(np.bincount(op & 0xF, minlength=16)):
+            on_n = op & 0xF == n
+            t = s[on_n]
+            x = (op[on_n] >> 8) & 0xF
+            y = (op[on_n] >> 4) & 0xF
+            # Registers are read again after every write, like the scalar
+            # handlers do, so that x or y being F gives the same result
+            if n == 0x0:
+                v[t, x] = v[t, y]
+            elif n == 0x1:
+                v[t, x] = v[t, x] | v[t, y]
+            elif n == 0x2:
+                v[t, x] = v[t, x] & v[t, y]
+            elif n == 0x3:
+                v[t, x] = v[t, x] ^ v[t, y]
+            elif n == 0x4:
+                v[t, 0xF] = v[t, x] + v[t, y] > 0xFF
+                v[t, x] = (v[t, x] + v[t, y]) & 0xFF
+            elif n == 0x5:
+                vx, vy = v[t, x], v[t, y]
+                v[t, x] = (vx - vy) & 0xFF
+                v[t, 0xF] = vx > vy
+            elif n == 0x6:
+                if self.shift_quirks:
+                    v[t, x] = v[t, y]
+                v[t, 0xF] = v[t, x] & 0x1
+                v[t, x] = v[t, x] >> 1
+            elif n == 0x7:
+                vx, vy = v[t, x], v[t, y]
+                v[t, x] = (vy - vx) & 0xFF
+                v[t, 0xF] = vy > vx
+            elif n == 0xE:
+                if self.shift_quirks:
+                    v[t, x] = v[t, y]
+                v[t, 0xF] = (v[t, x] & 0x80) >> 7
+                v[t, x] = (v[t, x] << 1) & 0xFF
+
+    def set_index_to_nnn(self, s: Index, op: np.ndarray) -> None:
+        self.reg_i[s] = op & 0x0FFF
+
+    def jump_with_offset(self, s: Index, op: np.ndarray) -> None:
+        self.program_counter[s] = (op & 0x0FFF) + self.reg_v[s, 0x0]
+
+    def random(self, s: Index, op: np.ndarray) -> None:
+        self.reg_v[s, (op >> 8) & 0xF] = self.rng.integers(0, 256, len(s), dtype=np.int32) & op & 0xFF
+
+    def draw(self, s: Index, op: np.ndarray) -> None:
+        """
+        Framebuffer.draw_sprite on each instance, all rows of all sprites at
+        once. Rows that are clipped or past n are drawn with no pixels set,
+        their row numbers wrap so that no row is written twice.
+        """
+        n = op & 0xF
+        drawable = (n > 0) & self.accessible(s, self.reg_i[s], n)
+        if n.min(initial=1) == 0:
+            self.halt(s[n == 0], "SUPER-CHIP 16x16 sprite")
+        if not drawable.all():
+            s, op, n = s[drawable], op[drawable], n[drawable]
+            if len(s) == 0:
+                return
+        v = self.reg_v
+        # The display dimensions are powers of two, & wraps faster than %
+        x = v[s, (op >> 8) & 0xF] & (WIDTH - 1)
+        y = v[s, (op >> 4) & 0xF] & (HEIGHT - 1)
+        rows = np.arange(int(n.max()))
+        address = self.reg_i[s, None] + rows
+        drawn = (rows < n[:, None]) & (y[:, None] + rows < HEIGHT)
+        # Gather and scatter through flat indices, much faster than 2D ones
+        memory = self.memory.reshape(-1)
+        sprite = memory[s[:, None] * MEMORY_SIZE + (address & (MEMORY_SIZE - 1))]
+        sprite = np.where(drawn, sprite, 0).astype(np.uint64)
+        shift = WIDTH - 8 - x
+        left = np.maximum(shift, 0).astype(np.uint64)
+        right = np.maximum(-shift, 0).astype(np.uint64)
+        bits = (sprite << left[:, None]) >> right[:, None]
+        screen = self.rows.reshape(-1)
+        row = s[:, None] * HEIGHT + ((y[:, None] + rows) & (HEIGHT - 1))
+        current = screen[row]
+        screen[row] = current ^ bits
+        v[s, 0xF] = (current & bits).any(axis=1)
+
+    def group_e(self, s: Index, op: np.ndarray) -> None:
+        pressed = self.is_pressed(s, self.reg_v[s, (op >> 8) & 0xF])
+        kk = op & 0xFF
+        self.incr_pc(s[((kk == 0x9E) & pressed) | ((kk == 0xA1) & ~pressed)])
+
+    def group_f(self, s: Index, op: np.ndarray) -> None:
+        v = self.reg_v
+        memory = self.memory
+        kk_all = op & 0xFF
+        for kk in np.flatnonzero(np.bincount(kk_all, minlength=256)):
+            on_kk = kk_all == kk
+            t = s[on_kk]
+            x = (op[on_kk] >> 8) & 0xF
+            if kk == 0x07:
+                v[t, x] = self.reg_delay[t]
+            elif kk == 0x0A:
+                self.key_wait[t] = x
+                self.end_key_wait()
+            elif kk == 0x15:
+                self.reg_delay[t] = v[t, x]
+            elif kk == 0x18:
+                self.reg_sound[t] = v[t, x]
+            elif kk == 0x1E:
+                self.reg_i[t] = (self.reg_i[t] + v[t, x]) & 0xFFFF
+            elif kk == 0x29:
+                self.reg_i[t] = v[t, x] * 5
+            elif kk == 0x30:
+                self.reg_i[t] = BIG_FONT_START + (v[t, x] & 0xF) * 10
+            elif kk == 0x33:
+                i = self.reg_i[t]
+                inside = self.accessible(t, i, 3)
+                t, i, value = t[inside], i[inside], v[t[inside], x[inside]]
+                for offset, digit in enumerate((value // 100, value // 10 % 10, value % 10)):
+                    memory[t, (i + offset) & (MEMORY_SIZE - 1)] = digit
+            elif kk in (0x55, 0x65):
+                i = self.reg_i[t]
+                inside = self.accessible(t, i, x + 1)
+                t, i, x = t[inside], i[inside], x[inside]
+                for r in range(int(x.max(initial=-1)) + 1):
+                    on = r <= x
+                    address = (i[on] + r) & (MEMORY_SIZE - 1)
+                    if kk == 0x55:
+                        memory[t[on], address] = v[t[on], r]
+                    else:
+                        v[t[on], r] = memory[t[on], address]
+            elif kk == 0x75:
+                for r in range(int(x.max()) + 1):
+                    on = r <= x
+                    self.flags[t[on], r] = v[t[on], r]
+            elif kk == 0x85:
+                for r in range(int(x.max()) + 1):
+                    on = r <= x
+                    v[t[on], r] = self.flags[t[on], r]
+            elif kk in (0x01, 0x02, 0x3A):
+                self.halt(t, "XO-CHIP plane or audio instruction")
+
+    def export(self, index: int, ii: InstructionInterpreter) -> None:
+        """Copy the state of one instance into a scalar interpreter and its display."""
+        ii.reg_v = [int(value) for value in self.reg_v[index]]
+        ii.reg_i = int(self.reg_i[index])
+        ii.reg_delay = int(self.reg_delay[index])
+        ii.reg_sound = int(self.reg_sound[index])
+        ii.program_counter = int(self.program_counter[index])
+        ii.stack = [int(address) for address in self.stack[index]]
+        ii.stack_pointer = int(self.stack_pointer[index])
+        ii.key_wait = None if self.key_wait[index] < 0 else int(self.key_wait[index])
+        ii.shift_quirks = self.shift_quirks
+        ii.flags = [int(value) for value in self.flags[index]]
+        ii.memory.wrap = self.wrap
+        ii.memory.store(0, self.memory[index].tobytes())
+        ii.screen.set_resolution(False)
+        ii.screen.rows = [int(row) for row in self.rows[index]]
+        ii.block_cache.clear()
+        ii.rom_loaded = True
+
+    def framebuffer(self, index: int) -> Framebuffer:
+        screen = Framebuffer()
+        screen.rows = [int(row) for row in self.rows[index]]
+        return screen
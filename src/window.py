@@ -0,0 +1,438 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+import sys
+import time
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import pygame
+
+from src.guest_profiler import GuestProfiler
+from src.hex_keyboard import HexKeyboard
+from src.instruction_interpreter import InstructionInterpreter
+from src.log import logger
+from src.profiler import OpcodeProfiler
+from src.replay import InputPlayer, InputRecorder, Recording, rom_digest
+from src.rewind import RewindBuffer
+from src.rom_library import ROM_SUFFIXES, RomEntry, RomLibrary
+from src.save_state import read_state_file, write_state_file
+from src.scheduler import Scheduler
+from src.screen import Screen
+from src.sound import Sound
+from src.startup import startup
+
+
+STATE_DIR = Path("states")
+# Frames presented per second of wall time in turbo mode
+TURBO_REFRESH_RATE = 60
+
+
+CPU_RATES = [(' 600Hz', 600.0),
+             (' 900hz', 900.0),
+             ('1200Hz', 1200.0),
+             ('6000Hz', 6000.0)]
+VOLUMES = [('Mute', 0.0),
+           (' 25%', 0.25),
+           (' 50%', 0.5),
+           (' 75%', 0.75),
+           ('100%', 1.0)]
+# Longer ROM titles are cut in the menu
+MENU_TITLE_LENGTH = 16
+
+
+class SettingsMenu:
+    """
+    The menu bar, set up after the first frame is presented since nothing
+    needs it before that.
+    """
+    def __init__(self, window: "Window") -> None:
+        import pygame_menu
+
+        # pygame_menu requires all of pygame to be initialised, Screen only
+        # initialises the display and fonts. pygame.init starts the mixer as
+        # well, a muted session stops it again until the volume is turned up.
+        pygame.init()
+        if not window.sound.mixer_ready:
+            pygame.mixer.quit()
+
+        self.window = window
+        screen = window.screen
+        sound = window.sound
+        theme = pygame_menu.themes.Theme(background_color=(70, 30, 20),
+                                         title_background_color=(50, 30, 20),
+                                         widget_font=pygame_menu.font.FONT_DIGITAL,
+                                         title_font_size=1,
+                                         widget_font_size=14)
+        self.menu = pygame_menu.Menu(height=screen.MENU_HEIGHT, width=screen.DISPLAY.get_width(),
+                                     title='',
+                                     theme=theme,
+                                     joystick_enabled=False,
+                                     keyboard_enabled=False,
+                                     position=(0, 0),
+                                     columns=9,
+                                     column_min_width=(100, 100, 100, 100, 100, 100, 100, 100, 100),
+                                     rows=1,
+                                     mouse_motion_selection=True
+                                     )
+        menu = self.menu
+        menu.add.button('Reset ROM', window.reset_rom, align=pygame_menu.locals.ALIGN_CENTER)
+        menu.add.button('Load ROM', window.open_rom_file, align=pygame_menu.locals.ALIGN_CENTER)
+        # Switches between the ROMs of the library without a file dialog
+        roms = window.roms
+        self.rom_selector = menu.add.selector('ROM :', roms or [('-', None)],
+                                              onchange=window.select_rom if roms else None,
+                                              align=pygame_menu.locals.ALIGN_CENTER)
+        menu.add.button('Save State', window.quick_save, align=pygame_menu.locals.ALIGN_CENTER)
+        menu.add.button('Load State', window.quick_load, align=pygame_menu.locals.ALIGN_CENTER)
+        self.cpu_rate_selector = menu.add.selector('CPU Rate :', CPU_RATES,
+                                                   onchange=window.set_cpu_rate,
+                                                   align=pygame_menu.locals.ALIGN_CENTER)
+        # Any other rate can be typed in, it is set when pressing return
+        self.cpu_rate_input = menu.add.text_input('Hz : ',
+                                                  input_type=pygame_menu.locals.INPUT_FLOAT,
+                                                  maxchar=7, onreturn=window.set_custom_cpu_rate,
+                                                  align=pygame_menu.locals.ALIGN_CENTER)
+        volumes = [volume for _, volume in VOLUMES]
+        menu.add.selector('Sound Volume :', VOLUMES,
+                          onchange=window.set_volume,
+                          default=volumes.index(sound.volume) if sound.volume in volumes else 0,
+                          align=pygame_menu.locals.ALIGN_CENTER)
+        self.shift_quirks_selector = menu.add.selector('Shift Quirks :', [('Off', False),
+                                                                          (' On', True)],
+                                                       onchange=window.set_shift_quirks,
+                                                       align=pygame_menu.locals.ALIGN_CENTER)
+        self.update()
+        if window.mode != "":
+            menu.disable()
+
+    def update(self) -> None:
+        # Show the settings of the running ROM, set_value does not call onchange
+        window = self.window
+        listed = [rom for _, rom in window.roms]
+        if window.current_rom in listed:
+            self.rom_selector.set_value(listed.index(window.current_rom))
+        presets = [rate for _, rate in CPU_RATES]
+        if window.scheduler.cpu_rate in presets:
+            self.cpu_rate_selector.set_value(presets.index(window.scheduler.cpu_rate))
+        self.show_cpu_rate(window.scheduler.cpu_rate)
+        self.shift_quirks_selector.set_value(int(window.ii.shift_quirks))
+
+    def show_cpu_rate(self, rate: float) -> None:
+        self.cpu_rate_input.set_value(format(rate, "g"))
+
+    def draw(self, events: list[pygame.event.Event], display: pygame.Surface) -> bool:
+        """Draw and update the menu if it is enabled, returns whether it was."""
+        if not self.menu.is_enabled():
+            return False
+        self.menu.draw(display)
+        self.menu.update(events)
+        return True
+
+
+class Window:
+    """A session of the emulator in a window, from startup to exit."""
+    def __init__(self, rom_file: str = "", pixel_size: int = 20, state_file: str = "",
+                 rewind_seconds: float = 10.0, cpu_rate: float = 600.0,
+                 turbo: bool = False, profile: str = "", guest_profile: str = "",
+                 seed: Optional[int] = None, record: str = "", replay: str = "",
+                 rom_dirs: Sequence[str] = (), exit_after_frames: int = 0,
+                 mute: bool = False, wrap_memory: bool = False) -> None:
+        self.cpu_rate = cpu_rate
+        self.turbo = turbo
+        self.profile = profile
+        self.guest_profile = guest_profile
+        self.record = record
+        self.replay = replay
+        self.exit_after_frames = exit_after_frames
+        self.title = ""
+        self.current_rom: Optional[RomEntry] = None
+
+        self.screen = Screen(pixel_size)
+        self.keyboard = HexKeyboard()
+        startup.mark("screen")
+
+        self.ii = InstructionInterpreter(self.screen, self.keyboard, seed, wrap_memory)
+        self.scheduler = Scheduler(self.ii, cpu_rate)
+        # Profiles are reported on F10 and on exit
+        self.profiler = OpcodeProfiler(self.ii)
+        if profile != "":
+            self.profiler.attach()
+        self.guest_profiler = GuestProfiler(self.ii)
+        if guest_profile != "":
+            self.guest_profiler.attach()
+        # Hold backspace to step back through the last rewind_seconds of frames
+        self.rewind = RewindBuffer(max_frames=int(rewind_seconds * 60))
+        startup.mark("interpreter")
+
+        self.library = RomLibrary(["roms", *rom_dirs])
+        self.library.load()
+        self.library.scan()
+        self.library.save()
+        self.roms = [(entry.title[:MENU_TITLE_LENGTH], entry) for entry in self.library.roms()]
+        startup.mark("ROM library")
+
+        # The mixer is initialised at the first tone, or after the first frame
+        # when not muted
+        self.sound = Sound(0.0 if mute else 0.75)
+        self.menu: Optional[SettingsMenu] = None
+
+        # Recorded and replayed sessions have to run from the start without
+        # any changes other than keypad input, so the menu, loading states
+        # and rewinding are disabled for them. mode is shown in the caption.
+        self.mode = ""
+        self.recorder: Optional[InputRecorder] = None
+        if replay != "":
+            player = InputPlayer(self.scheduler, self.keyboard, Recording.read(replay))
+            player.configure(rom_digest(rom_file))
+            player.attach()
+            self.mode = "REPLAY"
+        if rom_file != "":
+            self.open_rom_file(rom_file)
+        if record != "":
+            self.recorder = InputRecorder(self.scheduler, self.keyboard, rom_digest(rom_file))
+            self.recorder.attach()
+            self.mode = "REC"
+        if self.mode != "":
+            self.mode += " "
+            if state_file != "":
+                logger.warning(f"Not loading {state_file}, recorded and replayed sessions run from the start")
+        elif state_file != "":
+            self.load_state_file(Path(state_file))
+        startup.mark("ROM")
+
+        # Window caption, only handed to pygame when it changes
+        self.caption = ""
+        self.frames = 0
+        self.menu_rect = pygame.Rect(0, 0, self.screen.DISPLAY.get_width(), self.screen.MENU_HEIGHT)
+        self.redraw_menu = True
+        # Instructions per second of wall time, measured for the turbo caption
+        self.rate_start = time.perf_counter()
+        self.rate_cycles = 0
+        self.measured_rate = 0.0
+        self.clock = pygame.time.Clock()
+
+    def reset_rom(self) -> None:
+        self.screen.clear_all()
+        self.ii.reset()
+        self.scheduler.reset()
+        self.rewind.clear()
+
+    def open_rom_file(self, filename: str = "") -> None:
+        if filename == "":
+            # Tk takes a while to import and start, only do it when asked to
+            import tkinter as tk
+            from tkinter import filedialog
+            root = tk.Tk()
+            root.withdraw()
+            rom: str = filedialog.askopenfilename(
+                initialdir="roms",
+                filetypes=(("ROM", " ".join(f"*{suffix}" for suffix in ROM_SUFFIXES)), ("All files", "*"),)
+            )
+            root.destroy()
+        else:
+            rom = filename
+
+        if rom == "":
+            logger.info("No rom selected!")
+            return
+        try:
+            entry = self.library.add(rom)
+        except OSError as e:
+            logger.warning(f"Could not load ROM {rom}: {e}")
+            return
+        self.library.save()
+        self.switch_rom(entry)
+
+    def switch_rom(self, entry: RomEntry) -> None:
+        try:
+            self.ii.load_program(self.library.program(entry))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load ROM {entry.path}: {e}")
+            return
+        self.title = entry.title
+        self.current_rom = entry
+        logger.info(f"Loaded ROM-file {entry.path}")
+        # A replay runs with the settings it was recorded with
+        if self.replay == "":
+            self.apply_rom_settings(entry)
+        self.reset_rom()
+
+    def apply_rom_settings(self, entry: RomEntry) -> None:
+        rate = entry.cpu_rate if entry.cpu_rate is not None else self.cpu_rate
+        self.scheduler.set_cpu_rate(rate)
+        self.ii.shift_quirks = bool(entry.shift_quirks)
+        if self.menu is not None:
+            self.menu.update()
+
+    def quick_save(self) -> None:
+        if not self.ii.rom_loaded:
+            return
+        write_state_file(self.ii, STATE_DIR / f"{self.title}.state", self.scheduler)
+
+    def quick_load(self) -> None:
+        self.load_state_file(STATE_DIR / f"{self.title}.state")
+
+    def load_state_file(self, path: Path) -> None:
+        try:
+            read_state_file(self.ii, path, self.scheduler)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load state {path}: {e}")
+            return
+        self.title = path.stem
+        self.screen.paused = False
+        self.rewind.clear()
+
+    def set_cpu_rate(self, selected_value: str, rate: float) -> None:
+        logger.debug(f"Selected option: {selected_value}, CPU rate: {rate} Hz")
+        self.scheduler.set_cpu_rate(rate)
+        if self.menu is not None:
+            self.menu.show_cpu_rate(rate)
+        self.store_rom_settings(cpu_rate=rate)
+
+    def set_custom_cpu_rate(self, rate: float) -> None:
+        if rate > 0:
+            self.scheduler.set_cpu_rate(rate)
+            self.store_rom_settings(cpu_rate=rate)
+        elif self.menu is not None:
+            self.menu.show_cpu_rate(self.scheduler.cpu_rate)
+
+    def set_volume(self, _: str, volume: float) -> None:
+        self.sound.set_volume(volume)
+
+    def set_shift_quirks(self, selected_value: str, setting: bool) -> None:
+        self.ii.shift_quirks = setting
+        logger.debug(f"Selected shift_quirks: {selected_value}, {setting}")
+        self.store_rom_settings(shift_quirks=setting)
+
+    def store_rom_settings(self, **settings: object) -> None:
+        # Settings changed while running a ROM are used whenever it is loaded
+        if self.current_rom is not None:
+            self.library.set_settings(self.current_rom, **settings)
+
+    def select_rom(self, _: object, entry: RomEntry) -> None:
+        self.switch_rom(entry)
+
+    def report_profiles(self) -> None:
+        if self.profile != "":
+            self.profiler.report(self.profile)
+        if self.guest_profile != "":
+            self.guest_profiler.report(self.guest_profile)
+
+    def finish_startup(self) -> None:
+        self.sound.prepare()
+        startup.mark("sound")
+        self.menu = SettingsMenu(self)
+        startup.mark("menu")
+        startup.report()
+
+    def exit_window(self) -> None:
+        self.report_profiles()
+        if self.recorder is not None:
+            self.recorder.save(self.record)
+        pygame.quit()
+        sys.exit()
+
+    def present(self) -> None:
+        self.screen.spin()
+        self.frames += 1
+        if self.frames == 1:
+            startup.mark("first frame")
+        if self.frames == self.exit_after_frames:
+            if self.menu is None:
+                startup.report()
+            self.exit_window()
+
+    def set_caption(self, text: str) -> None:
+        if text != self.caption:
+            pygame.display.set_caption(text)
+            self.caption = text
+
+    def handle_events(self, events: list[pygame.event.Event]) -> None:
+        screen = self.screen
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.exit_window()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                screen.paused = not screen.paused
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                self.quick_save()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F9 and self.mode == "":
+                self.quick_load()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_TAB:
+                self.turbo = not self.turbo
+                logger.info(f"Turbo mode {'on' if self.turbo else 'off'}")
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F10:
+                self.report_profiles()
+            elif event.type == pygame.VIDEOEXPOSE:
+                screen.redraw_all()
+                self.redraw_menu = True
+            elif event.type == pygame.VIDEORESIZE:
+                screen.resize(event.w, event.h)
+                self.redraw_menu = True
+
+        if self.replay == "":
+            self.keyboard.handle_events(events)
+
+        # The menu only changes on input, redraw it when there is any
+        if self.menu is not None and (events or self.redraw_menu):
+            if self.menu.draw(events, screen.DISPLAY):
+                screen.mark_dirty(self.menu_rect)
+                self.redraw_menu = False
+
+    def run_emulation(self, elapsed: float) -> None:
+        """Run the instructions of one presented frame."""
+        scheduler = self.scheduler
+        if self.turbo:
+            # Run whole emulated frames until it is time to present one, the
+            # frames in between are never drawn
+            deadline = time.perf_counter() + 1 / TURBO_REFRESH_RATE
+            while time.perf_counter() < deadline:
+                scheduler.run_frames(1)
+        else:
+            # Run the instructions for the time that has passed, the timers
+            # tick at 60 Hz of emulated time. Most CHIP-8 interpreters ran at
+            # about 500-1000hz
+            scheduler.advance(elapsed)
+        self.rewind.capture(self.ii, self.scheduler)
+
+        self.sound.update(self.ii.reg_sound > 0, self.ii.audio_pattern, self.ii.pitch)
+
+        now = time.perf_counter()
+        if now - self.rate_start >= 0.5:
+            self.measured_rate = (scheduler.cycles - self.rate_cycles) / (now - self.rate_start)
+            self.rate_start = now
+            self.rate_cycles = scheduler.cycles
+        if self.turbo:
+            self.set_caption(f"{self.title}     {self.mode}TURBO: {self.measured_rate:,.0f} cycles/s")
+        else:
+            fps = format(self.clock.get_fps(), ".1f")
+            self.set_caption(f"{self.title}     {self.mode}FPS: {fps}")
+
+    def frame(self) -> None:
+        # Run at 60 fps, or as fast as possible in turbo mode. The first
+        # frame is not held back
+        elapsed = self.clock.tick(0 if self.turbo or self.frames == 0 else 60) / 1000
+        if self.menu is None and self.frames > 0:
+            self.finish_startup()
+
+        self.handle_events(pygame.event.get())
+
+        if self.screen.paused or not self.ii.rom_loaded:
+            status = "Load a rom" if not self.ii.rom_loaded else "PAUSED"
+            self.set_caption(f"{self.title}     {status}")
+            self.sound.update(False)
+        elif pygame.key.get_pressed()[pygame.K_BACKSPACE] and self.mode == "":
+            self.rewind.rewind(self.ii, self.scheduler)
+            self.set_caption(f"{self.title}     REWIND {self.rewind.stats()}")
+        else:
+            self.run_emulation(elapsed)
+        self.present()
+
+    def run(self) -> None:
+        logger.info("Running main loop")
+        while True:
+            self.frame()
+
+
+def run_window(**options: Any) -> None:
+    """Open a window and run until it is closed, options are those of Window."""
+    Window(**options).run()
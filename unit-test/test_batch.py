@@ -0,0 +1,41 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.batch import check_golden, find_roms, run_batch, run_rom
+
+GOLDEN = json.loads(Path("roms/golden.json").read_text())
+
+
+class TestBatch(unittest.TestCase):
+    def test_test_roms_match_golden(self):
+        results = [run_rom(rom, 600, 600.0) for rom in ("roms/test_opcode.ch8", "roms/BC_test.ch8")]
+        self.assertEqual(check_golden(results, GOLDEN), [])
+        self.assertEqual([result["status"] for result in results], ["ok", "ok"])
+        self.assertEqual(results[0]["instructions"], 6000)
+
+    def test_mismatch_and_error(self):
+        results = [run_rom("roms/IBM Logo.ch8", 1, 600.0), run_rom("roms/missing.ch8", 1, 600.0)]
+        self.assertEqual(check_golden(results, GOLDEN), ["roms/IBM Logo.ch8", "roms/missing.ch8"])
+        self.assertEqual(results[0]["status"], "MISMATCH")
+        self.assertEqual(results[1]["status"], "ERROR")
+
+    def test_find_roms_of_every_kind(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("a.ch8", "b.SC8", "c.xo8", "notes.txt"):
+                (Path(directory) / name).touch()
+            roms = find_roms([directory, "extra.bin"])
+        self.assertEqual([rom.name for rom in roms], ["a.ch8", "b.SC8", "c.xo8", "extra.bin"])
+
+    def test_run_batch_in_process_pool(self):
+        roms = find_roms(["roms"])
+        self.assertIn(Path("roms/octojam1title.ch8"), roms)
+        results = run_batch(roms[:3], 60, 10, jobs=2)
+        self.assertEqual([result["rom"] for result in results], [str(rom) for rom in roms[:3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+
+from src.bench import compare, result
+
+
+class TestBenchCompare(unittest.TestCase):
+    def test_flags_slower_cases(self):
+        baseline = {
+            "rom/a": result(1000.0, "instructions/s"),
+            "rom/b": result(1000.0, "instructions/s"),
+            "opcode/6xkk": result(100.0, "ns/op"),
+            "opcode/7xkk": result(100.0, "ns/op"),
+        }
+        results = {
+            "rom/a": result(850.0, "instructions/s"),
+            "rom/b": result(1200.0, "instructions/s"),
+            "opcode/6xkk": result(120.0, "ns/op"),
+            "opcode/7xkk": result(95.0, "ns/op"),
+            "opcode/8xy4": result(95.0, "ns/op"),
+        }
+        self.assertEqual(compare(results, baseline, 0.10), ["rom/a", "opcode/6xkk"])
+        self.assertAlmostEqual(results["rom/b"]["change"], 0.2)
+        self.assertAlmostEqual(results["opcode/7xkk"]["change"], 0.05)
+        self.assertNotIn("change", results["opcode/8xy4"])
+
+
+if __name__ == '__main__':
+    unittest.main()
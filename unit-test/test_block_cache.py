@@ -0,0 +1,112 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+
+from src.framebuffer import Framebuffer
+from src.instruction_interpreter import PROGRAM_START, InstructionInterpreter
+from src.keypad import Keypad
+
+
+def interpreter_with_program(program):
+    ii = InstructionInterpreter(Framebuffer(), Keypad())
+    ii.memory[PROGRAM_START:PROGRAM_START + len(program)] = bytes(program)
+    ii.reset()
+    return ii
+
+
+def state(ii):
+    return (ii.reg_v, ii.reg_i, ii.program_counter, ii.stack, ii.stack_pointer,
+            ii.memory, ii.screen.to_text())
+
+
+class TestBlockCache(unittest.TestCase):
+    def test_run_matches_step_on_roms(self):
+        for rom in ("roms/test_opcode.ch8", "roms/BC_test.ch8", "roms/IBM Logo.ch8"):
+            with open(rom, "rb") as f:
+                program = f.read()
+            stepped = interpreter_with_program(program)
+            translated = interpreter_with_program(program)
+            for cycles in (1, 3, 7, 10, 13) * 200:
+                for _ in range(cycles):
+                    stepped.step()
+                translated.run(cycles)
+                self.assertEqual(state(stepped), state(translated), rom)
+
+    def test_block_stops_at_cycle_budget(self):
+        # LD V0, 1; ADD V0, 1; ADD V0, 1; JP 0x200
+        ii = interpreter_with_program([0x60, 0x01, 0x70, 0x01, 0x70, 0x01, 0x12, 0x00])
+        ii.run(2)
+        self.assertEqual(ii.reg_v[0x0], 2)
+        self.assertEqual(ii.program_counter, 0x204)
+        ii.run(2)
+        self.assertEqual(ii.reg_v[0x0], 3)
+        self.assertEqual(ii.program_counter, 0x200)
+
+    def test_self_modifying_code_invalidates_block(self):
+        # LD I, 0x20A; LD V0, 0x61; LD V1, 0x23; LD [I], V1; LD V1, 0x00;
+        # JP 0x208; JP 0x20C
+        program = [0xA2, 0x0A, 0x60, 0x61, 0x61, 0x23, 0xF1, 0x55, 0x61, 0x00,
+                   0x12, 0x08, 0x12, 0x0C]
+        ii = interpreter_with_program(program)
+        ii.block_cache.translate(0x208)
+        ii.run(4)
+        # LD V1, 0x23 was written over the jump at the end of the block at 0x208
+        self.assertNotIn(0x208, ii.block_cache.blocks)
+        ii.run(2)
+        self.assertEqual(ii.reg_v[0x1], 0x23)
+        self.assertEqual(ii.program_counter, 0x20C)
+
+    def test_load_rom_clears_cache(self):
+        ii = interpreter_with_program([0x60, 0x01, 0x12, 0x00])
+        ii.run(4)
+        self.assertIn(0x200, ii.block_cache.blocks)
+        ii.load_rom("roms/IBM Logo.ch8")
+        self.assertEqual(ii.block_cache.blocks, {})
+        self.assertEqual(ii.memory.watches, set())
+
+    def assert_idle_loop_matches_step(self, program, between_slices):
+        stepped = interpreter_with_program(program)
+        translated = interpreter_with_program(program)
+        for i, cycles in enumerate((1, 2, 3, 4, 5, 7, 10, 13) * 20):
+            for ii in (stepped, translated):
+                between_slices(ii, i)
+            for _ in range(cycles):
+                stepped.step()
+            translated.run(cycles)
+            self.assertEqual(state(stepped), state(translated))
+        # The loop was left again every time it was entered
+        self.assertGreater(translated.reg_v[0x4], 5)
+
+    def test_delay_loop_matches_step(self):
+        # LD V3, 5; LD DT, V3; loop: LD V3, DT; SE V3, 00; JP loop; ADD V4, 1;
+        # JP 0x200
+        program = [0x63, 0x05, 0xF3, 0x15, 0xF3, 0x07, 0x33, 0x00, 0x12, 0x04,
+                   0x74, 0x01, 0x12, 0x00]
+
+        def tick(ii, _):
+            ii.tick_timers()
+        self.assert_idle_loop_matches_step(program, tick)
+
+    def test_key_loop_matches_step(self):
+        # LD V2, 7; loop: SKP V2; JP loop; ADD V4, 1; loop: SKNP V2; JP loop;
+        # JP 0x200
+        program = [0x62, 0x07, 0xE2, 0x9E, 0x12, 0x02, 0x74, 0x01, 0xE2, 0xA1,
+                   0x12, 0x08, 0x12, 0x00]
+
+        def toggle_key(ii, i):
+            if i % 6 == 5:
+                ii.keyboard.state ^= 1 << 7
+        self.assert_idle_loop_matches_step(program, toggle_key)
+
+    def test_idle_loop_runs_to_end_of_slice_at_once(self):
+        # loop: LD V1, DT; SE V1, 00; JP loop
+        ii = interpreter_with_program([0xF1, 0x07, 0x31, 0x00, 0x12, 0x00])
+        ii.reg_delay = 10
+        block = ii.block_cache.translate(0x200)
+        self.assertEqual(block(1000), 1000)
+        self.assertEqual(ii.program_counter, 0x200 + 2 * (1000 % 3))
+        self.assertEqual(ii.reg_v[0x1], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import io
+import unittest
+
+from src.debugger import Condition, Debugger, DebuggerShell
+from src.guest_profiler import GuestProfiler
+from src.headless import HeadlessRunner
+
+
+class TestDebugger(unittest.TestCase):
+    def setUp(self):
+        self.runner = HeadlessRunner()
+        self.ii = self.runner.ii
+        self.ii.load_program(bytes([
+            0x70, 0x01,  # 200: ADD V0, 01
+            0x22, 0x08,  # 202: CALL 208
+            0x12, 0x00,  # 204: JP 200
+            0x00, 0x00,
+            0xA3, 0x00,  # 208: LD I, 300
+            0xF0, 0x55,  # 20A: LD [I], V0
+            0x00, 0xEE,  # 20C: RET
+        ]))
+        self.debugger = Debugger(self.ii)
+
+    def test_attached_only_with_something_to_check(self):
+        self.assertEqual(self.ii.step_hooks, [])
+        self.debugger.add_breakpoint(0x204)
+        self.assertEqual(self.ii.step_hooks, [self.debugger])
+        self.debugger.remove_breakpoint(0x204)
+        self.assertEqual(self.ii.step_hooks, [])
+
+    def test_breakpoint_stops_and_resumes(self):
+        self.debugger.add_breakpoint(0x204)
+        self.runner.run(100)
+        self.assertEqual(self.ii.program_counter, 0x204)
+        self.assertEqual(self.debugger.stopped, "Breakpoint at 204")
+
+        self.debugger.resume()
+        self.runner.run(100)
+        self.assertEqual(self.ii.program_counter, 0x204)
+        self.assertEqual(self.ii.reg_v[0], 2)
+
+    def test_conditional_breakpoint(self):
+        self.debugger.add_breakpoint(0x202, Condition.parse("V0 >= 0A"))
+        self.runner.run(1000)
+        self.assertEqual(self.ii.program_counter, 0x202)
+        self.assertEqual(self.ii.reg_v[0], 0xA)
+
+    def test_watchpoint_stops_after_the_write(self):
+        self.debugger.add_watchpoint(0x300, 0x301)
+        self.runner.run(100)
+        self.assertEqual(self.ii.program_counter, 0x20C)
+        self.assertEqual(self.ii.memory[0x300], 1)
+        self.assertEqual(self.debugger.stopped, "Watchpoint 300-300: write to 300-300")
+
+    def test_step_over_call(self):
+        self.runner.run(1)
+        self.assertTrue(self.debugger.step_over())
+        self.runner.run(100)
+        self.assertEqual(self.ii.program_counter, 0x204)
+        self.assertEqual(self.ii.memory[0x300], 1)
+        self.debugger.resume()
+        self.assertEqual(self.ii.step_hooks, [])
+
+    def test_combined_with_guest_profiler(self):
+        profiler = GuestProfiler(self.ii)
+        profiler.attach()
+        self.debugger.add_breakpoint(0x20A)
+        self.runner.run(100)
+        self.assertEqual(self.debugger.stopped, "Breakpoint at 20A")
+        self.assertEqual(profiler.hits[0x208], 1)
+        self.assertEqual(profiler.hits[0x20A], 0)
+        self.debugger.remove_breakpoint(0x20A)
+        self.debugger.resume()
+        self.assertEqual(self.ii.step_hooks, [profiler])
+        self.runner.run(2)
+        self.assertEqual(profiler.hits[0x20A], 1)
+
+    def test_shell(self):
+        output = io.StringIO()
+        shell = DebuggerShell(self.runner)
+        shell.stdout = output
+        for line in ("break 20A if V0 == 3", "continue", "regs", "step", "mem 300 2", "delete 20C"):
+            shell.onecmd(line)
+        text = output.getvalue()
+        self.assertIn("Breakpoint at 20A if V0 == 03", text)
+        self.assertIn("=>*20A  F055  LD [I], V0", text)
+        self.assertIn("300  03 00", text)
+        self.assertIn("Error: No breakpoint at 20C", text)
+
+    def test_shell_keys(self):
+        output = io.StringIO()
+        shell = DebuggerShell(self.runner)
+        shell.stdout = output
+        shell.onecmd("keys 1 A")
+        self.assertEqual(self.runner.keyboard.state, 0x0402)
+        shell.onecmd("keys 10")
+        self.assertIn("Error: No key 10, keys are 0-F", output.getvalue())
+        self.assertEqual(self.runner.keyboard.state, 0x0402)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+
+from src.disassembler import disassemble, disassemble_range
+
+
+class TestDisassembler(unittest.TestCase):
+    def test_mnemonics(self):
+        cases = {
+            0x00E0: "CLS",
+            0x00EE: "RET",
+            0x1228: "JP 228",
+            0x2250: "CALL 250",
+            0x3A19: "SE VA, 19",
+            0x5120: "SE V1, V2",
+            0x8AB4: "ADD VA, VB",
+            0x8AB6: "SHR VA, VB",
+            0xA36A: "LD I, 36A",
+            0xB300: "JP V0, 300",
+            0xD9A8: "DRW V9, VA, 8",
+            0xEF9E: "SKP VF",
+            0xF50A: "LD V5, K",
+            0xF233: "LD B, V2",
+            0xF31E: "ADD I, V3",
+            0xFF65: "LD VF, [I]",
+            0x00C4: "SCD 4",
+            0x00D2: "SCU 2",
+            0x00FB: "SCR",
+            0x00FD: "EXIT",
+            0x00FF: "HIGH",
+            0xD120: "DRW V1, V2, 0",
+            0x5132: "SAVE V1 - V3",
+            0x5313: "LOAD V3 - V1",
+            0xF201: "PLANE 2",
+            0xF002: "AUDIO",
+            0xF330: "LD HF, V3",
+            0xF43A: "PITCH V4",
+            0xF575: "LD R, V5",
+            0xF585: "LD V5, R",
+        }
+        for instruction, text in cases.items():
+            self.assertEqual(disassemble(instruction), text)
+
+    def test_data(self):
+        self.assertEqual(disassemble(0x5121), "DW 5121")
+        self.assertEqual(disassemble(0xF0FF), "DW F0FF")
+
+    def test_range(self):
+        memory = bytes([0x00, 0xE0, 0x12, 0x00, 0xFF])
+        self.assertEqual(disassemble_range(memory, 0, 10),
+                         [(0, 0x00E0, "CLS"), (2, 0x1200, "JP 200")])
+
+
+if __name__ == '__main__':
+    unittest.main()
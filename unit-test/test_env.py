@@ -0,0 +1,90 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+
+from src.env import Chip8Env, ScoreReward, VecEnv, keys_mask
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ROM = "roms/Keypad Test [Hap, 2006].ch8"
+
+
+class TestKeysMask(unittest.TestCase):
+    def test_keys_mask(self):
+        self.assertEqual(keys_mask([0x1, 0xA]), 0x0402)
+        self.assertEqual(keys_mask(0x1_0003), 0x0003)
+
+
+class TestVecEnvArguments(unittest.TestCase):
+    def test_invalid_counts(self):
+        with self.assertRaises(ValueError):
+            VecEnv(0, rom=ROM)
+        with self.assertRaises(ValueError):
+            VecEnv(2, processes=-1, rom=ROM)
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestChip8Env(unittest.TestCase):
+    def test_numpy_integer_keys(self):
+        self.assertEqual(keys_mask(np.uint32(0x1_0003)), 0x0003)
+
+    def test_reset_and_step(self):
+        env = Chip8Env(ROM)
+        observation = env.reset(seed=1)
+        self.assertEqual(observation.shape, (32, 64))
+        self.assertEqual(observation.sum(), 0)
+        observation, reward, done, info = env.step(frames=10)
+        self.assertGreater(observation.sum(), 0)
+        self.assertEqual((reward, done), (0.0, False))
+        self.assertEqual(info["frames"], 10)
+        self.assertEqual(info["cycles"], 100)
+        self.assertEqual(observation.tolist(), [
+            [int(pixel) for pixel in format(row, "064b")] for row in env.runner.screen.rows])
+
+    def test_episodes_are_reproducible(self):
+        env = Chip8Env("roms/octojam1title.ch8")
+        runs = []
+        for _ in range(2):
+            env.reset(seed=7)
+            runs.append([env.step(frames=30)[0].tobytes() for _ in range(3)])
+        self.assertEqual(runs[0], runs[1])
+
+    def test_reward_and_max_frames(self):
+        # LD V0, 0; loop: ADD V0, 1; LD I, 0x300; LD [I], V0; JP loop
+        env = Chip8Env(ROM, reward=ScoreReward(0x300), max_frames=2)
+        env.reset()
+        env.program = bytes([0x60, 0x00, 0x70, 0x01, 0xA3, 0x00, 0xF0, 0x55, 0x12, 0x02])
+        env.reset()
+        _, reward, done, _ = env.step()
+        # 10 cycles: LD V0, 0 and the loop two full times and a quarter
+        self.assertEqual(reward, 2.0)
+        self.assertFalse(done)
+        _, reward, done, _ = env.step()
+        self.assertEqual(reward, 3.0)
+        self.assertTrue(done)
+
+    def test_vec_env(self):
+        with VecEnv(3, processes=2, rom=ROM, max_frames=4) as envs:
+            observations = envs.reset(seed=0)
+            self.assertEqual(observations.shape, (3, 32, 64))
+            observations, rewards, dones, infos = envs.step([0, [1], 2], frames=2)
+            self.assertEqual(rewards.shape, (3,))
+            self.assertFalse(dones.any())
+            observations, rewards, dones, infos = envs.step([0, 0, 0], frames=2)
+            self.assertTrue(dones.all())
+            self.assertIn("terminal_observation", infos[0])
+            self.assertEqual(infos[2]["frames"], 4)
+
+    def test_vec_env_processes_are_clamped(self):
+        with VecEnv(2, processes=0, rom=ROM) as envs:
+            self.assertLessEqual(len(envs.processes), 2)
+            self.assertEqual(sum(envs.counts), 2)
+        with VecEnv(2, processes=8, rom=ROM) as envs:
+            self.assertEqual(envs.counts, [1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+
+from src.framebuffer import Framebuffer
+
+
+class TestFramebuffer(unittest.TestCase):
+    def setUp(self):
+        self.fb = Framebuffer()
+
+    def test_set_and_clear_pixel(self):
+        self.fb.set_pixel(0, 0)
+        self.fb.set_pixel(63, 31)
+        self.assertTrue(self.fb.get_pixel_state(0, 0))
+        self.assertTrue(self.fb.get_pixel_state(63, 31))
+        self.assertEqual(self.fb.rows[0], 1 << 63)
+        self.assertEqual(self.fb.rows[31], 1)
+
+        self.fb.clear_pixel(0, 0)
+        self.assertFalse(self.fb.get_pixel_state(0, 0))
+
+    def test_draw_sprite_xor_and_collision(self):
+        self.assertFalse(self.fb.draw_sprite(8, 2, bytes([0xF0, 0x90])))
+        self.assertEqual(self.fb.rows[2], 0xF0 << 48)
+        self.assertEqual(self.fb.rows[3], 0x90 << 48)
+
+        # Pixels that are not set in the sprite are left as they are
+        self.assertFalse(self.fb.draw_sprite(8, 3, bytes([0x60])))
+        self.assertEqual(self.fb.rows[3], 0xF0 << 48)
+
+        self.assertTrue(self.fb.draw_sprite(8, 2, bytes([0x80])))
+        self.assertEqual(self.fb.rows[2], 0x70 << 48)
+
+    def test_draw_sprite_clips_at_edges(self):
+        self.fb.draw_sprite(60, 30, bytes([0xFF, 0xFF, 0xFF]))
+        self.assertEqual(self.fb.rows[30], 0xF)
+        self.assertEqual(self.fb.rows[31], 0xF)
+        self.assertEqual(self.fb.rows[0], 0)
+
+    def test_draw_sprite_wraps_start_position(self):
+        self.fb.draw_sprite(64 + 1, 32 + 1, bytes([0x80]))
+        self.assertTrue(self.fb.get_pixel_state(1, 1))
+
+    def test_clear_all(self):
+        self.fb.draw_sprite(0, 0, bytes([0xFF] * 15))
+        self.fb.clear_all()
+        self.assertEqual(self.fb.rows, [0] * 32)
+
+    def test_high_resolution(self):
+        self.fb.set_pixel(0, 0)
+        self.fb.set_resolution(True)
+        self.assertEqual((self.fb.width, self.fb.height), (128, 64))
+        self.assertEqual(self.fb.rows, [0] * 64)
+        self.fb.draw_sprite(127, 63, bytes([0xC0]))
+        self.assertEqual(self.fb.rows[63], 1)
+        self.assertEqual(len(self.fb.to_bytes()), 128 * 64 // 8)
+
+    def test_wide_sprite(self):
+        self.assertFalse(self.fb.draw_sprite(4, 0, bytes([0x80, 0x01, 0xFF, 0xFF]), wide=True))
+        self.assertEqual(self.fb.rows[0], 0x8001 << 44)
+        self.assertEqual(self.fb.rows[1], 0xFFFF << 44)
+
+    def test_scroll(self):
+        self.fb.draw_sprite(8, 0, bytes([0x18]))
+        self.fb.scroll_down(2)
+        self.assertEqual(self.fb.rows[:3], [0, 0, 0x18 << 48])
+        self.fb.scroll_up(1)
+        self.assertEqual(self.fb.rows[1], 0x18 << 48)
+        self.fb.scroll_right()
+        self.assertEqual(self.fb.rows[1], 0x18 << 44)
+        self.fb.scroll_left()
+        self.fb.scroll_left()
+        self.assertEqual(self.fb.rows[1], 0x18 << 52)
+
+        self.fb.draw_sprite(0, 1, bytes([0x80]))
+        self.fb.scroll_left()
+        self.assertEqual(self.fb.rows[1], 0x18 << 56)
+
+    def test_planes(self):
+        self.fb.select_planes(2)
+        self.fb.draw_sprite(0, 0, bytes([0x80]))
+        self.assertEqual(self.fb.rows[0], 0)
+        self.assertEqual(self.fb.planes[1][0], 1 << 63)
+
+        # The rows of each selected plane follow one another
+        self.fb.select_planes(3)
+        self.assertTrue(self.fb.draw_sprite(0, 0, bytes([0xC0, 0x80])))
+        self.assertEqual((self.fb.planes[0][0], self.fb.planes[1][0]), (0xC0 << 56, 0))
+
+        self.fb.select_planes(1)
+        self.fb.clear_selected()
+        self.assertEqual(self.fb.planes[0], [0] * 32)
+        self.fb.planes[1][0] = 1
+        self.assertEqual(self.fb.to_text().splitlines()[0], "." * 63 + "#")
+
+    def test_to_text(self):
+        self.fb.set_pixel(1, 0)
+        lines = self.fb.to_text().splitlines()
+        self.assertEqual(lines[0], "." + "#" + "." * 62)
+        self.assertEqual(lines[1], "." * 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.headless import HeadlessRunner
+from src.guest_profiler import GuestProfiler
+from src.profiler import OpcodeProfiler
+
+
+class TestGuestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.runner = HeadlessRunner()
+        self.ii = self.runner.ii
+        program = bytes([
+            0x22, 0x08,  # 200: CALL 208
+            0x22, 0x0C,  # 202: CALL 20C
+            0x12, 0x00,  # 204: JP 200
+            0x00, 0x00,
+            0x70, 0x01,  # 208: ADD V0, 01
+            0x00, 0xEE,  # 20A: RET
+            0x22, 0x08,  # 20C: CALL 208
+            0x00, 0xEE,  # 20E: RET
+        ])
+        self.ii.memory[0x200:0x200 + len(program)] = program
+        self.ii.reset()
+        self.ii.rom_loaded = True
+        self.profiler = GuestProfiler(self.ii)
+        self.profiler.attach()
+        # Each pass through the loop is 9 instructions
+        self.runner.run(9 * 10)
+
+    def test_hits(self):
+        self.assertEqual(self.profiler.hits[0x200], 10)
+        self.assertEqual(self.profiler.hits[0x208], 20)
+        self.assertEqual(self.profiler.hits[0x206], 0)
+        self.assertEqual(self.profiler.hotspots(2), [(0x208, 20), (0x20A, 20)])
+        self.assertEqual(self.ii.reg_v[0], 20)
+
+    def test_call_graph(self):
+        self.assertEqual(self.profiler.calls[("main", "sub_208")], 10)
+        self.assertEqual(self.profiler.calls[("main", "sub_20C")], 10)
+        self.assertEqual(self.profiler.calls[("sub_20C", "sub_208")], 10)
+
+    def test_folded_stacks(self):
+        self.assertEqual(self.profiler.folded_stacks().splitlines(), [
+            "main 30",
+            "main;sub_208 20",
+            "main;sub_20C 20",
+            "main;sub_20C;sub_208 20",
+        ])
+
+    def test_annotated_disassembly(self):
+        lines = self.profiler.annotated_disassembly().splitlines()
+        self.assertIn("sub_208:", lines)
+        self.assertIn("        20  22.22%  208: 7001  ADD V0, 01", lines)
+        self.assertIn("         0          206: 0000  SYS 000", lines)
+
+    def test_report_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            prefix = Path(directory) / "profile"
+            self.profiler.report(prefix)
+            self.assertTrue(Path(f"{prefix}.asm").exists())
+            self.assertEqual(Path(f"{prefix}.calls").read_text().count("->"), 3)
+
+    def test_detach(self):
+        self.profiler.detach()
+        self.assertEqual(self.ii.step_hooks, [])
+
+    def test_combined_with_opcode_profiler(self):
+        opcode_profiler = OpcodeProfiler(self.ii)
+        opcode_profiler.attach()
+        self.runner.run(9)
+        # Detached in the order they were attached, the other one keeps counting
+        self.profiler.detach()
+        self.runner.run(9)
+        self.assertEqual(self.profiler.hits[0x200], 11)
+        self.assertEqual(opcode_profiler.results()["2nnn"].count, 2 * 3)
+        opcode_profiler.detach()
+        self.assertEqual(self.ii.step_hooks, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import subprocess
+import sys
+import unittest
+
+from src.headless import HeadlessRunner
+from src.keypad import Keypad
+
+
+class TestKeypad(unittest.TestCase):
+    def test_press_and_release(self):
+        keypad = Keypad()
+        keypad.press(0xA)
+        keypad.press(0x1)
+        self.assertTrue(keypad.is_pressed(0xA))
+        self.assertTrue(keypad.is_pressed(0x1))
+        self.assertFalse(keypad.is_pressed(0x2))
+        keypad.release(0xA)
+        self.assertFalse(keypad.is_pressed(0xA))
+        self.assertEqual(keypad.state, 0x0002)
+
+    def test_lowest_pressed(self):
+        keypad = Keypad()
+        self.assertEqual(keypad.lowest_pressed(), -1)
+        keypad.press(0xF)
+        keypad.press(0x3)
+        self.assertEqual(keypad.lowest_pressed(), 0x3)
+
+    def test_invalid_key(self):
+        self.assertFalse(Keypad().is_pressed(0x10))
+
+
+class TestHeadlessRunner(unittest.TestCase):
+    def test_ibm_logo(self):
+        runner = HeadlessRunner()
+        runner.load_rom("roms/IBM Logo.ch8")
+        runner.run(1000)
+
+        self.assertEqual(runner.cycles, 1000)
+        self.assertEqual(runner.frames, 100)
+        # The ROM ends in a jump to itself
+        self.assertEqual(runner.ii.program_counter, 0x228)
+        lines = runner.screen.to_text().splitlines()
+        self.assertEqual(len(lines), 32)
+        self.assertEqual(lines[8], "............########.#########...#####.........#####............")
+        self.assertIn("1000 instructions", runner.report())
+
+    def test_runs_without_pygame(self):
+        check = ("import sys; from src.headless import HeadlessRunner; "
+                 "HeadlessRunner().run(10); "
+                 "sys.exit(any(name.startswith('pygame') for name in sys.modules))")
+        self.assertEqual(subprocess.run([sys.executable, "-c", check]).returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
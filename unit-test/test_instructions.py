@@ -3,7 +3,9 @@
 import unittest
 from unittest.mock import Mock, patch
 
-from src.instruction_interpreter import InstructionInterpreter
+from src.framebuffer import Framebuffer
+from src.instruction_interpreter import BIG_FONT_START, InstructionInterpreter, StepHook
+from src.keypad import Keypad
 
 
 class TestInstructions(unittest.TestCase):
@@ -20,10 +22,76 @@ class TestInstructions(unittest.TestCase):
         self.assertEqual(self.ii.next_instruction(), 0x00E0)
         self.assertEqual(self.ii.program_counter, 0x202)
 
+    def test_load_program_clears_earlier_program(self):
+        self.ii.load_program(bytes([0x12, 0x34, 0x56, 0x78]))
+        self.ii.load_program(bytes([0xAB]))
+        self.assertEqual(self.ii.memory[0x200:0x204], bytearray([0xAB, 0x00, 0x00, 0x00]))
+        self.assertEqual(self.ii.program_counter, 0x200)
+        self.assertTrue(self.ii.rom_loaded)
+
+    def test_load_program_too_large(self):
+        with self.assertRaises(ValueError):
+            self.ii.load_program(bytes(4096 - 0x200 + 1))
+
+    def test_step_executes_instruction_at_program_counter(self):
+        self.ii.memory[0x200] = 0x61
+        self.ii.memory[0x201] = 0x2A
+        self.ii.program_counter = 0x200
+
+        self.ii.step()
+        self.assertEqual(self.ii.reg_v[0x1], 0x2A)
+        self.assertEqual(self.ii.program_counter, 0x202)
+
+    def test_step_hooks_see_every_instruction(self):
+        class Trace(StepHook):
+            def __init__(self):
+                self.steps = []
+
+            def after_step(self, pc):
+                self.steps.append(pc)
+                return pc == 0x204
+
+        first, second = Trace(), Trace()
+        self.ii.load_program(bytes([0x70, 0x01] * 4))
+        self.ii.add_step_hook(first)
+        self.ii.add_step_hook(second)
+        self.ii.run(10)
+        self.assertEqual(first.steps, [0x200, 0x202, 0x204])
+        self.assertEqual(second.steps, first.steps)
+        self.assertEqual(self.ii.reg_v[0], 3)
+        self.ii.remove_step_hook(first)
+        self.assertEqual(self.ii.step_hooks, [second])
+
+    def test_opcodes_are_decoded_once(self):
+        self.ii.interpret_instruction(0x6A12)
+        handler = self.ii.decoded[0x6A12]
+        self.ii.interpret_instruction(0x6A13)
+        self.ii.interpret_instruction(0x6A12)
+        self.assertIs(self.ii.decoded[0x6A12], handler)
+        self.assertEqual(self.ii.reg_v[0xA], 0x12)
+
+    def test_unsupported_opcode_is_ignored(self):
+        self.ii.program_counter = 0x200
+        self.ii.interpret_instruction(0x8008)
+        self.ii.interpret_instruction(0xE0FF)
+        self.ii.interpret_instruction(0xF0FF)
+        self.assertEqual(self.ii.reg_v, [0] * 16)
+        self.assertEqual(self.ii.program_counter, 0x200)
+
     # Test is supposed to verify that 0x00E0 will clear the screen
     def test_00E0_clear_screen(self):
         self.ii.interpret_instruction(0x00E0)
-        self.screen.clear_all.assert_called_once()
+        self.screen.clear_selected.assert_called_once()
+
+    def test_00E0_clears_only_selected_planes(self):
+        screen = Framebuffer()
+        ii = InstructionInterpreter(screen, Keypad())
+        screen.select_planes(0b11)
+        screen.draw_sprite(0, 0, bytes([0xFF, 0xFF]))
+        screen.select_planes(0b10)
+        ii.interpret_instruction(0x00E0)
+        self.assertEqual(screen.planes[0][0], 0xFF << 56)
+        self.assertEqual(screen.planes[1], [0] * 32)
 
     # Test verifies that 0x00EE will set program_counter to address in stack the
     # pointer is pointing to, and that the pointer is decremented.
@@ -161,6 +229,13 @@ class TestInstructions(unittest.TestCase):
         self.assertEqual(self.ii.reg_v[0xE], 0xFF)
         self.assertEqual(self.ii.reg_v[0xF], 0x00)
 
+    def test_8xy5_sub_vx_vy_equal_values(self):
+        self.ii.reg_v[0x1] = 0x42
+        self.ii.reg_v[0x2] = 0x42
+        self.ii.interpret_instruction(0x8125)
+        self.assertEqual(self.ii.reg_v[0x1], 0x00)
+        self.assertEqual(self.ii.reg_v[0xF], 0x00)
+
     def test_8xy6_shr_vx_vy_shift_quirk_on(self):
         self.ii.shift_quirks = True
         self.ii.reg_v[0x1] = 0b01000000
@@ -230,17 +305,27 @@ class TestInstructions(unittest.TestCase):
         self.ii.interpret_instruction(0xB750)
         self.assertEqual(self.ii.program_counter, 0x7a0)
 
-    @patch("random.randint", return_value=82)
-    def test_cxkk_random(self, mocked_randint):
-        self.ii.interpret_instruction(0xC318)
-        self.assertEqual(self.ii.reg_v[0x3], 16)
+    def test_cxkk_random(self):
+        with patch.object(self.ii.rng, "randint", return_value=82) as mocked_randint:
+            self.ii.interpret_instruction(0xC318)
+            self.assertEqual(self.ii.reg_v[0x3], 16)
 
-        self.ii.interpret_instruction(0xC2EE)
-        self.assertEqual(self.ii.reg_v[0x2], 66)
+            self.ii.interpret_instruction(0xC2EE)
+            self.assertEqual(self.ii.reg_v[0x2], 66)
 
-        mocked_randint.return_value = 221
-        self.ii.interpret_instruction(0xC22F)
-        self.assertEqual(self.ii.reg_v[0x2], 13)
+            mocked_randint.return_value = 221
+            self.ii.interpret_instruction(0xC22F)
+            self.assertEqual(self.ii.reg_v[0x2], 13)
+
+    def test_cxkk_repeats_after_reset_with_seed(self):
+        ii = InstructionInterpreter(self.screen, self.keyboard, seed=1234)
+        ii.interpret_instruction(0xC0FF)
+        ii.interpret_instruction(0xC1FF)
+        first = ii.reg_v[:2]
+        ii.reset()
+        ii.interpret_instruction(0xC0FF)
+        ii.interpret_instruction(0xC1FF)
+        self.assertEqual(ii.reg_v[:2], first)
 
     def test_ex9e_skip_if_key_pressed(self):
         self.ii.program_counter = 0x200
@@ -270,6 +355,36 @@ class TestInstructions(unittest.TestCase):
         self.ii.interpret_instruction(0xE4A1)
         self.assertEqual(self.ii.program_counter, 0x200)
 
+    def test_fx0a_wait_for_key(self):
+        keypad = Keypad()
+        self.ii.keyboard = keypad
+        # LD V3, K; LD V4, 0x01
+        self.ii.memory[0x200:0x204] = bytes([0xF3, 0x0A, 0x64, 0x01])
+        self.ii.program_counter = 0x200
+
+        self.ii.run(10)
+        self.assertEqual(self.ii.key_wait, 0x3)
+        self.assertEqual(self.ii.program_counter, 0x202)
+        self.assertEqual(self.ii.reg_v[0x4], 0x00)
+
+        self.ii.run(10)
+        self.assertEqual(self.ii.reg_v[0x4], 0x00)
+
+        keypad.press(0xB)
+        keypad.press(0x7)
+        self.ii.run(1)
+        self.assertIsNone(self.ii.key_wait)
+        self.assertEqual(self.ii.reg_v[0x3], 0x7)
+        self.assertEqual(self.ii.reg_v[0x4], 0x01)
+
+    def test_fx0a_key_already_pressed(self):
+        keypad = Keypad()
+        keypad.press(0x2)
+        self.ii.keyboard = keypad
+        self.ii.interpret_instruction(0xF50A)
+        self.assertIsNone(self.ii.key_wait)
+        self.assertEqual(self.ii.reg_v[0x5], 0x2)
+
     def test_fx07_set_delay_timer_to_vx(self):
         self.ii.reg_delay = 0x20
         self.ii.interpret_instruction(0xF107)
@@ -334,6 +449,33 @@ class TestInstructions(unittest.TestCase):
         self.assertEqual(self.ii.memory[0x50D], 0x1D)
         self.assertEqual(self.ii.memory[0x50E], 0x1E)
 
+    def test_fx55_past_end_of_memory_raises(self):
+        self.ii.reg_i = 0xFFE
+        with self.assertRaises(IndexError):
+            self.ii.interpret_instruction(0xF355)
+
+    def test_fx55_wraps_around_with_wrap_memory(self):
+        ii = InstructionInterpreter(self.screen, self.keyboard, wrap_memory=True)
+        ii.reg_i = 0xFFE
+        ii.reg_v[:4] = [0x10, 0x11, 0x12, 0x13]
+        ii.interpret_instruction(0xF355)
+        self.assertEqual(ii.memory[0xFFE:], bytearray([0x10, 0x11]))
+        self.assertEqual(ii.memory[:2], bytearray([0x12, 0x13]))
+
+    def test_fetch_at_end_of_memory(self):
+        self.ii.memory[0xFFF] = 0x60
+        self.ii.program_counter = 0xFFF
+        with self.assertRaises(IndexError):
+            self.ii.step()
+
+        ii = InstructionInterpreter(self.screen, self.keyboard, wrap_memory=True)
+        ii.memory[0xFFF] = 0x60
+        ii.memory[0x000] = 0x2A
+        ii.program_counter = 0xFFF
+        ii.run(1)
+        self.assertEqual(ii.reg_v[0], 0x2A)
+        self.assertEqual(ii.program_counter, 0x1001)
+
     def test_fx65_save_memory_to_reg_v0_through_vx(self):
         self.ii.reg_i = 0x500
         for i in range(0x0, 0xF):
@@ -356,5 +498,82 @@ class TestInstructions(unittest.TestCase):
         self.assertEqual(self.ii.reg_v[0xE], 0x1E)
 
 
+class TestSuperChipInstructions(unittest.TestCase):
+    def setUp(self):
+        self.screen = Framebuffer()
+        self.ii = InstructionInterpreter(self.screen, Mock())
+        self.ii.program_counter = 0x202
+
+    def test_00ff_00fe_switch_resolution(self):
+        self.screen.set_pixel(0, 0)
+        self.ii.interpret_instruction(0x00FF)
+        self.assertEqual((self.screen.width, self.screen.height), (128, 64))
+        self.assertEqual(self.screen.rows, [0] * 64)
+        self.ii.interpret_instruction(0x00FE)
+        self.assertEqual((self.screen.width, self.screen.height), (64, 32))
+
+    def test_00cn_scroll_down(self):
+        self.screen.set_pixel(0, 0)
+        self.ii.interpret_instruction(0x00C3)
+        self.assertTrue(self.screen.get_pixel_state(0, 3))
+        self.assertFalse(self.screen.get_pixel_state(0, 0))
+
+    def test_00fd_exit_stays_on_itself(self):
+        self.ii.interpret_instruction(0x00FD)
+        self.assertEqual(self.ii.program_counter, 0x200)
+
+    def test_dxy0_draws_16x16_sprite(self):
+        self.ii.interpret_instruction(0x00FF)
+        self.ii.reg_i = 0x300
+        self.ii.memory[0x300:0x320] = bytes([0xFF]) * 32
+        self.ii.reg_v[0x1] = 112
+        self.ii.interpret_instruction(0xD120)
+        self.assertEqual(self.screen.rows[:17], [0xFFFF] * 16 + [0])
+        self.assertEqual(self.ii.reg_v[0xF], 0)
+        self.ii.interpret_instruction(0xD120)
+        self.assertEqual(self.ii.reg_v[0xF], 1)
+
+    def test_5xy2_5xy3_save_and_load_range(self):
+        self.ii.reg_i = 0x300
+        self.ii.reg_v[2:5] = [7, 8, 9]
+        self.ii.interpret_instruction(0x5242)
+        self.assertEqual(self.ii.memory[0x300:0x303], bytearray([7, 8, 9]))
+        self.assertEqual(self.ii.reg_i, 0x300)
+        self.ii.interpret_instruction(0x5A83)
+        self.assertEqual(self.ii.reg_v[8:11], [9, 8, 7])
+
+    def test_fx30_big_font(self):
+        self.ii.reg_v[0x3] = 0xA
+        self.ii.interpret_instruction(0xF330)
+        self.assertEqual(self.ii.reg_i, BIG_FONT_START + 100)
+
+    def test_fx75_fx85_flags(self):
+        self.ii.reg_v[:3] = [1, 2, 3]
+        self.ii.interpret_instruction(0xF175)
+        self.ii.reg_v[:3] = [0, 0, 0]
+        self.ii.interpret_instruction(0xF285)
+        self.assertEqual(self.ii.reg_v[:3], [1, 2, 0])
+
+    def test_f002_fx3a_audio(self):
+        self.ii.reg_i = 0x300
+        self.ii.memory[0x300:0x310] = bytes(range(16))
+        self.ii.reg_v[0x4] = 100
+        self.ii.interpret_instruction(0xF002)
+        self.ii.interpret_instruction(0xF43A)
+        self.assertEqual((self.ii.audio_pattern, self.ii.pitch), (bytes(range(16)), 100))
+        self.ii.reset()
+        self.assertIsNone(self.ii.audio_pattern)
+
+    def test_fn01_draws_to_second_plane(self):
+        self.ii.reg_i = 0x300
+        self.ii.memory[0x300] = 0x80
+        self.ii.interpret_instruction(0xF201)
+        self.ii.interpret_instruction(0xD001)
+        self.assertEqual(self.screen.planes[1][0], 1 << 63)
+        self.assertEqual(self.screen.rows[0], 0)
+        self.ii.interpret_instruction(0x00E0)
+        self.assertEqual(self.screen.planes[1][0], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,50 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+
+from src.memory import Memory
+
+
+class TestMemory(unittest.TestCase):
+    def setUp(self):
+        self.memory = Memory()
+        self.writes = []
+
+    def test_load_and_store(self):
+        self.memory.store(0x300, bytes([1, 2, 3]))
+        self.assertEqual(self.memory[0x300:0x303], bytearray([1, 2, 3]))
+        self.assertEqual(self.memory.load(0x301, 2), bytearray([2, 3]))
+
+    def test_out_of_range_raises(self):
+        with self.assertRaises(IndexError):
+            self.memory.store(0xFFE, bytes(3))
+        with self.assertRaises(IndexError):
+            self.memory.load(0xFFF, 2)
+        self.assertEqual(self.memory[0xFFE:], bytearray(2))
+
+    def test_wraparound(self):
+        self.memory.wrap = True
+        self.memory.store(0xFFE, bytes([1, 2, 3]))
+        self.assertEqual((self.memory[0xFFE], self.memory[0xFFF], self.memory[0]), (1, 2, 3))
+        self.assertEqual(self.memory.load(0xFFF, 2), bytearray([2, 3]))
+        self.assertEqual(self.memory.load(0x1000, 1), bytearray([3]))
+
+    def test_watch_fires_only_on_watched_writes(self):
+        self.memory.watch(0x200, 0x210, lambda start, end: self.writes.append((start, end)))
+        self.memory.store(0x300, bytes(4))
+        self.memory.store(0x1FE, bytes(4))
+        self.memory.store(0x210, bytes(1))
+        self.assertEqual(self.writes, [(0x1FE, 0x202)])
+
+    def test_unwatch(self):
+        watch = self.memory.watch(0x200, 0x210, lambda start, end: self.writes.append(start))
+        self.memory.watch(0x208, 0x220, lambda start, end: self.writes.append(-start))
+        self.memory.unwatch(watch)
+        self.memory.store(0x200, bytes(1))
+        self.memory.store(0x20A, bytes(1))
+        self.assertEqual(self.writes, [-0x20A])
+        self.assertFalse(any(self.memory.watched[0x200:0x208]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.headless import HeadlessRunner
+from src.profiler import OpcodeProfiler, opcode_family
+
+
+class TestOpcodeProfiler(unittest.TestCase):
+    def setUp(self):
+        self.runner = HeadlessRunner()
+        self.ii = self.runner.ii
+        # LD V0, 0; loop: ADD V0, 1; LD F, V0; ADD V1, V0; JP loop
+        program = bytes([0x60, 0x00, 0x70, 0x01, 0xF0, 0x29, 0x81, 0x04, 0x12, 0x02])
+        self.ii.memory[0x200:0x200 + len(program)] = program
+        self.ii.reset()
+        self.ii.rom_loaded = True
+        self.profiler = OpcodeProfiler(self.ii)
+
+    def test_opcode_family(self):
+        self.assertEqual(opcode_family(0x00E0), "00E0")
+        self.assertEqual(opcode_family(0x0123), "0nnn")
+        self.assertEqual(opcode_family(0x2ABC), "2nnn")
+        self.assertEqual(opcode_family(0x8AB4), "8xy4")
+        self.assertEqual(opcode_family(0xD125), "Dxyn")
+        self.assertEqual(opcode_family(0xF333), "Fx33")
+
+    def test_counts_per_opcode_family(self):
+        self.profiler.attach()
+        self.runner.run(1 + 4 * 100)
+        results = self.profiler.results()
+        self.assertEqual(results["6xkk"].count, 1)
+        for family in ("7xkk", "Fx29", "8xy4", "1nnn"):
+            self.assertEqual(results[family].count, 100)
+        self.assertEqual(results["8xy4"].handler, "add_vx_vy")
+
+    def test_same_result_as_unprofiled(self):
+        reference = HeadlessRunner()
+        reference.ii.memory[:] = self.ii.memory
+        reference.ii.reset()
+        reference.run(401)
+        self.profiler.attach()
+        self.runner.run(401)
+        self.assertEqual(self.ii.reg_v, reference.ii.reg_v)
+        self.assertEqual(self.ii.program_counter, reference.ii.program_counter)
+
+    def test_detach_restores_fast_path(self):
+        decoded = self.ii.decoded
+        self.profiler.attach()
+        self.assertIsNot(self.ii.decoded, decoded)
+        self.profiler.detach()
+        self.assertIs(self.ii.decoded, decoded)
+        self.assertEqual(self.ii.step_hooks, [])
+
+    def test_write_json(self):
+        self.profiler.attach()
+        self.runner.run(10)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "profile.json"
+            self.profiler.write_json(path)
+            opcodes = json.loads(path.read_text())["opcodes"]
+        self.assertEqual(sum(r["count"] for r in opcodes.values()), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
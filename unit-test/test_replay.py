@@ -0,0 +1,91 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import os
+import tempfile
+import unittest
+
+from src.headless import HeadlessRunner
+from src.replay import InputPlayer, InputRecorder, Recording, rom_digest
+from src.save_state import save_state
+
+ROM = "roms/Keypad Test [Hap, 2006].ch8"
+
+
+class TestReplay(unittest.TestCase):
+    def record_session(self) -> tuple[HeadlessRunner, Recording]:
+        runner = HeadlessRunner(cpu_rate=700.0, seed=42)
+        runner.load_rom(ROM)
+        recorder = InputRecorder(runner.scheduler, runner.keyboard, rom_digest(ROM))
+        recorder.attach()
+        for frame in range(120):
+            if frame == 20:
+                runner.keyboard.press(0x5)
+            elif frame == 35:
+                runner.keyboard.release(0x5)
+            elif frame == 60:
+                runner.keyboard.press(0xA)
+            runner.scheduler.advance(1 / 60)
+
+        path = os.path.join(self.directory.name, "session.rec")
+        recorder.save(path)
+        return runner, Recording.read(path)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_file_round_trip(self):
+        runner, recording = self.record_session()
+        self.assertEqual(recording.cpu_rate, 700.0)
+        self.assertEqual(recording.seed, 42)
+        self.assertEqual(recording.rom_sha1, rom_digest(ROM))
+        self.assertEqual([state for _, state in recording.events], [0, 1 << 5, 0, 1 << 0xA, 1 << 0xA])
+        self.assertEqual(recording.end_cycle, runner.cycles)
+
+    def test_replay_is_identical(self):
+        recorded, recording = self.record_session()
+        runner = HeadlessRunner()
+        player = InputPlayer(runner.scheduler, runner.keyboard, recording)
+        player.configure(rom_digest(ROM))
+        player.attach()
+        runner.load_rom(ROM)
+        # Time slices that do not line up with the recorded ones
+        while not player.finished:
+            runner.run(min(37, recording.end_cycle - runner.cycles))
+        self.assertEqual(runner.cycles, recorded.cycles)
+        self.assertEqual(save_state(runner.ii), save_state(recorded.ii))
+
+    def test_record_a_replay(self):
+        _, recording = self.record_session()
+        runner = HeadlessRunner()
+        player = InputPlayer(runner.scheduler, runner.keyboard, recording)
+        player.configure(rom_digest(ROM))
+        player.attach()
+        recorder = InputRecorder(runner.scheduler, runner.keyboard, rom_digest(ROM))
+        recorder.attach()
+        runner.load_rom(ROM)
+        while not player.finished:
+            runner.run(min(50, recording.end_cycle - runner.cycles))
+        self.assertEqual([state for _, state in recorder.recording.events],
+                         [state for _, state in recording.events[:-1]])
+        self.assertEqual([cycle for cycle, _ in recorder.recording.events],
+                         [cycle for cycle, _ in recording.events[:-1]])
+
+        player.detach()
+        recorder.detach()
+        self.assertEqual(runner.scheduler.slice_hooks, [])
+
+    def test_not_a_recording(self):
+        path = os.path.join(self.directory.name, "bad.rec")
+        with open(path, "wb") as f:
+            f.write(b"nope")
+        with self.assertRaises(ValueError):
+            Recording.read(path)
+
+    def test_seed_out_of_range(self):
+        with self.assertRaises(ValueError):
+            Recording(600.0, 2 ** 32, False, rom_digest(ROM))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+
+from src.headless import HeadlessRunner
+from src.rewind import RewindBuffer
+from src.save_state import save_state
+
+
+class TestRewindBuffer(unittest.TestCase):
+    def setUp(self):
+        self.runner = HeadlessRunner()
+        self.runner.load_rom("roms/octojam2title.ch8")
+
+    def run_frames(self, rewind, frames):
+        states = []
+        for _ in range(frames):
+            self.runner.run(10)
+            rewind.capture(self.runner.ii)
+            states.append(bytes(save_state(self.runner.ii)))
+        return states
+
+    def test_rewind_restores_previous_frames(self):
+        rewind = RewindBuffer()
+        states = self.run_frames(rewind, 50)
+        self.assertEqual(len(rewind), 49)
+        for expected in reversed(states[:-1]):
+            self.assertTrue(rewind.rewind(self.runner.ii))
+            self.assertEqual(bytes(save_state(self.runner.ii)), expected)
+        self.assertFalse(rewind.rewind(self.runner.ii))
+
+    def test_capture_after_rewind(self):
+        rewind = RewindBuffer()
+        states = self.run_frames(rewind, 10)
+        for _ in range(5):
+            rewind.rewind(self.runner.ii)
+        self.run_frames(rewind, 3)
+        for _ in range(3):
+            rewind.rewind(self.runner.ii)
+        self.assertEqual(bytes(save_state(self.runner.ii)), states[4])
+
+    def test_rewind_restores_timer_phase(self):
+        rewind = RewindBuffer()
+        scheduler = self.runner.scheduler
+        phases = []
+        for _ in range(10):
+            scheduler.advance(0.0123)
+            rewind.capture(self.runner.ii, scheduler)
+            phases.append(scheduler.phase())
+        for expected in reversed(phases[:-1]):
+            rewind.rewind(self.runner.ii, scheduler)
+            self.assertEqual(scheduler.phase(), expected)
+
+    def test_limits(self):
+        rewind = RewindBuffer(max_frames=20)
+        self.run_frames(rewind, 50)
+        self.assertEqual(len(rewind), 20)
+
+        rewind = RewindBuffer(max_bytes=200)
+        self.run_frames(rewind, 50)
+        self.assertLessEqual(rewind.delta_bytes, 200)
+
+    def test_deltas_are_small(self):
+        rewind = RewindBuffer()
+        self.run_frames(rewind, 100)
+        self.assertLess(rewind.delta_bytes / len(rewind), 200)
+        self.assertIn("99 frames", rewind.stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
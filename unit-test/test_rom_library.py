@@ -0,0 +1,84 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import hashlib
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from src.rom_library import RomLibrary
+
+
+class TestRomLibrary(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.roms = Path(directory.name) / "roms"
+        self.roms.mkdir()
+        (self.roms / "pong.ch8").write_bytes(bytes([0x12, 0x00]))
+        (self.roms / "pong.txt").write_text("Player 1: 1 and 4")
+        (self.roms / "tetris.c8").write_bytes(bytes([0x00, 0xE0, 0x12, 0x02]))
+        (self.roms / "readme.md").write_text("not a ROM")
+        self.index = Path(directory.name) / "library.json"
+
+    def open_library(self) -> RomLibrary:
+        library = RomLibrary([self.roms], self.index)
+        library.load()
+        library.scan()
+        library.save()
+        return library
+
+    def test_scan(self):
+        library = self.open_library()
+        roms = library.roms()
+        self.assertEqual([entry.title for entry in roms], ["pong", "tetris"])
+        pong = roms[0]
+        self.assertEqual(pong.sha1, hashlib.sha1(bytes([0x12, 0x00])).hexdigest())
+        self.assertEqual(pong.size, 2)
+        self.assertEqual(pong.notes, "Player 1: 1 and 4")
+        self.assertEqual(library.program(pong), bytes([0x12, 0x00]))
+        self.assertTrue(self.index.is_file())
+
+    def test_unchanged_files_are_not_hashed_again(self):
+        self.open_library()
+        with patch("src.rom_library.hashlib.sha1") as sha1:
+            library = self.open_library()
+        sha1.assert_not_called()
+        self.assertEqual(len(library.roms()), 2)
+        self.assertFalse(library.changed)
+
+    def test_settings_follow_the_content(self):
+        library = self.open_library()
+        pong = library.roms()[0]
+        library.set_settings(pong, cpu_rate=1200.0, shift_quirks=True)
+
+        os.rename(self.roms / "pong.ch8", self.roms / "paddles.ch8")
+        library = self.open_library()
+        paddles = library.roms()[0]
+        self.assertEqual(paddles.title, "paddles")
+        self.assertEqual(paddles.cpu_rate, 1200.0)
+        self.assertTrue(paddles.shift_quirks)
+
+    def test_settings_are_kept_for_missing_roms(self):
+        library = self.open_library()
+        library.set_settings(library.roms()[1], cpu_rate=900.0)
+        os.remove(self.roms / "tetris.c8")
+        library = self.open_library()
+        self.assertEqual([entry.title for entry in library.roms()], ["pong"])
+
+        outside = self.index.parent / "tetris.ch8"
+        outside.write_bytes(bytes([0x00, 0xE0, 0x12, 0x02]))
+        entry = library.add(outside)
+        self.assertEqual(entry.path, outside)
+        self.assertEqual(entry.cpu_rate, 900.0)
+
+    def test_broken_index_is_rebuilt(self):
+        self.index.write_text("{")
+        with self.assertLogs("global", "WARNING"):
+            library = self.open_library()
+        self.assertEqual(len(library.roms()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
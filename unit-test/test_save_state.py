@@ -0,0 +1,123 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import os
+import tempfile
+import unittest
+
+from src.framebuffer import Framebuffer
+from src.headless import HeadlessRunner
+from src.instruction_interpreter import InstructionInterpreter
+from src.keypad import Keypad
+from src.save_state import STATE_SIZE, load_state, read_state_file, save_state, write_state_file
+
+
+class TestSaveState(unittest.TestCase):
+    def setUp(self):
+        self.runner = HeadlessRunner()
+        self.runner.load_rom("roms/octojam1title.ch8")
+        self.runner.run(3000)
+
+    def snapshot(self, runner):
+        ii = runner.ii
+        return (list(ii.reg_v), ii.reg_i, ii.reg_delay, ii.reg_sound, ii.program_counter,
+                list(ii.stack), ii.stack_pointer, ii.shift_quirks, ii.key_wait, bytes(ii.memory),
+                list(runner.screen.rows))
+
+    def test_round_trip(self):
+        self.runner.ii.shift_quirks = True
+        self.runner.ii.stack_pointer = -1
+        self.runner.ii.key_wait = 0xA
+        state = save_state(self.runner.ii)
+        self.assertEqual(len(state), STATE_SIZE)
+
+        other = HeadlessRunner()
+        load_state(other.ii, state)
+        self.assertEqual(self.snapshot(other), self.snapshot(self.runner))
+        self.assertTrue(other.ii.rom_loaded)
+
+    def test_round_trip_in_high_resolution(self):
+        ii = self.runner.ii
+        ii.screen.set_resolution(True)
+        ii.screen.select_planes(3)
+        ii.screen.draw_sprite(120, 60, bytes([0xFF] * 4))
+        ii.flags[:3] = [1, 2, 3]
+        ii.audio_pattern = bytes(range(16))
+        ii.pitch = 100
+        state = save_state(ii)
+
+        other = HeadlessRunner()
+        load_state(other.ii, state)
+        self.assertEqual(other.screen.planes, ii.screen.planes)
+        self.assertEqual((other.screen.width, other.screen.height, other.screen.selected), (128, 64, [0, 1]))
+        self.assertEqual((other.ii.flags, other.ii.audio_pattern, other.ii.pitch), (ii.flags, ii.audio_pattern, 100))
+
+    def test_loaded_display_is_redrawn(self):
+        class RedrawnFramebuffer(Framebuffer):
+            def redraw_all(self):
+                self.redrawn = [list(plane) for plane in self.planes]
+
+        state = save_state(self.runner.ii)
+        screen = RedrawnFramebuffer()
+        load_state(InstructionInterpreter(screen, Keypad()), state)
+        self.assertEqual(screen.redrawn, self.runner.screen.planes)
+
+    def test_load_notifies_memory_watches(self):
+        writes = []
+        other = HeadlessRunner()
+        other.ii.memory.watch(0x300, 0x310, lambda start, end: writes.append((start, end)))
+        load_state(other.ii, save_state(self.runner.ii))
+        self.assertEqual(writes, [(0, 4096)])
+
+    def test_resumed_session_runs_the_same(self):
+        # Stop between two timer ticks, with part of an instruction in the budget
+        self.runner.scheduler.advance(0.0123)
+        state = save_state(self.runner.ii, scheduler=self.runner.scheduler)
+        other = HeadlessRunner()
+        other.run(17)
+        load_state(other.ii, memoryview(state), other.scheduler)
+        # octojam1title uses Cxkk, the random numbers continue from the state
+        for runner in (self.runner, other):
+            runner.scheduler.advance(0.0456)
+            runner.run(3000)
+        self.assertEqual(self.snapshot(other), self.snapshot(self.runner))
+        self.assertEqual(other.scheduler.phase(), self.runner.scheduler.phase())
+
+    def test_phase_is_converted_to_the_current_cpu_rate(self):
+        self.runner.run(5)
+        state = save_state(self.runner.ii, scheduler=self.runner.scheduler)
+        other = HeadlessRunner(cpu_rate=1200.0)
+        load_state(other.ii, state, other.scheduler)
+        # 5 of the 10 instructions to the next tick at 600 Hz are left, 10 at 1200 Hz
+        self.assertEqual(other.scheduler.cpu_rate, 1200.0)
+        self.assertEqual(other.scheduler.next_tick - other.scheduler.cycles, 10)
+
+    def test_phase_is_not_loaded_without_a_scheduler(self):
+        self.runner.run(5)
+        state = save_state(self.runner.ii)
+        other = HeadlessRunner()
+        load_state(other.ii, state, other.scheduler)
+        self.assertEqual(other.scheduler.phase(), (600.0, 0.0, 0, 0, 0))
+
+    def test_save_into_existing_buffer(self):
+        buffer = bytearray(STATE_SIZE)
+        self.assertIs(save_state(self.runner.ii, buffer), buffer)
+
+    def test_file_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sub", "session.state")
+            write_state_file(self.runner.ii, path)
+            other = HeadlessRunner()
+            read_state_file(other.ii, path)
+        self.assertEqual(self.snapshot(other), self.snapshot(self.runner))
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            load_state(self.runner.ii, bytes(STATE_SIZE))
+        state = save_state(self.runner.ii)
+        state[4] = 99
+        with self.assertRaises(ValueError):
+            load_state(self.runner.ii, state)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+
+from src.framebuffer import Framebuffer
+from src.instruction_interpreter import InstructionInterpreter
+from src.keypad import Keypad
+from src.scheduler import Scheduler, SliceHook
+
+
+def idle_interpreter() -> InstructionInterpreter:
+    ii = InstructionInterpreter(Framebuffer(), Keypad())
+    # JP 0x200, spin forever
+    ii.memory[0x200:0x202] = b"\x12\x00"
+    ii.program_counter = 0x200
+    ii.rom_loaded = True
+    return ii
+
+
+class TestScheduler(unittest.TestCase):
+    def test_fractional_rate(self):
+        scheduler = Scheduler(idle_interpreter(), cpu_rate=650.5)
+        ran = sum(scheduler.advance(1 / 60) for _ in range(120))
+        self.assertEqual(ran, 1301)
+        self.assertEqual(scheduler.cycles, 1301)
+
+    def test_timers_tick_at_60hz_of_emulated_time(self):
+        ii = idle_interpreter()
+        ii.reg_delay = 255
+        scheduler = Scheduler(ii, cpu_rate=1000.0)
+        # Uneven slices do not change when the timers tick
+        for cycles in (1, 7, 500, 3, 489):
+            scheduler.run_cycles(cycles)
+        self.assertEqual(scheduler.cycles, 1000)
+        self.assertEqual(scheduler.timer_ticks, 60)
+        self.assertEqual(ii.reg_delay, 255 - 60)
+
+    def test_run_frames(self):
+        scheduler = Scheduler(idle_interpreter(), cpu_rate=700.0)
+        scheduler.run_frames(6)
+        self.assertEqual(scheduler.cycles, 70)
+        self.assertEqual(scheduler.timer_ticks, 6)
+
+    def test_catch_up_is_limited(self):
+        scheduler = Scheduler(idle_interpreter(), cpu_rate=600.0, max_catch_up=0.1)
+        self.assertEqual(scheduler.advance(2.0), 60)
+
+    def test_rate_change_keeps_timer_period(self):
+        ii = idle_interpreter()
+        scheduler = Scheduler(ii, cpu_rate=600.0)
+        scheduler.run_cycles(5)  # Half way through the first timer period
+        scheduler.set_cpu_rate(1200.0)
+        scheduler.run_cycles(10)
+        self.assertEqual(scheduler.timer_ticks, 1)
+        scheduler.run_cycles(1)
+        self.assertEqual(scheduler.timer_ticks, 2)
+
+    def test_invalid_rate_is_ignored(self):
+        scheduler = Scheduler(idle_interpreter(), cpu_rate=600.0)
+        scheduler.set_cpu_rate(0)
+        self.assertEqual(scheduler.cpu_rate, 600.0)
+
+    def test_reset(self):
+        scheduler = Scheduler(idle_interpreter())
+        scheduler.run_cycles(100)
+        scheduler.reset()
+        self.assertEqual((scheduler.cycles, scheduler.timer_ticks), (0, 0))
+
+    def test_slice_hooks(self):
+        class StopAt(SliceHook):
+            def __init__(self, stop):
+                self.stop = stop
+                self.slices = []
+
+            def before_slice(self, cycle, end):
+                self.slices.append((cycle, end))
+                return min(end, self.stop) if cycle < self.stop else end
+
+        scheduler = Scheduler(idle_interpreter(), cpu_rate=600.0)
+        first, second = StopAt(13), StopAt(5)
+        scheduler.add_slice_hook(first)
+        scheduler.add_slice_hook(second)
+        scheduler.run_cycles(25)
+        # Slices end at timer ticks and wherever a hook asks
+        self.assertEqual(first.slices, [(0, 10), (5, 10), (10, 20), (13, 20), (20, 25)])
+        self.assertEqual(second.slices, [(0, 10), (5, 10), (10, 13), (13, 20), (20, 25)])
+        self.assertEqual((scheduler.cycles, scheduler.timer_ticks), (25, 3))
+
+        scheduler.remove_slice_hook(first)
+        scheduler.remove_slice_hook(second)
+        self.assertEqual(scheduler.slice_hooks, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import os
+import unittest
+from unittest.mock import patch
+
+import pygame
+
+from src.sound import (BUZZER_PATTERN, MIN_WAVEFORM_SECONDS, Sound, pattern_rate, pattern_runs,
+                       render_pattern, sample_bytes)
+
+
+class TestWaveforms(unittest.TestCase):
+    def test_pattern_rate(self):
+        self.assertEqual(pattern_rate(64), 4000)
+        self.assertEqual(pattern_rate(112), 8000)
+
+    def test_pattern_runs(self):
+        self.assertEqual(pattern_runs(bytes([0xF0]) + bytes(15)), [(1, 0, 4), (0, 4, 128)])
+        self.assertEqual(len(pattern_runs(BUZZER_PATTERN)), 16)
+
+    def test_sample_bytes(self):
+        self.assertEqual(sample_bytes(1.0, -16, 1), (32767).to_bytes(2, "little"))
+        self.assertEqual(sample_bytes(-1.0, -16, 2), (-32767).to_bytes(2, "little", signed=True) * 2)
+        self.assertEqual(sample_bytes(0.0, 8, 1), bytes([128]))
+
+    def test_render_buzzer(self):
+        # 4000 bits per second at 8000 samples per second, two samples per bit
+        waveform = render_pattern(BUZZER_PATTERN, 64, 8000, b"L", b"H")
+        self.assertEqual(waveform[:32], b"H" * 16 + b"L" * 16)
+        self.assertEqual(len(waveform) % 256, 0)
+        self.assertGreaterEqual(len(waveform), MIN_WAVEFORM_SECONDS * 8000)
+
+    def test_render_fractional_rate_loops_whole_periods(self):
+        pattern = bytes([0x80]) + bytes(15)
+        waveform = render_pattern(pattern, 70, 44100, b"L", b"H")
+        period = 128 * 44100 / pattern_rate(70)
+        periods = waveform.count(b"LH") + 1
+        self.assertAlmostEqual(len(waveform), periods * period, delta=1)
+
+
+class TestSound(unittest.TestCase):
+    def setUp(self):
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        self.addCleanup(pygame.mixer.quit)
+
+    def test_muted_never_initialises_the_mixer(self):
+        sound = Sound(volume=0.0)
+        with patch("src.sound.pygame.mixer.init") as init:
+            sound.update(True)
+            sound.update(False)
+            self.assertFalse(sound.prepare())
+        init.assert_not_called()
+
+    def test_only_transitions_reach_the_mixer(self):
+        sound = Sound()
+        sound.update(True)
+        self.assertIsNotNone(sound.current)
+        current = sound.current
+        sound.update(True)
+        self.assertIs(sound.current, current)
+        sound.update(False)
+        self.assertIsNone(sound.current)
+
+    def test_waveforms_are_cached(self):
+        sound = Sound()
+        sound.update(True, bytes(range(16)), 80)
+        pattern = sound.current
+        sound.update(True)
+        self.assertIsNot(sound.current, pattern)
+        sound.update(True, bytes(range(16)), 80)
+        self.assertIs(sound.current, pattern)
+        self.assertEqual(len(sound.waveforms), 2)
+
+    def test_unmuting_starts_a_playing_tone(self):
+        sound = Sound(volume=0.0)
+        sound.update(True)
+        self.assertIsNone(sound.current)
+        sound.set_volume(0.5)
+        self.assertIsNotNone(sound.current)
+
+
+if __name__ == '__main__':
+    unittest.main()
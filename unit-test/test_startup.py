@@ -0,0 +1,23 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import unittest
+from unittest.mock import patch
+
+from src.startup import StartupTimer
+
+
+class TestStartupTimer(unittest.TestCase):
+    def test_phases(self):
+        with patch("src.startup.time.perf_counter", side_effect=[1.0, 1.25, 1.75]):
+            timer = StartupTimer()
+            timer.mark("import")
+            timer.mark("first frame")
+        self.assertEqual(timer.phases, [("import", 0.25), ("first frame", 0.5)])
+        self.assertEqual(timer.total, 0.75)
+        with self.assertLogs("global", "DEBUG") as logs:
+            timer.report()
+        self.assertEqual(len(logs.output), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
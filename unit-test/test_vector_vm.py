@@ -0,0 +1,162 @@
+# Copyright (C) 2021 authors of kanzchip-8, licenced under MIT licence
+
+import contextlib
+import random
+import unittest
+
+from src.headless import HeadlessRunner
+from src.scheduler import Scheduler
+
+try:
+    import numpy as np
+
+    from src.vector_vm import VectorVM
+except ImportError:
+    np = None
+
+
+def scalar_state(ii):
+    return (ii.reg_v, ii.reg_i, ii.reg_delay, ii.reg_sound, ii.program_counter,
+            ii.stack, ii.stack_pointer, bytes(ii.memory), ii.screen.rows, ii.flags)
+
+
+def random_program(rng, length):
+    """Straight-line code of every instruction that can not jump out of it."""
+    # Fx29 is left out, it can point I into the program for Fx55 to overwrite
+    templates = [0x00E0, 0x3000, 0x4000, 0x5000, 0x6000, 0x7000, 0x8000, 0x9000,
+                 0xA000, 0xD000, 0xE09E, 0xE0A1, 0xF007, 0xF015, 0xF018, 0xF030,
+                 0xF033, 0xF055, 0xF065, 0xF075, 0xF085]
+    program = bytearray()
+    for _ in range(length):
+        template = rng.choice(templates)
+        operands = rng.randrange(0x1000)
+        if template == 0x8000:
+            instruction = 0x8000 | (operands & 0x0FF0) | rng.choice((0, 1, 2, 3, 4, 5, 6, 7, 0xE))
+        elif template in (0x5000, 0x9000):
+            instruction = template | (operands & 0x0FF0)
+        elif template == 0xA000:
+            # Past the program, so stores can not write jumps into it
+            instruction = 0xA000 | rng.randrange(0x200 + 2 * length, 0xF00)
+        elif template & 0xF000 in (0xE000, 0xF000):
+            instruction = template | (operands & 0x0F00)
+        elif template == 0xD000:
+            # Dxy0 is a 16x16 SUPER-CHIP sprite, which halts VectorVM
+            instruction = template | operands | (0 if operands & 0x000F else 1)
+        elif template == 0x00E0:
+            instruction = template
+        else:
+            instruction = template | operands
+        program += instruction.to_bytes(2, "big")
+    return bytes(program)
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestVectorVM(unittest.TestCase):
+    def assert_matches_scalar(self, vm, index, runner):
+        other = HeadlessRunner()
+        vm.export(index, other.ii)
+        self.assertEqual(scalar_state(other.ii), scalar_state(runner.ii), f"instance {index}")
+
+    def test_matches_interpreter_on_roms(self):
+        for rom in ("roms/test_opcode.ch8", "roms/BC_test.ch8", "roms/IBM Logo.ch8"):
+            vm = VectorVM(3)
+            vm.load_rom(rom)
+            Scheduler(vm).run_cycles(3000)
+            runner = HeadlessRunner()
+            runner.load_rom(rom)
+            runner.run(3000)
+            for index in range(3):
+                self.assert_matches_scalar(vm, index, runner)
+
+    def test_random_programs_match_interpreter(self):
+        rng = random.Random(8)
+        for shift_quirks in (False, True):
+            vm = VectorVM(32, shift_quirks=shift_quirks)
+            runners = []
+            for index in range(vm.instances):
+                program = random_program(rng, 200)
+                vm.load_program(program, np.array([index]))
+                runner = HeadlessRunner()
+                runner.ii.memory[0x200:0x200 + len(program)] = program
+                runner.ii.reset()
+                runner.ii.shift_quirks = shift_quirks
+                runner.keyboard.state = vm.keys[index] = rng.randrange(0x10000)
+                runners.append(runner)
+            vm.run(150)
+            self.assertFalse(vm.halted.any())
+            for index, runner in enumerate(runners):
+                runner.ii.run(150)
+                self.assert_matches_scalar(vm, index, runner)
+
+    def test_memory_past_the_end_matches_interpreter(self):
+        programs = [
+            bytes([0xAF, 0xFE, 0xF2, 0x55, 0x6A, 0x01]),  # LD I, FFE; LD [I], V2; LD VA, 01
+            bytes([0xAF, 0xFE, 0xF2, 0x65, 0x6A, 0x01]),  # LD I, FFE; LD V2, [I]; LD VA, 01
+            bytes([0xAF, 0xFF, 0xF0, 0x33, 0x6A, 0x01]),  # LD I, FFF; LD B, V0; LD VA, 01
+            bytes([0xAF, 0xFC, 0xD0, 0x15, 0x6A, 0x01]),  # LD I, FFC; DRW V0, V1, 5; LD VA, 01
+            bytes([0x60, 0x99, 0x1F, 0xFF]),  # LD V0, 99; JP FFF
+        ]
+        for wrap in (False, True):
+            vm = VectorVM(len(programs), wrap=wrap)
+            runners = []
+            for index, program in enumerate(programs):
+                vm.load_program(program, np.array([index]))
+                runner = HeadlessRunner(wrap_memory=wrap)
+                runner.ii.load_program(program)
+                runner.ii.memory[0xFFF] = 0x61
+                runners.append(runner)
+            vm.memory[:, 0xFFF] = 0x61
+            with self.assertLogs("global", "WARNING") if not wrap else contextlib.nullcontext():
+                vm.run(4)
+            self.assertEqual(vm.halted.tolist(), [not wrap] * len(programs))
+            for index, runner in enumerate(runners):
+                try:
+                    for _ in range(4):
+                        runner.ii.step()
+                except IndexError:
+                    pass
+                self.assert_matches_scalar(vm, index, runner)
+
+    def test_unsupported_instructions_halt(self):
+        vm = VectorVM(4)
+        for index, instruction in enumerate((0x00FF, 0xD010, 0xF101, 0x7001)):
+            vm.load_program(instruction.to_bytes(2, "big") + bytes([0x12, 0x00]), np.array([index]))
+        with self.assertLogs("global", "WARNING"):
+            vm.run(10)
+        self.assertEqual(vm.halted.tolist(), [True, True, True, False])
+        self.assertEqual(vm.program_counter.tolist(), [0x202, 0x202, 0x202, 0x200])
+        self.assertEqual(vm.reg_v[3, 0], 5)
+
+    def test_load_program_clears_earlier_program(self):
+        vm = VectorVM(2)
+        vm.load_program(bytes([0x12, 0x34] * 8))
+        vm.load_program(bytes([0x60, 0x01]), np.array([1]))
+        self.assertEqual(vm.memory[0, 0x202:0x204].tolist(), [0x12, 0x34])
+        self.assertEqual(vm.memory[1, 0x200:0x204].tolist(), [0x60, 0x01, 0, 0])
+        self.assertFalse(vm.memory[1, 0x202:].any())
+
+    def test_key_wait(self):
+        vm = VectorVM(2)
+        # LD V3, K; JP 0x202
+        vm.load_program(bytes([0xF3, 0x0A, 0x12, 0x02]))
+        vm.keys[1] = 0b0101_0000
+        vm.run(5)
+        self.assertEqual(list(vm.key_wait), [3, -1])
+        self.assertEqual(list(vm.program_counter), [0x202, 0x202])
+        self.assertEqual(vm.reg_v[1, 3], 4)
+        vm.keys[0] = 1 << 0xB
+        vm.run(1)
+        self.assertEqual(vm.reg_v[0, 3], 0xB)
+        self.assertEqual(vm.key_wait[0], -1)
+
+    def test_random_is_masked(self):
+        vm = VectorVM(100, seed=1)
+        # RND V0, 0F
+        vm.load_program(bytes([0xC0, 0x0F]))
+        vm.step()
+        self.assertTrue((vm.reg_v[:, 0] <= 0x0F).all())
+        self.assertGreater(len(set(vm.reg_v[:, 0].tolist())), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()